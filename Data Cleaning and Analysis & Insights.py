@@ -1,230 +1,229 @@
-import pandas as pd
-
-# Load the dataset
-saas_data = pd.read_csv('saas_dataset.csv')
-
-# Check for missing values
-missing_values = saas_data.isnull().sum()
-
-# Display missing values
-print("Missing Values in Each Column:\n", missing_values)
-
-# Calculate total subscribers and churn rates
-saas_data['Total_Subscribers'] = (
-    saas_data['New_Subscribers_Basic'] +
-    saas_data['New_Subscribers_Premium'] +
-    saas_data['New_Subscribers_Enterprise'] -
-    (saas_data['Cancellations_Basic'] +
-     saas_data['Cancellations_Premium'] +
-     saas_data['Cancellations_Enterprise'])
-)
-
-# Calculate total MRR (Monthly Recurring Revenue)
-saas_data['Total_MRR'] = (
-    saas_data['MRR_Basic'] +
-    saas_data['MRR_Premium'] +
-    saas_data['MRR_Enterprise']
-)
-
-# Calculate Customer Lifetime Value (CLV)
-# Assuming an average gross margin of 70%
-saas_data['CLV'] = saas_data['Total_MRR'] / saas_data['Churn_Rate_Basic'].replace(0, 0.001)
-
-# Analyze churn rates
-avg_churn_basic = saas_data['Churn_Rate_Basic'].mean()
-avg_churn_premium = saas_data['Churn_Rate_Premium'].mean()
-avg_churn_enterprise = saas_data['Churn_Rate_Enterprise'].mean()
-
-# Display churn rate analysis
-print(f"Average Churn Rate for Basic: {avg_churn_basic:.2%}")
-print(f"Average Churn Rate for Premium: {avg_churn_premium:.2%}")
-print(f"Average Churn Rate for Enterprise: {avg_churn_enterprise:.2%}")
-
-# Analyze new subscribers and cancellations
-saas_data['Net_New_Subscribers'] = (
-    saas_data['New_Subscribers_Basic'] +
-    saas_data['New_Subscribers_Premium'] +
-    saas_data['New_Subscribers_Enterprise'] -
-    (saas_data['Cancellations_Basic'] +
-     saas_data['Cancellations_Premium'] +
-     saas_data['Cancellations_Enterprise'])
-)
-
-import matplotlib
-import matplotlib.pyplot as plt
-
-# Use the Agg backend for non-GUI plotting
-matplotlib.use('Agg')
+import argparse
 
-# Create the plot for Total Monthly Recurring Revenue (MRR)
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data['Month'], saas_data['Total_MRR'], label='Total MRR', marker='o')
-plt.title('Total Monthly Recurring Revenue Over Time')
-plt.xlabel('Month')
-plt.ylabel('Total MRR ($)')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
-
-# Save the plot to a file
-plt.savefig('total_mrr_plot.png')
-print("Plot saved as 'total_mrr_plot.png'.")
-# Displaying first few rows of the cleaned dataset
+from cohort_analysis import retention_curve, tables_from_aggregates, tier_clv
+from incremental_insights import segment_churn_chart
+from metrics import METRICS, TIERS, compute
+from metrics_store import load_metrics_store
+import profiling
+from rendering import ChartSpec, render_charts
+from segment_analytics import DIMENSIONS, aggregate_frame, segment_report
 
-# Plot Churn Rates over Time
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data['Month'], saas_data['Churn_Rate_Basic'], label='Basic', marker='o')
-plt.plot(saas_data['Month'], saas_data['Churn_Rate_Premium'], label='Premium', marker='o')
-plt.plot(saas_data['Month'], saas_data['Churn_Rate_Enterprise'], label='Enterprise', marker='o')
-plt.title('Churn Rate by Subscription Tier Over Time')
-plt.xlabel('Month')
-plt.ylabel('Churn Rate (%)')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
-# Save the plot
-plt.savefig('churn_rate_analysis.png')
-print("Churn Rate plot saved as 'churn_rate_analysis.png'.")
+# Insights printed by a full run, in order
+INSIGHTS = ['Missing_Values', 'Average_Churn_Rates', 'Churn_Rates_By_Segment', 'Upsell_Success_Rate', 'Cohorts',
+            'Segments']
 
-# Plot Net New Subscribers
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data['Month'], saas_data['Net_New_Subscribers'], label='Net New Subscribers', marker='o')
-plt.title('Net New Subscribers Over Time')
-plt.xlabel('Month')
-plt.ylabel('Net New Subscribers')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
-
-# Save the plot
-plt.savefig('net_new_subscribers_plot.png')
-print("Net New Subscribers plot saved as 'net_new_subscribers_plot.png'.")
+# Registry of charts: name -> (metrics or insights it needs, function building its ChartSpec, whether it
+# plots the company's monthly totals rather than every row)
+CHARTS = {}
+
+
+def chart(name, needs, monthly=True):
+    def register(func):
+        CHARTS[name] = (list(needs), func, monthly)
+        return func
+    return register
+
+
+# Create the plot for Total Monthly Recurring Revenue (MRR)
+@chart('total_mrr_plot', ['Total_MRR'])
+def total_mrr_chart(saas_data, insights):
+    return (ChartSpec('total_mrr_plot.png', 'Total Monthly Recurring Revenue Over Time',
+                      'Month', 'Total MRR ($)', rotate_xticks=True)
+            .plot(saas_data['Month'], saas_data['Total_MRR'], label='Total MRR', marker='o'))
 
-# Plot Revenue vs Operating Costs
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data['Month'], saas_data['Total_MRR'], label='Total Revenue', marker='o')
-plt.plot(saas_data['Month'], saas_data['Fixed_Costs'] + saas_data['Variable_Costs'], label='Total Costs', marker='o')
-plt.title('Revenue vs Operating Costs Over Time')
-plt.xlabel('Month')
-plt.ylabel('Amount ($)')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
 
-# Save the plot
-plt.savefig('revenue_vs_costs.png')
-print("Revenue vs Costs plot saved as 'revenue_vs_costs.png'.")
+# Plot Churn Rates over Time
+@chart('churn_rate_analysis', [])
+def churn_rate_chart(saas_data, insights):
+    churn_chart = ChartSpec('churn_rate_analysis.png', 'Churn Rate by Subscription Tier Over Time',
+                            'Month', 'Churn Rate (%)', name='Churn Rate plot', rotate_xticks=True)
+    for tier in TIERS:
+        churn_chart.plot(saas_data['Month'], saas_data[f'Churn_Rate_{tier}'], label=tier, marker='o')
+    return churn_chart
 
 
+# Plot Net New Subscribers
+@chart('net_new_subscribers_plot', ['Net_New_Subscribers'])
+def net_new_subscribers_chart(saas_data, insights):
+    return (ChartSpec('net_new_subscribers_plot.png', 'Net New Subscribers Over Time',
+                      'Month', 'Net New Subscribers', name='Net New Subscribers plot', rotate_xticks=True)
+            .plot(saas_data['Month'], saas_data['Net_New_Subscribers'], label='Net New Subscribers', marker='o'))
 
 
+# Plot Revenue vs Operating Costs
+@chart('revenue_vs_costs', ['Total_MRR', 'Total_Costs'])
+def revenue_vs_costs_chart(saas_data, insights):
+    month = saas_data['Month']
+    return (ChartSpec('revenue_vs_costs.png', 'Revenue vs Operating Costs Over Time',
+                      'Month', 'Amount ($)', name='Revenue vs Costs plot', rotate_xticks=True)
+            .plot(month, saas_data['Total_MRR'], label='Total Revenue', marker='o')
+            .plot(month, saas_data['Total_Costs'], label='Total Costs', marker='o'))
 
 
 # Plot Marketing Spend vs New Customers Acquired
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data['Month'], saas_data['Marketing_Spend'], label='Marketing Spend', marker='o')
-plt.plot(saas_data['Month'], saas_data['New_Customers'], label='New Customers', marker='o')
-plt.title('Marketing Spend vs New Customers Acquired Over Time')
-plt.xlabel('Month')
-plt.ylabel('Amount ($) / Customers')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
-
-# Save the plot
-plt.savefig('marketing_vs_customers.png')
-print("Marketing Spend vs Customers plot saved as 'marketing_vs_customers.png'.")
+@chart('marketing_vs_customers', [])
+def marketing_vs_customers_chart(saas_data, insights):
+    month = saas_data['Month']
+    return (ChartSpec('marketing_vs_customers.png', 'Marketing Spend vs New Customers Acquired Over Time',
+                      'Month', 'Amount ($) / Customers', name='Marketing Spend vs Customers plot',
+                      rotate_xticks=True)
+            .plot(month, saas_data['Marketing_Spend'], label='Marketing Spend', marker='o')
+            .plot(month, saas_data['New_Customers'], label='New Customers', marker='o'))
+
 
 # Plot Customer Lifetime Value (CLV)
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data['Month'], saas_data['CLV'], label='Customer Lifetime Value', marker='o')
-plt.title('Customer Lifetime Value (CLV) Over Time')
-plt.xlabel('Month')
-plt.ylabel('CLV ($)')
-plt.xticks(rotation=45)
-plt.legend()
-plt.tight_layout()
-
-# Save the plot
-plt.savefig('clv_plot.png')
-print("Customer Lifetime Value (CLV) plot saved as 'clv_plot.png'.")
-
-# Calculate churn rates by customer segment
-churn_rates = {
-    'Basic': saas_data['Cancellations_Basic'].sum() / saas_data['New_Subscribers_Basic'].sum(),
-    'Premium': saas_data['Cancellations_Premium'].sum() / saas_data['New_Subscribers_Premium'].sum(),
-    'Enterprise': saas_data['Cancellations_Enterprise'].sum() / saas_data['New_Subscribers_Enterprise'].sum()
-}
-
-print("Churn Rates by Segment:", churn_rates)
-# Analyze variable costs in relation to new customers
-variable_costs_per_customer = saas_data['Variable_Costs'] / saas_data['New_Customers']
-plt.figure(figsize=(28, 7))
-plt.plot(saas_data['Month'], variable_costs_per_customer, label='Variable Costs per Customer')
-plt.title('Variable Costs per New Customer Over Time')
-plt.xlabel('Month')
-plt.ylabel('Variable Costs ($)')
-plt.xticks(rotation=45)
-plt.legend()
-plt.grid()
-plt.tight_layout()
-plt.savefig("Cost Analysis")
-
-# Analyze upsell rates
-upsell_success_rate = saas_data['Upsell_Completed'].sum() / saas_data['New_Customers'].sum()
-print("Upsell Success Rate:", upsell_success_rate)
-
-# Customer willingness to pay analysis (hypothetical, based on customer feedback)
-customer_feedback = saas_data[['NPS_Score', 'Upsell_Rate']]
-
-# Visualize NPS scores against upsell rates and save as an image
-plt.figure(figsize=(14, 7))
-plt.scatter(customer_feedback['NPS_Score'], customer_feedback['Upsell_Rate'], alpha=0.5)
-plt.title('NPS Score vs. Upsell Rate')
-plt.xlabel('NPS Score')
-plt.ylabel('Upsell Rate')
-plt.grid()
-plt.tight_layout()
-
-# Save the plot as an image
-plt.savefig('nps_vs_upsell_rate.png')
-print("Plot saved as 'nps_vs_upsell_rate.png'.")
-
-import matplotlib.pyplot as plt
-
-# Calculate churn rates by customer segment
-churn_rates = {
-    'Basic': saas_data['Cancellations_Basic'].sum() / saas_data['New_Subscribers_Basic'].sum(),
-    'Premium': saas_data['Cancellations_Premium'].sum() / saas_data['New_Subscribers_Premium'].sum(),
-    'Enterprise': saas_data['Cancellations_Enterprise'].sum() / saas_data['New_Subscribers_Enterprise'].sum()
-}
+@chart('clv_plot', ['CLV'])
+def clv_chart(saas_data, insights):
+    return (ChartSpec('clv_plot.png', 'Customer Lifetime Value (CLV) Over Time',
+                      'Month', 'CLV ($)', name='Customer Lifetime Value (CLV) plot', rotate_xticks=True)
+            .plot(saas_data['Month'], saas_data['CLV'], label='Customer Lifetime Value', marker='o'))
 
-# Plot churn rates
-plt.figure(figsize=(10, 6))
-plt.bar(churn_rates.keys(), churn_rates.values(), color=['blue', 'green', 'red'])
-plt.title('Churn Rates by Customer Segment')
-plt.xlabel('Customer Segment')
-plt.ylabel('Churn Rate')
-plt.tight_layout()
-plt.savefig('churn_rates_by_segment.png')
-print("Churn Rates by Segment plot saved as 'churn_rates_by_segment.png'.")
 
 # Analyze variable costs in relation to new customers
-variable_costs_per_customer = saas_data['Variable_Costs'] / saas_data['New_Customers']
-
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data['Month'], variable_costs_per_customer, label='Variable Costs per Customer', color='purple')
-plt.title('Variable Costs per New Customer Over Time')
-plt.xlabel('Month')
-plt.ylabel('Variable Costs ($)')
-plt.legend()
-plt.grid()
-plt.tight_layout()
-plt.savefig('variable_costs_per_customer.png')
-print("Variable Costs per Customer plot saved as 'variable_costs_per_customer.png'.")
+@chart('Cost Analysis', ['Variable_Costs_Per_Customer'])
+def cost_analysis_chart(saas_data, insights):
+    return (ChartSpec('Cost Analysis.png', 'Variable Costs per New Customer Over Time',
+                      'Month', 'Variable Costs ($)', name='Cost Analysis plot', figsize=(28, 7),
+                      rotate_xticks=True, grid=True)
+            .plot(saas_data['Month'], saas_data['Variable_Costs_Per_Customer'], label='Variable Costs per Customer'))
 
 
+# Visualize NPS scores against upsell rates
+@chart('nps_vs_upsell_rate', [], monthly=False)
+def nps_vs_upsell_chart(saas_data, insights):
+    return (ChartSpec('nps_vs_upsell_rate.png', 'NPS Score vs. Upsell Rate', 'NPS Score', 'Upsell Rate',
+                      legend=False, grid=True)
+            .add('scatter', saas_data['NPS_Score'], saas_data['Upsell_Rate'], alpha=0.5))
 
 
-
-print(saas_data.head())
+# Plot churn rates
+@chart('churn_rates_by_segment', ['Churn_Rates_By_Segment'])
+def churn_rates_by_segment_chart(saas_data, insights):
+    return segment_churn_chart(insights['Churn_Rates_By_Segment'])
+
+
+@chart('variable_costs_per_customer', ['Variable_Costs_Per_Customer'])
+def variable_costs_per_customer_chart(saas_data, insights):
+    return (ChartSpec('variable_costs_per_customer.png', 'Variable Costs per New Customer Over Time',
+                      'Month', 'Variable Costs ($)', name='Variable Costs per Customer plot', grid=True)
+            .plot(saas_data['Month'], saas_data['Variable_Costs_Per_Customer'], label='Variable Costs per Customer',
+                  color='purple'))
+
+
+# Plot cohort retention curves and the cohort-based CLV per tier
+@chart('cohort_retention', ['Cohorts'])
+def cohort_retention_chart(saas_data, insights):
+    retention_chart = ChartSpec('cohort_retention.png', 'Customer Retention by Months Since Signup',
+                                'Months Since Signup', 'Customers Retained (%)', name='Cohort Retention plot')
+    for tier, curve in insights['Cohort_Retention'].items():
+        retention_chart.plot(range(len(curve)), curve * 100, label=tier)
+    return retention_chart
+
+
+# The cohort-based CLV is one value per customer of each tier, in the hundreds or thousands of dollars.
+# clv_plot shows the dataset's CLV metric, total MRR over the Basic churn rate, month by month, in the
+# millions. The two share neither axis nor unit, so the cohort CLV gets its own bar chart.
+@chart('cohort_clv_by_tier', ['Cohorts'])
+def cohort_clv_chart(saas_data, insights):
+    cohort_clv = insights['Cohort_CLV']
+    return (ChartSpec('cohort_clv_by_tier.png', 'Customer Lifetime Value by Tier (Cohort-Based)',
+                      'Subscription Tier', 'CLV per Customer ($)', name='Cohort CLV plot', figsize=(10, 6),
+                      legend=False)
+            .add('bar', list(cohort_clv.keys()), list(cohort_clv.values()), color=['blue', 'green', 'red']))
+
+
+# Charts over time plot one point per month: with tenants, the months' totals (amounts summed, rates
+# averaged) with their metrics computed on them. A single tenant's store is its own monthly totals.
+def build_charts(saas_data, insights, names=None):
+    names = list(CHARTS) if names is None else names
+    totals = saas_data.monthly_totals()
+    compute(totals, [need for name in names for need in CHARTS[name][0] if need in METRICS and METRICS[need][2]])
+    return [CHARTS[name][1](totals if CHARTS[name][2] else saas_data, insights) for name in names]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Clean the SaaS dataset, print insights and plot charts.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--insights', nargs='+', choices=INSIGHTS, help='insights to print (default: all)')
+    parser.add_argument('--charts', nargs='+', choices=list(CHARTS),
+                        help='charts to render (default: all, or none when --insights is given)')
+    parser.add_argument('--no-charts', action='store_true')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = args.insights or INSIGHTS
+    # Picking insights alone is a quick look at the numbers, so no charts are drawn unless asked for
+    charts = [] if args.no_charts else args.charts or ([] if args.insights else list(CHARTS))
+
+    # Profile the run when SAAS_PROFILE names a trace file
+    profiled = profiling.enable_from_env()
+
+    # Load the dataset into the array-backed metrics store, leaving out the rows the data quality checks
+    # cannot load; rows with bad values are kept with those values missing, for the missing value report.
+    # The insights and charts read the store's columns in place.
+    saas_data = load_metrics_store(args.data, args.validate, level='structure')
+
+    if 'Missing_Values' in selected:
+        # Check for missing values
+        with profiling.stage('missing values'):
+            missing_values = saas_data.missing_values()
+
+        # Display missing values
+        print("Missing Values in Each Column:\n", missing_values)
+
+    # Calculate the derived metrics the selected insights and charts use; each one is computed once and
+    # memoized on the frame
+    needs = selected + [need for name in charts for need in CHARTS[name][0]]
+    insights = compute(saas_data, list(dict.fromkeys(need for need in needs if need in METRICS)))
+
+    if 'Average_Churn_Rates' in selected:
+        # Analyze churn rates
+        avg_churn_rates = insights['Average_Churn_Rates']
+
+        # Display churn rate analysis
+        for tier, avg_churn in avg_churn_rates.items():
+            print(f"Average Churn Rate for {tier}: {avg_churn:.2%}")
+
+    if 'Churn_Rates_By_Segment' in selected:
+        # Churn rates by customer segment
+        print("Churn Rates by Segment:", insights['Churn_Rates_By_Segment'])
+
+    if 'Upsell_Success_Rate' in selected:
+        # Analyze upsell rates
+        print("Upsell Success Rate:", insights['Upsell_Success_Rate'])
+
+    if 'Cohorts' in needs:
+        # Cohort retention and CLV per tier from customers expanded out of the monthly totals
+        with profiling.stage('cohorts'):
+            cohorts = tables_from_aggregates(saas_data, seed=0)
+            insights['Cohort_Retention'] = {tier: retention_curve(table['customers'])
+                                            for tier, table in cohorts.items()}
+            insights['Cohort_CLV'] = tier_clv(cohorts)
+    if 'Cohorts' in selected:
+        for tier, clv in insights['Cohort_CLV'].items():
+            print(f"Cohort-based CLV for {tier}: ${clv:,.2f}")
+
+    if 'Segments' in selected:
+        # Break MRR, churn, CLV, discount leakage and upsell down by region, customer type and churn reason
+        with profiling.stage('segments'):
+            segments = aggregate_frame(saas_data)
+        for dimension in DIMENSIONS:
+            print(f"Segments by {dimension}:\n{segment_report(segments, [dimension]).to_string()}")
+
+    # Render the charts; unchanged charts are skipped
+    if charts:
+        render_charts(build_charts(saas_data, insights, charts))
+
+    if args.insights is None:
+        # Displaying first few rows of the cleaned dataset
+        print(saas_data.head())
+
+    if profiled:
+        profiling.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,140 +1,212 @@
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
 
-# Update the date range to start from 2019 and include 60 months
-dates = pd.date_range(start='2019-01-01', periods=60, freq='M')
-
-# Adjusted Subscription Data reflecting growth over the years
-data = {
-    'Month': dates,
-
-    # Growth in subscribers - reflecting a realistic scenario
-    'New_Subscribers_Basic': np.concatenate([
-        np.random.randint(500, 1000, size=12),  # 2019
-        np.random.randint(800, 1500, size=12),  # 2020 (COVID-19 boost)
-        np.random.randint(700, 1200, size=12),  # 2021
-        np.random.randint(600, 1100, size=12),  # 2022
-        np.random.randint(500, 1000, size=12)  # 2023
-    ]),
-
-    'New_Subscribers_Premium': np.concatenate([
-        np.random.randint(300, 700, size=12),  # 2019
-        np.random.randint(500, 1000, size=12),  # 2020
-        np.random.randint(400, 900, size=12),  # 2021
-        np.random.randint(350, 800, size=12),  # 2022
-        np.random.randint(300, 700, size=12)  # 2023
-    ]),
-
-    'New_Subscribers_Enterprise': np.concatenate([
-        np.random.randint(50, 200, size=12),  # 2019
-        np.random.randint(80, 250, size=12),  # 2020
-        np.random.randint(70, 220, size=12),  # 2021
-        np.random.randint(60, 200, size=12),  # 2022
-        np.random.randint(50, 180, size=12)  # 2023
-    ]),
+# The data follows a five-year growth profile starting in 2019; longer horizons repeat it
+START_DATE = '2019-01-01'
+PROFILE_YEARS = 5
 
-    # Cancellations
-    'Cancellations_Basic': np.random.randint(100, 500, size=60),
-    'Cancellations_Premium': np.random.randint(50, 300, size=60),
-    'Cancellations_Enterprise': np.random.randint(10, 100, size=60),
+# Date format used by saas_dataset.csv
+CSV_DATE_FORMAT = '%d-%m-%Y'
+
+# Adding customer segments and other business metrics
+CUSTOMER_TYPES = ['Small Business', 'Medium Business', 'Enterprise']
+REGIONS = ['North America', 'Europe', 'Asia']
+CHURN_REASONS = ['Price', 'Lack of Features', 'Competitor Product', 'Customer Support']
+
+# Columns in the order they appear in saas_dataset.csv
+COLUMNS = [
+    'Month',
+    'New_Subscribers_Basic', 'New_Subscribers_Premium', 'New_Subscribers_Enterprise',
+    'Cancellations_Basic', 'Cancellations_Premium', 'Cancellations_Enterprise',
+    'MRR_Basic', 'MRR_Premium', 'MRR_Enterprise',
+    'Marketing_Spend', 'New_Customers', 'Fixed_Costs', 'Variable_Costs',
+    'Churn_Rate_Basic', 'Churn_Rate_Premium', 'Churn_Rate_Enterprise',
+    'Customer_Type', 'Region', 'One_Time_Fees', 'Discounts_Given', 'Churn_Reason',
+    'Upsell_Completed', 'NPS_Score', 'Monthly_Active_Users',
+    'Churn_Recovery_Rate', 'Upsell_Rate', 'Additional_Features_Purchased',
+]
+
+# Integer columns with one (low, high) range per profile year - reflecting growth over the years
+YEARLY_INT_RANGES = {
+    # Growth in subscribers - 2020 had a COVID-19 boost
+    'New_Subscribers_Basic': [(500, 1000), (800, 1500), (700, 1200), (600, 1100), (500, 1000)],
+    'New_Subscribers_Premium': [(300, 700), (500, 1000), (400, 900), (350, 800), (300, 700)],
+    'New_Subscribers_Enterprise': [(50, 200), (80, 250), (70, 220), (60, 200), (50, 180)],
 
     # MRR: Average Monthly Recurring Revenue for each segment
-    'MRR_Basic': np.concatenate([
-        np.random.randint(8000, 20000, size=12),  # 2019
-        np.random.randint(10000, 22000, size=12),  # 2020
-        np.random.randint(12000, 24000, size=12),  # 2021
-        np.random.randint(11000, 23000, size=12),  # 2022
-        np.random.randint(10000, 22000, size=12)  # 2023
-    ]),
-
-    'MRR_Premium': np.concatenate([
-        np.random.randint(20000, 40000, size=12),  # 2019
-        np.random.randint(25000, 45000, size=12),  # 2020
-        np.random.randint(27000, 47000, size=12),  # 2021
-        np.random.randint(26000, 46000, size=12),  # 2022
-        np.random.randint(25000, 45000, size=12)  # 2023
-    ]),
-
-    'MRR_Enterprise': np.concatenate([
-        np.random.randint(50000, 80000, size=12),  # 2019
-        np.random.randint(55000, 85000, size=12),  # 2020
-        np.random.randint(60000, 90000, size=12),  # 2021
-        np.random.randint(58000, 88000, size=12),  # 2022
-        np.random.randint(55000, 85000, size=12)  # 2023
-    ]),
+    'MRR_Basic': [(8000, 20000), (10000, 22000), (12000, 24000), (11000, 23000), (10000, 22000)],
+    'MRR_Premium': [(20000, 40000), (25000, 45000), (27000, 47000), (26000, 46000), (25000, 45000)],
+    'MRR_Enterprise': [(50000, 80000), (55000, 85000), (60000, 90000), (58000, 88000), (55000, 85000)],
 
     # Marketing Spend, higher in 2020 due to competition
-    'Marketing_Spend': np.concatenate([
-        np.random.randint(10000, 25000, size=12),  # 2019
-        np.random.randint(15000, 30000, size=12),  # 2020 (higher spend due to competition)
-        np.random.randint(12000, 25000, size=12),  # 2021
-        np.random.randint(10000, 20000, size=12),  # 2022
-        np.random.randint(9000, 18000, size=12)  # 2023
-    ]),
-
-    'New_Customers': np.concatenate([
-        np.random.randint(600, 1200, size=12),  # 2019
-        np.random.randint(800, 1500, size=12),  # 2020
-        np.random.randint(700, 1400, size=12),  # 2021
-        np.random.randint(650, 1300, size=12),  # 2022
-        np.random.randint(600, 1200, size=12)  # 2023
-    ]),
+    'Marketing_Spend': [(10000, 25000), (15000, 30000), (12000, 25000), (10000, 20000), (9000, 18000)],
+    'New_Customers': [(600, 1200), (800, 1500), (700, 1400), (650, 1300), (600, 1200)],
+}
+
+# Integer columns with a single range across all months
+INT_RANGES = {
+    # Cancellations
+    'Cancellations_Basic': (100, 500),
+    'Cancellations_Premium': (50, 300),
+    'Cancellations_Enterprise': (10, 100),
 
     # Operating Expenses
-    'Fixed_Costs': np.random.randint(15000, 30000, size=60),
-    'Variable_Costs': np.random.randint(10000, 25000, size=60),
-
-    # Churn Rates
-    'Churn_Rate_Basic': np.concatenate([
-        np.random.uniform(0.03, 0.06, size=12),  # 2019
-        np.random.uniform(0.02, 0.05, size=12),  # 2020
-        np.random.uniform(0.03, 0.06, size=12),  # 2021
-        np.random.uniform(0.03, 0.06, size=12),  # 2022
-        np.random.uniform(0.03, 0.06, size=12)  # 2023
-    ]),
-
-    'Churn_Rate_Premium': np.concatenate([
-        np.random.uniform(0.01, 0.03, size=12),  # 2019
-        np.random.uniform(0.01, 0.02, size=12),  # 2020
-        np.random.uniform(0.01, 0.03, size=12),  # 2021
-        np.random.uniform(0.01, 0.03, size=12),  # 2022
-        np.random.uniform(0.01, 0.03, size=12)  # 2023
-    ]),
-
-    'Churn_Rate_Enterprise': np.concatenate([
-        np.random.uniform(0.005, 0.02, size=12),  # 2019
-        np.random.uniform(0.004, 0.015, size=12),  # 2020
-        np.random.uniform(0.005, 0.02, size=12),  # 2021
-        np.random.uniform(0.005, 0.02, size=12),  # 2022
-        np.random.uniform(0.005, 0.02, size=12)  # 2023
-    ]),
+    'Fixed_Costs': (15000, 30000),
+    'Variable_Costs': (10000, 25000),
+
+    'One_Time_Fees': (0, 5000),
+    'Discounts_Given': (0, 2000),
+    'Upsell_Completed': (0, 2),
+    'NPS_Score': (0, 10),
+    'Additional_Features_Purchased': (0, 5),
 }
 
-# Create DataFrame
-saas_data = pd.DataFrame(data)
-
-# Adding customer segments and other business metrics
-customer_types = ['Small Business', 'Medium Business', 'Enterprise']
-regions = ['North America', 'Europe', 'Asia']
-
-saas_data['Customer_Type'] = np.random.choice(customer_types, size=60)
-saas_data['Region'] = np.random.choice(regions, size=60)
-saas_data['One_Time_Fees'] = np.random.randint(0, 5000, size=60)
-saas_data['Discounts_Given'] = np.random.randint(0, 2000, size=60)
-saas_data['Churn_Reason'] = np.random.choice(['Price', 'Lack of Features', 'Competitor Product', 'Customer Support'],
-                                             size=60)
-saas_data['Upsell_Completed'] = np.random.choice([0, 1], size=60)
-saas_data['NPS_Score'] = np.random.randint(0, 10, size=60)
-saas_data['Monthly_Active_Users'] = (saas_data['New_Subscribers_Basic'] + saas_data['New_Subscribers_Premium'] +
-                                     saas_data['New_Subscribers_Enterprise'] - saas_data['Cancellations_Basic'] -
-                                     saas_data['Cancellations_Premium'] - saas_data['Cancellations_Enterprise'])
+# Churn Rates, lower in 2020
+YEARLY_UNIFORM_RANGES = {
+    'Churn_Rate_Basic': [(0.03, 0.06), (0.02, 0.05), (0.03, 0.06), (0.03, 0.06), (0.03, 0.06)],
+    'Churn_Rate_Premium': [(0.01, 0.03), (0.01, 0.02), (0.01, 0.03), (0.01, 0.03), (0.01, 0.03)],
+    'Churn_Rate_Enterprise': [(0.005, 0.02), (0.004, 0.015), (0.005, 0.02), (0.005, 0.02), (0.005, 0.02)],
+}
 
 # Refining churn and upsell insights
-saas_data['Churn_Recovery_Rate'] = np.random.uniform(0.1, 0.3, size=60)
-saas_data['Upsell_Rate'] = np.random.uniform(0.05, 0.15, size=60)
-saas_data['Additional_Features_Purchased'] = np.random.randint(0, 5, size=60)
+UNIFORM_RANGES = {
+    'Churn_Recovery_Rate': (0.1, 0.3),
+    'Upsell_Rate': (0.05, 0.15),
+}
 
-# Save to CSV
-saas_data.to_csv('saas_dataset.csv', index=False)
+CATEGORICAL_COLUMNS = {
+    'Customer_Type': CUSTOMER_TYPES,
+    'Region': REGIONS,
+    'Churn_Reason': CHURN_REASONS,
+}
 
-print("SaaS dataset generated and saved to 'saas_dataset.csv'.")
+# Aim for roughly a million rows per partition
+DEFAULT_PARTITION_ROWS = 1_000_000
+
+
+def month_index(n_months):
+    return pd.date_range(start=START_DATE, periods=n_months, freq=pd.offsets.MonthEnd())
+
+
+# Build the rows for tenants [first_tenant, first_tenant + n_tenants) from one random stream.
+# Rows are ordered tenant by tenant, each tenant covering all months.
+def generate_chunk(first_tenant, n_tenants, n_months, seed_sequence, include_tenant=True):
+    rng = np.random.default_rng(seed_sequence)
+    shape = (n_tenants, n_months)
+    year = (np.arange(n_months) // 12) % PROFILE_YEARS
+
+    data = {}
+    if include_tenant:
+        data['Tenant_ID'] = np.repeat(np.arange(first_tenant, first_tenant + n_tenants, dtype=np.int32), n_months)
+    data['Month'] = np.tile(month_index(n_months).values, n_tenants)
+
+    for column, ranges in YEARLY_INT_RANGES.items():
+        bounds = np.array(ranges)[year]
+        data[column] = rng.integers(bounds[:, 0], bounds[:, 1], size=shape, dtype=np.int32).ravel()
+    for column, (low, high) in INT_RANGES.items():
+        data[column] = rng.integers(low, high, size=n_tenants * n_months, dtype=np.int32)
+    for column, ranges in YEARLY_UNIFORM_RANGES.items():
+        bounds = np.array(ranges)[year]
+        data[column] = rng.uniform(bounds[:, 0], bounds[:, 1], size=shape).ravel()
+    for column, (low, high) in UNIFORM_RANGES.items():
+        data[column] = rng.uniform(low, high, size=n_tenants * n_months)
+    for column, categories in CATEGORICAL_COLUMNS.items():
+        codes = rng.integers(0, len(categories), size=n_tenants * n_months, dtype=np.int8)
+        data[column] = pd.Categorical.from_codes(codes, categories=categories)
+
+    data['Monthly_Active_Users'] = (data['New_Subscribers_Basic'] + data['New_Subscribers_Premium'] +
+                                    data['New_Subscribers_Enterprise'] - data['Cancellations_Basic'] -
+                                    data['Cancellations_Premium'] - data['Cancellations_Enterprise'])
+
+    columns = (['Tenant_ID'] if include_tenant else []) + COLUMNS
+    return pd.DataFrame({column: data[column] for column in columns})
+
+
+def write_csv(chunk, path, header=True, mode='w'):
+    chunk = chunk.assign(Month=chunk['Month'].dt.strftime(CSV_DATE_FORMAT))
+    chunk.to_csv(path, index=False, header=header, mode=mode)
+
+
+def _write_partition(task):
+    partition, first_tenant, n_tenants, n_months, seed_sequence, out_dir, formats, include_tenant = task
+    chunk = generate_chunk(first_tenant, n_tenants, n_months, seed_sequence, include_tenant)
+    name = f'part-{partition:05d}'
+    if 'parquet' in formats:
+        chunk.to_parquet(os.path.join(out_dir, name + '.parquet'), index=False)
+    if 'csv' in formats:
+        write_csv(chunk, os.path.join(out_dir, name + '.csv'))
+    return len(chunk)
+
+
+def partition_tenants(n_tenants, n_months, partition_rows=DEFAULT_PARTITION_ROWS):
+    tenants_per_partition = max(1, partition_rows // n_months)
+    return [(first, min(tenants_per_partition, n_tenants - first))
+            for first in range(0, n_tenants, tenants_per_partition)]
+
+
+# Write the dataset as one file per partition. Every partition draws from its own child of the
+# seed sequence, so the output only depends on the seed and the partition layout, not on the
+# number of workers.
+def generate_partitioned(out_dir, n_tenants, n_months=60, seed=None, formats=('parquet',),
+                         partition_rows=DEFAULT_PARTITION_ROWS, workers=None):
+    os.makedirs(out_dir, exist_ok=True)
+    partitions = partition_tenants(n_tenants, n_months, partition_rows)
+    seeds = np.random.SeedSequence(seed).spawn(len(partitions))
+    include_tenant = n_tenants > 1
+    tasks = [(i, first, count, n_months, seeds[i], out_dir, tuple(formats), include_tenant)
+             for i, (first, count) in enumerate(partitions)]
+
+    if workers == 1 or len(tasks) == 1:
+        return sum(map(_write_partition, tasks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_write_partition, tasks))
+
+
+# Write the dataset to a single CSV file, appending one partition at a time
+def generate_csv(path, n_tenants=1, n_months=60, seed=None, partition_rows=DEFAULT_PARTITION_ROWS):
+    partitions = partition_tenants(n_tenants, n_months, partition_rows)
+    seeds = np.random.SeedSequence(seed).spawn(len(partitions))
+    rows = 0
+    for i, (first, count) in enumerate(partitions):
+        chunk = generate_chunk(first, count, n_months, seeds[i], include_tenant=n_tenants > 1)
+        write_csv(chunk, path, header=i == 0, mode='w' if i == 0 else 'a')
+        rows += len(chunk)
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic SaaS dataset.')
+    parser.add_argument('--months', type=int, default=60, help='months of history per tenant')
+    parser.add_argument('--tenants', type=int, default=1, help='number of tenants')
+    parser.add_argument('--rows', type=int, help='total rows; overrides --tenants')
+    parser.add_argument('--seed', type=int, help='seed for reproducible output')
+    parser.add_argument('--output', default='saas_dataset.csv',
+                        help='CSV file to write when --out-dir is not given')
+    parser.add_argument('--out-dir', help='write partitioned files to this directory instead')
+    parser.add_argument('--format', nargs='+', choices=['parquet', 'csv'], default=['parquet'],
+                        help='partition file formats (with --out-dir)')
+    parser.add_argument('--partition-rows', type=int, default=DEFAULT_PARTITION_ROWS)
+    parser.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    n_tenants = math.ceil(args.rows / args.months) if args.rows else args.tenants
+
+    if args.out_dir:
+        rows = generate_partitioned(args.out_dir, n_tenants, args.months, args.seed, args.format,
+                                    args.partition_rows, args.workers)
+        print(f"SaaS dataset generated: {rows} rows saved to '{args.out_dir}'.")
+    else:
+        generate_csv(args.output, n_tenants, args.months, args.seed, args.partition_rows)
+        print(f"SaaS dataset generated and saved to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,173 +1,246 @@
+import argparse
+
 import pandas as pd
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from statsmodels.tsa.seasonal import seasonal_decompose
-from statsmodels.tsa.vector_ar.var_model import VAR
-import arch
-matplotlib.use('Agg')
-# Load the SaaS dataset
-saas_data = pd.read_csv('saas_dataset.csv')
-
-# Convert the 'Month' column to datetime format
-saas_data['Month'] = pd.to_datetime(saas_data['Month'])
-saas_data.set_index('Month', inplace=True)
-# Add Total_MRR column by summing MRR_Basic, MRR_Premium, and MRR_Enterprise
-saas_data['Total_MRR'] = saas_data['MRR_Basic'] + saas_data['MRR_Premium'] + saas_data['MRR_Enterprise']
-
-
-# Fit ARIMA model to Total MRR
-arima_model = ARIMA(saas_data['Total_MRR'], order=(1,1,1))
-arima_result = arima_model.fit()
-
-# Forecast for the next 12 months
-forecast_arima = arima_result.forecast(steps=12)
-print(forecast_arima)
-
-# Plot the forecast
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data.index, saas_data['Total_MRR'], label='Observed MRR')
-plt.plot(pd.date_range(saas_data.index[-1], periods=12, freq='M'), forecast_arima, label='ARIMA Forecast', color='red')
-plt.title('ARIMA Forecast of Total MRR')
-plt.xlabel('Month')
-plt.ylabel('MRR ($)')
-plt.legend()
-plt.tight_layout()
-plt.savefig('arima_mrr_forecast.png')
-print("ARIMA forecast plot saved as 'arima_mrr_forecast.png'.")
-
-# Fit GARCH model to Total MRR
-garch_model = arch.arch_model(saas_data['Total_MRR'], vol='Garch', p=1, q=1)
-garch_result = garch_model.fit()
-
-# Forecast volatility
-garch_forecast = garch_result.forecast(horizon=12)
-print(garch_forecast.variance[-1:])
-
-# Plot forecasted volatility
-plt.figure(figsize=(14, 7))
-plt.plot(pd.date_range(saas_data.index[-1], periods=12, freq='M'), garch_forecast.variance[-1:].T, label='GARCH Forecast')
-plt.title('GARCH Forecast of Total MRR Volatility')
-plt.xlabel('Month')
-plt.ylabel('Volatility ($)')
-plt.legend()
-plt.tight_layout()
-plt.savefig('garch_mrr_volatility.png')
-print("GARCH volatility plot saved as 'garch_mrr_volatility.png'.")
-
-# Apply Exponential Smoothing for forecasting
-exp_smoothing_model = ExponentialSmoothing(saas_data['Total_MRR'], trend='add', seasonal='add', seasonal_periods=12)
-exp_smoothing_result = exp_smoothing_model.fit()
-
-# Forecast for next 12 months
-forecast_exp_smoothing = exp_smoothing_result.forecast(12)
-
-# Plot the forecast
-plt.figure(figsize=(14, 7))
-plt.plot(saas_data.index, saas_data['Total_MRR'], label='Observed MRR')
-plt.plot(pd.date_range(saas_data.index[-1], periods=12, freq='M'), forecast_exp_smoothing, label='Exponential Smoothing Forecast', color='red')
-plt.title('Exponential Smoothing Forecast of Total MRR')
-plt.xlabel('Month')
-plt.ylabel('MRR ($)')
-plt.legend()
-plt.tight_layout()
-plt.savefig('exp_smoothing_forecast.png')
-print("Exponential Smoothing forecast saved as 'exp_smoothing_forecast.png'.")
-
-# Decompose the Total MRR time series
-stl_decompose = seasonal_decompose(saas_data['Total_MRR'], model='additive', period=12)
-
-# Plot the decomposition
-plt.figure(figsize=(14, 10))
-stl_decompose.plot()
-plt.tight_layout()
-plt.savefig('stl_mrr_decomposition.png')
-print("STL decomposition plot saved as 'stl_mrr_decomposition.png'.")
-
-# Profitability: Forecast profit for next 12 months
-# Profit = Total Revenue - Total Costs
-profit_forecast = forecast_arima - (saas_data['Fixed_Costs'].iloc[-1] + saas_data['Variable_Costs'].iloc[-1])
-
-# Plot Profit Forecast
-plt.figure(figsize=(14, 7))
-plt.plot(pd.date_range(saas_data.index[-1], periods=12, freq='M'), profit_forecast, label='Profit Forecast', color='orange')
-plt.title('Profit Forecast for the Next 12 Months')
-plt.xlabel('Month')
-plt.ylabel('Profit ($)')
-plt.legend()
-plt.tight_layout()
-plt.savefig('profit_forecast.png')
-print("Profit forecast saved as 'profit_forecast.png'.")
-
-# Cash Flow Forecast
-# Cash Flow = Operating Cash Inflows - Operating Cash Outflows
-cash_inflows = forecast_arima
-cash_outflows = saas_data['Fixed_Costs'].iloc[-1] + saas_data['Variable_Costs'].iloc[-1] + saas_data['Marketing_Spend'].iloc[-1]
-cash_flow_forecast = cash_inflows - cash_outflows
-
-# Plot Cash Flow Forecast
-plt.figure(figsize=(14, 7))
-plt.plot(pd.date_range(saas_data.index[-1], periods=12, freq='M'), cash_flow_forecast, label='Cash Flow Forecast', color='purple')
-plt.title('Cash Flow Forecast for the Next 12 Months')
-plt.xlabel('Month')
-plt.ylabel('Cash Flow ($)')
-plt.legend()
-plt.tight_layout()
-plt.savefig('cash_flow_forecast.png')
-print("Cash Flow forecast saved as 'cash_flow_forecast.png'.")
-
-# Sensitivity Analysis: Impact of Churn Rate and Marketing Spend on Profitability
-
-# Define churn and marketing spend scenarios
-# Example initialization for current_mrr
-current_mrr = saas_data['Total_MRR'].iloc[-1]  # Get the latest Total MRR value
-
-# Define scenarios for marketing spend and churn rate
-marketing_spend_scenarios = [0.9, 1.0, 1.1]  # 10% decrease, baseline, and 10% increase
-churn_rate_scenarios = [0.02, 0.03, 0.05]  # 2%, 3%, and 5% churn rates
-
-# Initialize a DataFrame to store results
-sensitivity_results = pd.DataFrame()
-
-# Iterate through the marketing and churn rate scenarios
-for marketing_multiplier in marketing_spend_scenarios:
-    for churn_rate in churn_rate_scenarios:
-        future_profit = []
-        future_mrr = current_mrr
-        future_marketing_spend = saas_data['Marketing_Spend'].iloc[-1] * marketing_multiplier
-
-        for month in range(12):  # Forecast for 12 months
-            # Calculate profit for the month
-            future_mrr = future_mrr * (1 - churn_rate)  # Adjust MRR for churn
-            monthly_profit = future_mrr - future_marketing_spend - \
-                             saas_data['Fixed_Costs'].iloc[-1] - \
-                             saas_data['Variable_Costs'].iloc[-1]
-            future_profit.append(monthly_profit)
-
-        # Name for the scenario based on parameters
-        scenario_name = f'Marketing_{int(marketing_multiplier * 100)}_Churn_{int(churn_rate * 100)}'
-        sensitivity_results[scenario_name] = future_profit
-
-# Prepare the time index for plotting
-months = pd.date_range(saas_data.index[-1] + pd.DateOffset(months=1), periods=12, freq='M')
-
-# Plotting Sensitivity Analysis
-plt.figure(figsize=(14, 7))
-for scenario_name in sensitivity_results.columns:
-    plt.plot(months, sensitivity_results[scenario_name], label=scenario_name)
-
-plt.title('Sensitivity Analysis of Profit Forecast (Churn vs Marketing Spend)')
-plt.xlabel('Month')
-plt.ylabel('Profit ($)')
-plt.axhline(0, color='red', linestyle='--', label='Break-even Point')
-plt.legend()
-plt.grid()
-plt.tight_layout()
-
-# Save the plot
-plt.savefig('sensitivity_analysis_profit_forecast.png')
-print("Sensitivity Analysis plot saved as 'sensitivity_analysis_profit_forecast.png'.")
-
-
+from joint_forecast import COST_COLUMNS, monthly_history, project
+from metrics import compute
+from metrics_store import load_metrics_store
+from model_store import fit_cached
+import profiling
+from monte_carlo import cost_history_from_data, simulate
+from rendering import ChartSpec, render_charts
+from sensitivity import baseline_from_data, profit_paths
+
+# Forecasting stages and the stages whose results they use
+STAGES = {
+    'arima': [],
+    'garch': [],
+    'exp_smoothing': [],
+    'var': [],
+    'decomposition': [],
+    'profit': ['arima'],
+    'cash_flow': ['arima'],
+    'simulation': ['arima', 'garch', 'cash_flow'],
+    'sensitivity': [],
+}
+# In joint mode profit, cash flow and the simulation come from one VAR over revenue, costs and marketing
+# instead of the per-series ARIMA and GARCH fits and the last observed costs
+JOINT_STAGES = dict(STAGES, profit=['var'], cash_flow=['var'], simulation=['var', 'cash_flow'])
+
+
+def default_stages(joint=False):
+    skipped = ['arima', 'garch', 'exp_smoothing'] if joint else ['var']
+    return [name for name in STAGES if name not in skipped]
+
+
+def resolve_stages(names, dependencies=STAGES):
+    resolved = []
+    for name in names:
+        for dependency in resolve_stages(dependencies[name], dependencies) + [name]:
+            if dependency not in resolved:
+                resolved.append(dependency)
+    return resolved
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Forecast MRR, profit and cash flow.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES),
+                        help='stages to run; the stages they depend on run as well (default: all of the mode)')
+    parser.add_argument('--joint', action='store_true',
+                        help='project revenue, costs and marketing jointly with a VAR for profit and cash flow')
+    parser.add_argument('--no-charts', action='store_true')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stages = resolve_stages(args.stages or default_stages(args.joint), JOINT_STAGES if args.joint else STAGES)
+
+    # Profile the run when SAAS_PROFILE names a trace file
+    profiled = profiling.enable_from_env()
+
+    # Load the SaaS dataset into the metrics store; the loader parses 'Month' to datetime with an explicit format.
+    # Partitions failing the data quality checks are quarantined first, so no model is fitted to them.
+    # Forecasts use the company-wide monthly totals, whose columns are Series indexed by month.
+    saas_data = load_metrics_store(args.data, args.validate).monthly_totals()
+    # Add Total_MRR column by summing MRR_Basic, MRR_Premium, and MRR_Enterprise
+    compute(saas_data, ['Total_MRR'])
+
+    # Months covered by the 12-month forecasts
+    forecast_months = pd.date_range(saas_data.index[-1], periods=12, freq=pd.offsets.MonthEnd())
+    charts = []
+
+    if 'arima' in stages:
+        # Fit ARIMA model to Total MRR
+        # Fitted models are kept in the model store and only refitted when the data changes
+        arima_result, how = fit_cached('Total_MRR', 'arima', saas_data['Total_MRR'], {'order': (1, 1, 1)})
+        print(f"ARIMA model: {how}")
+
+        # Forecast for the next 12 months
+        forecast_arima = arima_result.forecast(steps=12)
+        print(forecast_arima)
+
+        # Plot the forecast
+        charts.append(ChartSpec('arima_mrr_forecast.png', 'ARIMA Forecast of Total MRR', 'Month', 'MRR ($)',
+                                name='ARIMA forecast plot')
+                      .plot(saas_data.index, saas_data['Total_MRR'], label='Observed MRR')
+                      .plot(forecast_months, forecast_arima, label='ARIMA Forecast', color='red'))
+
+    if 'garch' in stages:
+        # Fit GARCH model to Total MRR
+        garch_result, how = fit_cached('Total_MRR', 'garch', saas_data['Total_MRR'], {'p': 1, 'q': 1})
+        print(f"GARCH model: {how}")
+
+        # Forecast volatility
+        garch_forecast = garch_result.forecast(horizon=12)
+        print(garch_forecast.variance[-1:])
+
+        # Plot forecasted volatility
+        charts.append(ChartSpec('garch_mrr_volatility.png', 'GARCH Forecast of Total MRR Volatility', 'Month',
+                                'Volatility ($)', name='GARCH volatility plot')
+                      .plot(forecast_months, garch_forecast.variance.iloc[-1], label='GARCH Forecast'))
+
+    if 'exp_smoothing' in stages:
+        # Apply Exponential Smoothing for forecasting
+        exp_smoothing_result, how = fit_cached('Total_MRR', 'exp_smoothing', saas_data['Total_MRR'],
+                                               {'trend': 'add', 'seasonal': 'add', 'seasonal_periods': 12,
+                                                'damped_trend': False})
+        print(f"Exponential Smoothing model: {how}")
+
+        # Forecast for next 12 months
+        forecast_exp_smoothing = exp_smoothing_result.forecast(12)
+
+        # Plot the forecast
+        charts.append(ChartSpec('exp_smoothing_forecast.png', 'Exponential Smoothing Forecast of Total MRR', 'Month',
+                                'MRR ($)', name='Exponential Smoothing forecast')
+                      .plot(saas_data.index, saas_data['Total_MRR'], label='Observed MRR')
+                      .plot(forecast_months, forecast_exp_smoothing, label='Exponential Smoothing Forecast',
+                            color='red'))
+
+    if 'var' in stages:
+        # Joint projection: one VAR over the tier MRRs, costs, marketing spend and new customers, its point
+        # forecast and simulated paths computed together for every month and variable
+        var_result, var_forecast, var_simulation = project(monthly_history(saas_data), horizon=12, seed=42)
+        print(f"VAR({var_result.k_ar}) joint forecast:")
+        print(var_forecast.set_index(forecast_months)[['Total_MRR'] + COST_COLUMNS + ['New_Customers']])
+
+        # Plot the projected revenue and costs
+        charts.append(ChartSpec('var_joint_forecast.png', 'VAR Joint Forecast of Revenue and Costs', 'Month',
+                                'Amount ($)', name='VAR joint forecast plot', grid=True)
+                      .plot(saas_data.index, saas_data['Total_MRR'], label='Observed MRR')
+                      .plot(forecast_months, var_forecast['Total_MRR'], label='Total MRR Forecast', color='red')
+                      .plot(forecast_months, var_forecast['Fixed_Costs'] + var_forecast['Variable_Costs'],
+                            label='Operating Costs Forecast', color='orange')
+                      .plot(forecast_months, var_forecast['Marketing_Spend'], label='Marketing Spend Forecast',
+                            color='green'))
+
+    if 'decomposition' in stages:
+        from statsmodels.tsa.seasonal import seasonal_decompose
+
+        # Decompose the Total MRR time series
+        with profiling.stage('seasonal_decompose'):
+            stl_decompose = seasonal_decompose(saas_data['Total_MRR'], model='additive', period=12)
+
+        # Plot the decomposition
+        decomposition_chart = ChartSpec('stl_mrr_decomposition.png', 'Total_MRR', name='STL decomposition plot',
+                                        figsize=(14, 10), layout='stacked')
+        for label, component in [('Total_MRR', stl_decompose.observed), ('Trend', stl_decompose.trend),
+                                 ('Seasonal', stl_decompose.seasonal)]:
+            decomposition_chart.plot(component.index, component, label=label)
+        decomposition_chart.add('scatter', stl_decompose.resid.index, stl_decompose.resid, label='Resid')
+        charts.append(decomposition_chart)
+
+    if 'profit' in stages:
+        # Profitability: Forecast profit for next 12 months
+        # Profit = Total Revenue - Total Costs
+        if args.joint:
+            # Revenue and costs both projected by the VAR
+            profit_forecast = var_forecast['Profit'].to_numpy()
+        else:
+            profit_forecast = forecast_arima - (saas_data['Fixed_Costs'].iloc[-1] + saas_data['Variable_Costs'].iloc[-1])
+
+        # Plot Profit Forecast
+        charts.append(ChartSpec('profit_forecast.png', 'Profit Forecast for the Next 12 Months', 'Month', 'Profit ($)',
+                                name='Profit forecast')
+                      .plot(forecast_months, profit_forecast, label='Profit Forecast', color='orange'))
+
+    if 'cash_flow' in stages:
+        # Cash Flow Forecast
+        # Cash Flow = Operating Cash Inflows - Operating Cash Outflows
+        if args.joint:
+            cash_flow_forecast = var_forecast['Cash_Flow'].to_numpy()
+        else:
+            cash_inflows = forecast_arima
+            cash_outflows = saas_data['Fixed_Costs'].iloc[-1] + saas_data['Variable_Costs'].iloc[-1] + saas_data['Marketing_Spend'].iloc[-1]
+            cash_flow_forecast = cash_inflows - cash_outflows
+
+        # Plot Cash Flow Forecast
+        charts.append(ChartSpec('cash_flow_forecast.png', 'Cash Flow Forecast for the Next 12 Months', 'Month',
+                                'Cash Flow ($)', name='Cash Flow forecast')
+                      .plot(forecast_months, cash_flow_forecast, label='Cash Flow Forecast', color='purple'))
+
+    if 'simulation' in stages:
+        if args.joint:
+            # Revenue and cost paths simulated jointly by the VAR
+            simulation = var_simulation
+        else:
+            # Monte Carlo simulation: MRR paths from the ARIMA mean and GARCH variance, costs resampled from history
+            simulation = simulate(forecast_arima, garch_forecast.variance.iloc[-1], cost_history_from_data(saas_data),
+                                  n_paths=200_000, seed=42)
+        print(simulation[['step', 'cash_flow_p5', 'cash_flow_p50', 'cash_flow_p95', 'prob_negative_cash_flow']])
+
+        # Plot the simulated cash flow bands
+        charts.append(ChartSpec('cash_flow_simulation.png', 'Simulated Cash Flow for the Next 12 Months', 'Month',
+                                'Cash Flow ($)', name='Cash Flow simulation plot', grid=True,
+                                hlines=[(0, {'color': 'red', 'linestyle': '--', 'label': 'Break-even Point'})])
+                      .add('band', forecast_months, [simulation['cash_flow_p5'], simulation['cash_flow_p95']],
+                           alpha=0.2, color='purple', label='5th-95th percentile')
+                      .add('band', forecast_months, [simulation['cash_flow_p25'], simulation['cash_flow_p75']],
+                           alpha=0.4, color='purple', label='25th-75th percentile')
+                      .plot(forecast_months, simulation['cash_flow_p50'], label='Median', color='purple')
+                      .plot(forecast_months, cash_flow_forecast, label='Cash Flow Forecast', color='black',
+                            linestyle='--'))
+
+    if 'sensitivity' in stages:
+        # Sensitivity Analysis: Impact of Churn Rate and Marketing Spend on Profitability
+        # Starting point: the latest Total MRR, marketing spend and costs
+        baseline = baseline_from_data(saas_data)
+
+        # Define scenarios for marketing spend and churn rate
+        marketing_spend_scenarios = [0.9, 1.0, 1.1]  # 10% decrease, baseline, and 10% increase
+        churn_rate_scenarios = [0.02, 0.03, 0.05]  # 2%, 3%, and 5% churn rates
+
+        # Monthly profit for every scenario at once, shape (churn, marketing, 1, 1, month)
+        profit = profit_paths(baseline, churn_rate_scenarios, marketing_spend_scenarios, horizon=12)
+
+        # One column per scenario, named after its parameters
+        sensitivity_results = pd.DataFrame({
+            f'Marketing_{int(marketing_multiplier * 100)}_Churn_{int(churn_rate * 100)}': profit[j, i, 0, 0]
+            for i, marketing_multiplier in enumerate(marketing_spend_scenarios)
+            for j, churn_rate in enumerate(churn_rate_scenarios)
+        })
+
+        # Prepare the time index for plotting
+        months = pd.date_range(saas_data.index[-1] + pd.DateOffset(months=1), periods=12, freq=pd.offsets.MonthEnd())
+
+        # Plotting Sensitivity Analysis
+        sensitivity_chart = ChartSpec('sensitivity_analysis_profit_forecast.png',
+                                      'Sensitivity Analysis of Profit Forecast (Churn vs Marketing Spend)', 'Month',
+                                      'Profit ($)', name='Sensitivity Analysis plot', grid=True,
+                                      hlines=[(0, {'color': 'red', 'linestyle': '--', 'label': 'Break-even Point'})])
+        for scenario_name in sensitivity_results.columns:
+            sensitivity_chart.plot(months, sensitivity_results[scenario_name], label=scenario_name)
+        charts.append(sensitivity_chart)
+
+    # Render the charts; unchanged charts are skipped
+    if not args.no_charts:
+        render_charts(charts)
+
+    if profiled:
+        profiling.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from batch_forecasting import FORECAST_COLUMNS, build_series
+from data_loader import load_saas_data
+from data_quality import load_validated
+from metrics import compute
+from models import DEFAULT_SPECS, MODELS, fit_model, forecast_model, model_params
+
+TOTAL_SERIES = 'Total_MRR'
+
+# Columns of the forecast errors and of their scores
+ERROR_COLUMNS = FORECAST_COLUMNS + ['actual', 'cutoff']
+SCORE_COLUMNS = ['series', 'model', 'step', 'MAE', 'MAPE', 'coverage', 'n']
+
+
+def rolling_cutoffs(n_obs, min_train=36, every=1):
+    return list(range(min_train, n_obs, every))
+
+
+# Walk one model forward over a block of cutoffs. The first cutoff is fitted from scratch and every
+# later cutoff starts from the parameters estimated at the previous one.
+def backtest_block(task):
+    key, values, name, spec, cutoffs, horizon = task
+    rows = []
+    start_params = None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for cutoff in cutoffs:
+            try:
+                result = fit_model(name, values[:cutoff], spec, start_params=start_params)
+            except Exception:
+                start_params = None
+                continue
+            start_params = model_params(name, result)
+            steps = min(horizon, len(values) - cutoff)
+            forecast = forecast_model(name, result, steps)
+            forecast['actual'] = values[cutoff:cutoff + steps]
+            forecast['cutoff'] = cutoff
+            rows.append(forecast)
+
+    if not rows:
+        return pd.DataFrame()
+    errors = pd.concat(rows, ignore_index=True)
+    errors.insert(0, 'model', name)
+    errors.insert(0, 'series', key)
+    return errors
+
+
+def split_blocks(cutoffs, n_blocks):
+    return [block.tolist() for block in np.array_split(np.asarray(cutoffs), n_blocks) if len(block)]
+
+
+# Refit every model at every cutoff and collect the forecast errors. Work is split into (series, model,
+# block of consecutive cutoffs) tasks; within a block fits are warm-started from the previous cutoff.
+def run_backtest(series, model_names=MODELS, horizon=12, min_train=36, every=1, blocks_per_series=None,
+                 workers=None):
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    for key, values in series.items():
+        values = np.asarray(values, dtype=float)
+        cutoffs = rolling_cutoffs(len(values), min_train, every)
+        # Enough blocks to keep every worker busy, but long enough chains for warm starts to pay off
+        n_blocks = blocks_per_series or max(1, min(len(cutoffs) // 4, -(-workers * 2 // len(series))))
+        for name in model_names:
+            for block in split_blocks(cutoffs, n_blocks):
+                tasks.append((key, values, name, DEFAULT_SPECS[name], block, horizon))
+    if not tasks:
+        print("No series to backtest.")
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = list(map(backtest_block, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(backtest_block, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    elapsed = time.perf_counter() - start
+
+    results = [errors for errors in results if len(errors)]
+    errors = pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=ERROR_COLUMNS)
+    n_fits = errors.groupby(['series', 'model', 'cutoff']).ngroups if len(errors) else 0
+    rate = f" ({n_fits / elapsed:.1f} fits/s)" if elapsed > 0 else ''
+    print(f"Backtested {len(series)} series with {n_fits} fits in {elapsed:.2f}s{rate}.")
+    if errors.empty:
+        print("No model could be fitted at any cutoff.")
+    return errors
+
+
+# MAE, MAPE and interval coverage per series, model and forecast step
+def score_errors(errors):
+    if errors.empty:
+        return pd.DataFrame(columns=SCORE_COLUMNS)
+    errors = errors.assign(
+        abs_error=(errors['forecast'] - errors['actual']).abs(),
+        covered=(errors['lower'] <= errors['actual']) & (errors['actual'] <= errors['upper']),
+    )
+    errors['ape'] = errors['abs_error'] / errors['actual'].abs().replace(0, np.nan)
+    scores = errors.groupby(['series', 'model', 'step']).agg(
+        MAE=('abs_error', 'mean'), MAPE=('ape', 'mean'), coverage=('covered', 'mean'), n=('abs_error', 'size'))
+    return scores.reset_index()
+
+
+def load_series(saas_data, keys):
+    series = {}
+    segment_keys = [key for key in keys if key != TOTAL_SERIES]
+    if segment_keys:
+        series.update(build_series(saas_data, segment_keys))
+    if TOTAL_SERIES in keys:
+        compute(saas_data, ['Total_MRR'])
+        series[TOTAL_SERIES] = saas_data.groupby('Month')['Total_MRR'].sum().astype(float)
+    return series
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of the forecasting models.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--series', nargs='+', default=[TOTAL_SERIES],
+                        help=f"'{TOTAL_SERIES}' or segment keys such as 'Basic/Europe/*'")
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=MODELS)
+    parser.add_argument('--horizon', type=int, default=12)
+    parser.add_argument('--min-train', type=int, default=36)
+    parser.add_argument('--every', type=int, default=1, help='months between cutoffs')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='backtest_scores.csv')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    saas_data = load_validated(args.data) if args.validate else load_saas_data(args.data)
+    series = load_series(saas_data, args.series)
+    errors = run_backtest(series, args.models, args.horizon, args.min_train, args.every, workers=args.workers)
+    scores = score_errors(errors)
+
+    if len(scores):
+        summary = scores.groupby('model')[['MAE', 'MAPE', 'coverage']].mean()
+        print("Average over series and 1-12 step horizons:\n", summary)
+    scores.to_csv(args.output, index=False)
+    print(f"Backtest scores saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
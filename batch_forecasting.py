@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from Dataset_Generation import CUSTOMER_TYPES, REGIONS
+from data_loader import load_saas_data
+from data_quality import load_validated
+from metrics import TIERS
+from model_store import fit_cached
+from models import MODELS, fit_model, forecast_model
+
+# A series key selects one tier's MRR for a region and customer type, e.g. 'Premium/Europe/Enterprise'.
+# '*' aggregates over that dimension, so 'Basic/*/*' is the total Basic MRR and '*/*/*' the Total MRR.
+ALL = '*'
+
+# Columns of the tidy forecast frames
+FORECAST_COLUMNS = ['series', 'model', 'step', 'forecast', 'variance', 'lower', 'upper']
+
+
+def series_key(tier, region=ALL, customer_type=ALL):
+    return f'{tier}/{region}/{customer_type}'
+
+
+def parse_series_key(key):
+    tier, region, customer_type = key.split('/')
+    return tier, region, customer_type
+
+
+def all_series_keys(include_totals=False):
+    regions = REGIONS + [ALL] if include_totals else REGIONS
+    customer_types = CUSTOMER_TYPES + [ALL] if include_totals else CUSTOMER_TYPES
+    return [series_key(*combination) for combination in itertools.product(TIERS, regions, customer_types)]
+
+
+# Monthly sums of the given columns (MRR per tier by default) for every (Region, Customer_Type) pair,
+# one column per pair. Months in which a segment has no rows are zero.
+def segment_panel(saas_data, columns=None):
+    columns = [f'MRR_{tier}' for tier in TIERS] if columns is None else columns
+    grouped = saas_data.groupby(['Month', 'Region', 'Customer_Type'], observed=True)[columns].sum()
+    return grouped.unstack(['Region', 'Customer_Type'], fill_value=0).sort_index()
+
+
+def _segment_mask(columns, region=ALL, customer_type=ALL):
+    mask = np.ones(columns.shape[1], dtype=bool)
+    if region != ALL:
+        mask &= columns.columns.get_level_values('Region') == region
+    if customer_type != ALL:
+        mask &= columns.columns.get_level_values('Customer_Type') == customer_type
+    return mask
+
+
+# Sum of the panel columns selected by a region and customer type, each of which may be '*'
+def select_segments(panel, column, region=ALL, customer_type=ALL):
+    columns = panel[column]
+    return columns.loc[:, _segment_mask(columns, region, customer_type)].to_numpy(dtype=float).sum(axis=1)
+
+
+# Whether any segment of the panel has data for the key
+def matches_segments(panel, key):
+    tier, region, customer_type = parse_series_key(key)
+    columns = [f'MRR_{name}' for name in (TIERS if tier == ALL else [tier])]
+    present = panel.columns.get_level_values(0) if len(panel.columns) else []
+    return any(column in present and _segment_mask(panel[column], region, customer_type).any()
+               for column in columns)
+
+
+def panel_series(panel, key):
+    tier, region, customer_type = parse_series_key(key)
+    tiers = TIERS if tier == ALL else [tier]
+    values = sum(select_segments(panel, f'MRR_{name}', region, customer_type) for name in tiers)
+    return pd.Series(values, index=panel.index, name=key)
+
+
+# Series of the keys; keys that match no segment of the data are skipped
+def build_series(saas_data, keys):
+    panel = segment_panel(saas_data)
+    series = {}
+    for key in keys:
+        if matches_segments(panel, key):
+            series[key] = panel_series(panel, key)
+        else:
+            print(f"No data matches series '{key}'; it is skipped.")
+    return series
+
+
+# Fit every requested model to one series, through the model store when one is given. A model that
+# fails to fit is reported instead of stopping the whole batch.
+def fit_series(task):
+    key, values, horizon, model_names, store_dir = task
+    forecasts, errors, fits = [], [], []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for name in model_names:
+            try:
+                if store_dir:
+                    result, how = fit_cached(key, name, values, store_dir=store_dir)
+                else:
+                    result, how = fit_model(name, values), 'cold'
+                forecast = forecast_model(name, result, horizon)
+            except Exception as error:
+                errors.append((key, name, repr(error)))
+                continue
+            fits.append(how)
+            forecast.insert(0, 'model', name)
+            forecast.insert(0, 'series', key)
+            forecasts.append(forecast)
+    return forecasts, errors, fits
+
+
+def default_chunksize(n_tasks, workers):
+    return max(1, n_tasks // ((workers or os.cpu_count() or 1) * 4))
+
+
+# Fit ARIMA, Exponential Smoothing and GARCH to each series (a dict of key -> values) across a process
+# pool and return the forecasts of every series and model, one row per forecast step.
+def forecast_series(series, horizon=12, model_names=MODELS, workers=None, chunksize=None, store_dir=None):
+    tasks = [(key, np.asarray(values, dtype=float), horizon, tuple(model_names), store_dir)
+             for key, values in series.items()]
+    if not tasks:
+        print("No series to forecast.")
+        return pd.DataFrame(columns=FORECAST_COLUMNS)
+    chunksize = chunksize or default_chunksize(len(tasks), workers)
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = list(map(fit_series, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(fit_series, tasks, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    frames = [frame for forecasts, _, _ in results for frame in forecasts]
+    errors = [error for _, series_errors, _ in results for error in series_errors]
+    fits = pd.Series([how for _, _, series_fits in results for how in series_fits], dtype=object)
+    for key, name, message in errors:
+        print(f"Could not fit {name} to {key}: {message}")
+    rate = f" ({len(tasks) / elapsed:.1f} series/s)" if elapsed > 0 else ''
+    print(f"Fitted {len(tasks)} series in {elapsed:.2f}s{rate}.")
+    if store_dir:
+        print("Model fits:", fits.value_counts().to_dict())
+    if not frames:
+        print("No model could be fitted to any series.")
+        return pd.DataFrame(columns=FORECAST_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+# Forecast the MRR of the given segment keys, one tidy frame with a row per series, model and month
+def forecast_batch(saas_data, keys, horizon=12, model_names=MODELS, workers=None, chunksize=None, store_dir=None):
+    series = build_series(saas_data, keys)
+    forecasts = forecast_series({key: values.to_numpy() for key, values in series.items()}, horizon,
+                                model_names, workers, chunksize, store_dir)
+    if forecasts.empty:
+        forecasts.insert(2, 'Month', pd.Series(dtype='datetime64[ns]'))
+        return forecasts
+    last_month = next(iter(series.values())).index[-1]
+    months = pd.date_range(last_month, periods=horizon + 1, freq=pd.offsets.MonthEnd())[1:]
+    forecasts.insert(2, 'Month', months[forecasts['step'].to_numpy() - 1])
+    return forecasts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Forecast MRR per tier, region and customer type.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--series', nargs='+', help="series keys such as 'Basic/Europe/*' (default: all segments)")
+    parser.add_argument('--include-totals', action='store_true', help='also forecast the aggregated series')
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=MODELS)
+    parser.add_argument('--horizon', type=int, default=12)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunksize', type=int)
+    parser.add_argument('--store', help='model store directory; unchanged series reuse their fitted models')
+    parser.add_argument('--output', default='batch_forecasts.csv')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    saas_data = load_validated(args.data) if args.validate else load_saas_data(args.data)
+    keys = args.series or all_series_keys(args.include_totals)
+    forecasts = forecast_batch(saas_data, keys, args.horizon, args.models, args.workers, args.chunksize,
+                               args.store)
+    forecasts.to_csv(args.output, index=False)
+    print(f"Batch forecasts saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
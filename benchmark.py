@@ -0,0 +1,259 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+import numpy as np
+
+DEFAULT_WORK_DIR = '.benchmarks'
+HISTORY_NAME = 'history.json'
+BASELINE_NAME = 'baseline.json'
+
+# Sizes each stage is run at, and the unit its throughput is counted in
+ROW_SIZES = [60, 10_000, 1_000_000, 10_000_000]
+STAGES = {
+    'generate': ('rows', ROW_SIZES),
+    'load': ('rows', ROW_SIZES),
+    'metrics': ('rows', ROW_SIZES),
+    'fit': ('series', [1, 10, 100, 1000]),
+    'sensitivity': ('scenarios', [100, 10_000, 1_000_000]),
+    'simulate': ('paths', [1_000, 100_000, 1_000_000]),
+    'render': ('points', [60, 10_000, 1_000_000]),
+}
+
+# A case is a regression when it is this much slower (or larger) than the baseline, and slower by more
+# than MIN_REGRESSION_SECONDS, which keeps timer noise on tiny cases from being flagged
+REGRESSION_TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def dataset_path(work_dir, rows):
+    return os.path.join(work_dir, f'rows-{rows}.csv')
+
+
+def _generate_dataset(rows, work_dir):
+    from Dataset_Generation import generate_csv
+
+    n_months = min(rows, 60)
+    generate_csv(dataset_path(work_dir, rows), math.ceil(rows / n_months), n_months, seed=0)
+
+
+def _generate_dataset_task(task):
+    _generate_dataset(*task)
+
+
+# Every stage function does its untimed setup and returns the callable that is timed
+
+def _stage_generate(rows, work_dir, workers):
+    return lambda: _generate_dataset(rows, work_dir)
+
+
+def _stage_load(rows, work_dir, workers):
+    from data_loader import read_csv
+
+    return lambda: read_csv(dataset_path(work_dir, rows))
+
+
+def _stage_metrics(rows, work_dir, workers):
+    from data_loader import read_csv
+    from metrics import METRICS, compute
+
+    saas_data = read_csv(dataset_path(work_dir, rows))
+    return lambda: compute(saas_data, list(METRICS))
+
+
+def _tenant_mrr(n_tenants):
+    from Dataset_Generation import generate_chunk
+    from metrics import compute
+
+    chunk = generate_chunk(0, n_tenants, 60, np.random.SeedSequence(0))
+    compute(chunk, ['Total_MRR'])
+    return chunk, chunk['Total_MRR'].to_numpy(dtype=float).reshape(n_tenants, 60)
+
+
+# One Total_MRR series per synthetic tenant, each fitted with all three models
+def _stage_fit(n_series, work_dir, workers):
+    from batch_forecasting import forecast_series
+
+    _, values = _tenant_mrr(n_series)
+    series = {f'tenant-{i}': row for i, row in enumerate(values)}
+    return lambda: forecast_series(series, workers=workers)
+
+
+def _stage_sensitivity(n_scenarios, work_dir, workers):
+    from sensitivity import baseline_from_data, scenario_grid
+
+    chunk, _ = _tenant_mrr(1)
+    baseline = baseline_from_data(chunk)
+    side = math.isqrt(n_scenarios)
+    return lambda: scenario_grid(baseline, np.linspace(0.01, 0.10, side), np.linspace(0.5, 1.5, side), horizon=36)
+
+
+def _stage_simulate(n_paths, work_dir, workers):
+    from monte_carlo import cost_history_from_data, simulate
+
+    chunk, values = _tenant_mrr(1)
+    mean = np.full(12, values[0, -1])
+    variance = np.full(12, values[0].var())
+    return lambda: simulate(mean, variance, cost_history_from_data(chunk), n_paths, workers=workers, seed=0)
+
+
+def _stage_render(n_points, work_dir, workers):
+    from rendering import ChartSpec, render_chart
+
+    y = np.random.default_rng(0).standard_normal(n_points).cumsum()
+    spec = (ChartSpec(os.path.join(work_dir, f'render-{n_points}.png'), 'Random Walk', 'Step', 'Value')
+            .plot(np.arange(n_points), y, label='Random walk'))
+    return lambda: render_chart(spec)
+
+
+STAGE_FUNCTIONS = {
+    'generate': _stage_generate,
+    'load': _stage_load,
+    'metrics': _stage_metrics,
+    'fit': _stage_fit,
+    'sensitivity': _stage_sensitivity,
+    'simulate': _stage_simulate,
+    'render': _stage_render,
+}
+
+
+def _peak_rss_mb():
+    import resource
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / scale
+
+
+# Run one case in the current (fresh) process: peak RSS covers the setup, the stage itself and any
+# worker processes it started
+def run_case(task):
+    stage, size, work_dir, workers = task
+    unit = STAGES[stage][0]
+    timed = STAGE_FUNCTIONS[stage](size, work_dir, workers)
+    start = time.perf_counter()
+    timed()
+    wall = time.perf_counter() - start
+    return {'stage': stage, 'size': size, 'unit': unit, 'wall_s': wall, 'peak_rss_mb': _peak_rss_mb(),
+            'throughput': size / wall if wall else math.inf}
+
+
+def run_suite(stages, work_dir=DEFAULT_WORK_DIR, max_rows=None, max_series=None, quick=False, workers=None):
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    # Every case gets its own process so that peak RSS is measured per case
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for stage in stages:
+            unit, sizes = STAGES[stage]
+            sizes = sizes[:2] if quick else sizes
+            sizes = [size for size in sizes if not (unit == 'rows' and max_rows and size > max_rows)
+                     and not (unit == 'series' and max_series and size > max_series)]
+            for size in sizes:
+                if stage in ('load', 'metrics') and not os.path.exists(dataset_path(work_dir, size)):
+                    executor.submit(_generate_dataset_task, (size, work_dir)).result()
+                result = executor.submit(run_case, (stage, size, work_dir, workers)).result()
+                print(f"{stage:<12} {size:>10} {unit:<9} {result['wall_s']:9.3f}s "
+                      f"{result['peak_rss_mb']:9.1f} MB {result['throughput']:14,.0f} {unit}/s")
+                results.append(result)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_run(results):
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path, value):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(value, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+# Compare a run with the baseline case by case
+def find_regressions(run, baseline, tolerance=REGRESSION_TOLERANCE, min_seconds=MIN_REGRESSION_SECONDS):
+    current = pd.DataFrame(run['results']).set_index(['stage', 'size'])
+    previous = pd.DataFrame(baseline['results']).set_index(['stage', 'size'])
+    both = current.join(previous[['wall_s', 'peak_rss_mb']], rsuffix='_baseline', how='inner')
+    both['wall_ratio'] = both['wall_s'] / both['wall_s_baseline']
+    both['rss_ratio'] = both['peak_rss_mb'] / both['peak_rss_mb_baseline']
+    slower = (both['wall_ratio'] > 1 + tolerance) & (both['wall_s'] - both['wall_s_baseline'] > min_seconds)
+    larger = both['rss_ratio'] > 1 + tolerance
+    both['regression'] = np.where(slower & larger, 'time+memory', np.where(slower, 'time', np.where(larger, 'memory', '')))
+    return both.reset_index()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage at growing sizes.')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--quick', action='store_true', help='only the two smallest sizes of every stage')
+    parser.add_argument('--max-rows', type=int, help='skip row counts above this')
+    parser.add_argument('--max-series', type=int, help='skip series counts above this')
+    parser.add_argument('--workers', type=int, help='worker processes for the parallel stages')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR, help='datasets, charts, history and baseline')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_suite(args.stages, args.work_dir, args.max_rows, args.max_series, args.quick, args.workers)
+    run = make_run(results)
+
+    history_path = os.path.join(args.work_dir, HISTORY_NAME)
+    save_json(history_path, load_json(history_path, []) + [run])
+    print(f"Benchmark results appended to '{history_path}'.")
+
+    baseline_path = os.path.join(args.work_dir, BASELINE_NAME)
+    baseline = load_json(baseline_path, None)
+    regressions = pd.DataFrame()
+    if baseline is not None:
+        comparison = find_regressions(run, baseline, args.tolerance)
+        print(f"Compared with the baseline from {baseline['timestamp']} ({baseline['commit']}):\n",
+              comparison[['stage', 'size', 'wall_s', 'wall_ratio', 'peak_rss_mb', 'rss_ratio', 'regression']]
+              .to_string(index=False))
+        regressions = comparison[comparison['regression'] != '']
+    if args.save_baseline or baseline is None:
+        save_json(baseline_path, run)
+        print(f"Baseline saved as '{baseline_path}'.")
+
+    if len(regressions):
+        print(f"{len(regressions)} regressions against the baseline.")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
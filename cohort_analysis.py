@@ -0,0 +1,193 @@
+import argparse
+import time
+
+import pandas as pd
+import numpy as np
+
+from data_loader import load_saas_data
+from metrics import CANCELLATION_COLUMNS, MRR_COLUMNS, NEW_SUBSCRIBER_COLUMNS, TIERS
+from metrics_store import MetricsStore
+
+# Event-level input: one row per customer subscription. End_Month is the first month the customer is
+# no longer subscribed (empty while still active); MRR is the customer's monthly revenue.
+EVENT_COLUMNS = ['Customer_ID', 'Tier', 'Start_Month', 'End_Month', 'MRR']
+
+# Months at the end of the observed retention curve used to estimate the churn hazard beyond it
+TAIL_MONTHS = 12
+
+
+def month_number(dates):
+    dates = pd.DatetimeIndex(dates)
+    return np.where(dates.isna(), -1, dates.year * 12 + dates.month - 1)
+
+
+# Sum the dataset over tenants, one row per month; missing totals are taken between their neighbours
+def monthly_totals(saas_data):
+    columns = NEW_SUBSCRIBER_COLUMNS + CANCELLATION_COLUMNS + MRR_COLUMNS
+    if isinstance(saas_data, MetricsStore):
+        totals = saas_data.monthly_totals().frame(columns)
+    else:
+        totals = saas_data.groupby('Month')[columns].sum(min_count=1).sort_index()
+    return totals.astype(float).interpolate(limit_direction='both').round().astype(np.int64)
+
+
+# Expand the monthly aggregates into cohorts of customers: every month's new subscribers form a cohort
+# and that month's cancellations end the subscriptions of customers drawn at random from those already
+# active (a multivariate hypergeometric draw over the active cohorts, the same as drawing individual
+# customers, without materialising them). Customers pay the tier's revenue per active customer of the
+# month they signed up. Returns the same retention triangles as cohort_tables().
+def tables_from_aggregates(saas_data, seed=None):
+    totals = monthly_totals(saas_data)
+    n_months = len(totals)
+    rng = np.random.default_rng(seed)
+    cohort = np.arange(n_months)
+    tables = {}
+    for tier, new_column, cancel_column, mrr_column in zip(TIERS, NEW_SUBSCRIBER_COLUMNS, CANCELLATION_COLUMNS,
+                                                            MRR_COLUMNS):
+        new = totals[new_column].to_numpy()
+        cancelled = totals[cancel_column].to_numpy()
+        active = np.zeros(n_months, dtype=np.int64)
+        customers = np.full((n_months, n_months), np.nan)
+        for t in range(n_months):
+            if t and cancelled[t]:
+                active[:t] -= rng.multivariate_hypergeometric(active[:t], min(cancelled[t], active[:t].sum()))
+            active[t] = new[t]
+            customers[cohort[:t + 1], t - cohort[:t + 1]] = active[:t + 1]
+
+        # Calendar month of every (cohort, age) cell, used to look up each cohort's total active customers
+        calendar = np.add.outer(cohort, cohort)
+        observed = calendar < n_months
+        active_total = np.zeros(n_months)
+        np.add.at(active_total, calendar[observed], customers[observed])
+        arpu = totals[mrr_column].to_numpy() / np.maximum(active_total, 1)
+        tables[tier] = {'cohorts': totals.index, 'customers': customers, 'revenue': customers * arpu[:, None]}
+    return tables
+
+
+def read_events(path):
+    events = pd.read_csv(path, usecols=EVENT_COLUMNS, parse_dates=['Start_Month', 'End_Month'])
+    events['Tier'] = pd.Categorical(events['Tier'], categories=TIERS)
+    return events
+
+
+# Customer and revenue retention triangles, shape (cohort, age). Each subscription adds +1 (and +MRR)
+# at its start age and -1 (-MRR) at the age it ends; a cumulative sum along the age axis turns these
+# differences into the number of customers (and revenue) still active at every age. Cells beyond the
+# last observed month are NaN.
+def retention_triangle(start, end, mrr, n_months):
+    start = np.asarray(start, dtype=np.int64)
+    end = np.where(np.asarray(end) < 0, n_months, end).astype(np.int64)
+    mrr = np.asarray(mrr, dtype=np.float64)
+    width = n_months + 1
+    index = np.concatenate([start * width, start * width + (end - start)])
+    counts = np.bincount(index, weights=np.repeat([1.0, -1.0], len(start)), minlength=n_months * width)
+    revenue = np.bincount(index, weights=np.concatenate([mrr, -mrr]), minlength=n_months * width)
+    counts = np.cumsum(counts.reshape(n_months, width), axis=1)[:, :n_months]
+    revenue = np.cumsum(revenue.reshape(n_months, width), axis=1)[:, :n_months]
+
+    observed = np.add.outer(np.arange(n_months), np.arange(n_months)) < n_months
+    return np.where(observed, counts, np.nan), np.where(observed, revenue, np.nan)
+
+
+# Retention triangles per tier, with cohorts and ages counted in months from the first start month
+def cohort_tables(events):
+    start = month_number(events['Start_Month'])
+    end = month_number(events['End_Month'])
+    origin = start.min()
+    n_months = int(max(start.max(), end.max()) - origin + 1)
+    end = np.where(end < 0, -1, end - origin)
+    cohorts = pd.date_range(events['Start_Month'].min(), periods=n_months, freq=pd.offsets.MonthEnd())
+
+    tables = {}
+    tiers = events['Tier'].cat.codes.to_numpy()
+    for code, tier in enumerate(events['Tier'].cat.categories):
+        mask = tiers == code
+        if mask.any():
+            counts, revenue = retention_triangle(start[mask] - origin, end[mask], events['MRR'].to_numpy()[mask],
+                                                 n_months)
+            tables[tier] = {'cohorts': cohorts, 'customers': counts, 'revenue': revenue}
+    return tables
+
+
+# Share of a cohort still active (or of its starting revenue still billed) at every age, pooled over
+# the cohorts observed at that age
+def retention_curve(triangle):
+    observed = ~np.isnan(triangle)
+    initial = np.where(observed, triangle[:, :1], 0).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nansum(triangle, axis=0) / initial
+
+
+# Expected revenue per customer over their lifetime: revenue per starting customer at every observed
+# age, plus a geometric tail whose monthly retention is estimated from the last TAIL_MONTHS ages
+def lifetime_value(customers, revenue, discount_rate=0.0, tail_months=TAIL_MONTHS):
+    observed = ~np.isnan(customers)
+    starters = np.where(observed, customers[:, :1], 0).sum(axis=0)
+    valid = starters > 0
+    revenue_per_customer = np.nansum(revenue, axis=0)[valid] / starters[valid]
+    survival = retention_curve(customers)[valid]
+    discount = (1 + discount_rate) ** -np.arange(len(revenue_per_customer))
+    value = float((revenue_per_customer * discount).sum())
+
+    tail = survival[-tail_months - 1:]
+    if len(tail) > 1 and tail[0] > 0 and tail[-1] > 0:
+        monthly = (tail[-1] / tail[0]) ** (1 / (len(tail) - 1)) / (1 + discount_rate)
+        if monthly < 1:
+            arpu = revenue_per_customer[-1] / survival[-1]
+            value += arpu * survival[-1] * discount[-1] * monthly / (1 - monthly)
+    return value
+
+
+def tier_clv(tables, discount_rate=0.0):
+    return {tier: lifetime_value(table['customers'], table['revenue'], discount_rate)
+            for tier, table in tables.items()}
+
+
+def cohort_frame(tables):
+    frames = []
+    for tier, table in tables.items():
+        n_months = len(table['cohorts'])
+        cohort, age = np.divmod(np.arange(n_months * n_months), n_months)
+        frame = pd.DataFrame({'Tier': tier, 'Cohort': table['cohorts'][cohort], 'Age': age,
+                              'Customers': table['customers'].ravel(), 'Revenue': table['revenue'].ravel()})
+        frame = frame.dropna()
+        first = frame.groupby('Cohort')[['Customers', 'Revenue']].transform('first')
+        frame['Retention'] = frame['Customers'] / first['Customers']
+        frame['Revenue_Retention'] = frame['Revenue'] / first['Revenue']
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Cohort retention and per-tier CLV.')
+    parser.add_argument('--data', default='saas_dataset.csv', help='monthly dataset expanded into cohorts')
+    parser.add_argument('--events', help=f"event-level CSV with columns {', '.join(EVENT_COLUMNS)}")
+    parser.add_argument('--seed', type=int, default=0, help='seed for expanding the monthly aggregates')
+    parser.add_argument('--discount-rate', type=float, default=0.0, help='monthly discount rate for CLV')
+    parser.add_argument('--output', default='cohort_retention.csv')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    if args.events:
+        events = read_events(args.events)
+        tables = cohort_tables(events)
+        n_customers = len(events)
+    else:
+        tables = tables_from_aggregates(load_saas_data(args.data), args.seed)
+        n_customers = int(sum(np.nansum(table['customers'][:, 0]) for table in tables.values()))
+    elapsed = time.perf_counter() - start
+    print(f"Built retention triangles for {n_customers} customers in {elapsed:.2f}s.")
+
+    for tier, clv in tier_clv(tables, args.discount_rate).items():
+        retention = retention_curve(tables[tier]['customers'])
+        print(f"{tier}: 12-month retention {retention[min(12, len(retention) - 1)]:.1%}, CLV ${clv:,.2f}")
+
+    cohort_frame(tables).to_csv(args.output, index=False)
+    print(f"Cohort retention saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
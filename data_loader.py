@@ -0,0 +1,162 @@
+import glob
+import hashlib
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+import profiling
+from Dataset_Generation import CATEGORICAL_COLUMNS, CSV_DATE_FORMAT
+
+# Explicit column types, so nothing is left to dtype inference
+INT_COLUMNS = [
+    'New_Subscribers_Basic', 'New_Subscribers_Premium', 'New_Subscribers_Enterprise',
+    'Cancellations_Basic', 'Cancellations_Premium', 'Cancellations_Enterprise',
+    'MRR_Basic', 'MRR_Premium', 'MRR_Enterprise',
+    'Marketing_Spend', 'New_Customers', 'Fixed_Costs', 'Variable_Costs',
+    'One_Time_Fees', 'Discounts_Given', 'Upsell_Completed', 'NPS_Score',
+    'Monthly_Active_Users', 'Additional_Features_Purchased',
+]
+FLOAT_COLUMNS = [
+    'Churn_Rate_Basic', 'Churn_Rate_Premium', 'Churn_Rate_Enterprise',
+    'Churn_Recovery_Rate', 'Upsell_Rate',
+]
+
+SCHEMA = {'Tenant_ID': np.int32}
+SCHEMA.update({column: np.int32 for column in INT_COLUMNS})
+SCHEMA.update({column: np.float32 for column in FLOAT_COLUMNS})
+SCHEMA.update({column: pd.CategoricalDtype(categories) for column, categories in CATEGORICAL_COLUMNS.items()})
+
+DEFAULT_CACHE_DIR = '.cache'
+
+
+# Content hash of the file. The hash is kept in `index_path` with the file's size and mtime, and the
+# file is only read again when either of them changed.
+def file_fingerprint(path, index_path=None, block_size=1 << 20):
+    stat = os.stat(path)
+    key = [stat.st_size, stat.st_mtime_ns]
+    if index_path is not None and os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get('stat') == key:
+            return index['fingerprint']
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    fingerprint = digest.hexdigest()
+    if index_path is not None:
+        with open(index_path, 'w') as f:
+            json.dump({'stat': key, 'fingerprint': fingerprint}, f)
+    return fingerprint
+
+
+# Schema type of every column that can hold it. Integer columns with missing values stay float, as
+# pandas reads them, and malformed numbers stay as read, so a blank or bad cell shows up as a missing
+# value and in the data quality checks instead of failing the load. Categorical columns keep every
+# code read; apply_schema() narrows them to the schema's categories.
+def schema_dtypes(frame):
+    dtypes = {}
+    for column, dtype in SCHEMA.items():
+        if column not in frame.columns:
+            continue
+        values = frame[column]
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtypes[column] = 'category'
+        elif dtype == np.int32 and pd.api.types.is_integer_dtype(values.dtype):
+            dtypes[column] = dtype
+        elif dtype == np.int32 and pd.api.types.is_float_dtype(values.dtype):
+            numbers = values.to_numpy()
+            if not np.isnan(numbers).any() and np.array_equal(numbers, np.round(numbers)):
+                dtypes[column] = dtype
+        elif dtype == np.float32 and pd.api.types.is_numeric_dtype(values.dtype):
+            dtypes[column] = dtype
+    return dtypes
+
+
+# Without known_categories the categorical columns keep the codes outside the schema, for the data
+# quality checks to report them; otherwise those codes become missing values
+def apply_schema(frame, known_categories=True):
+    frame = frame.astype(schema_dtypes(frame))
+    if known_categories:
+        for column, categories in CATEGORICAL_COLUMNS.items():
+            if column in frame.columns:
+                frame[column] = frame[column].cat.set_categories(categories)
+    if not pd.api.types.is_datetime64_any_dtype(frame['Month']):
+        frame['Month'] = pd.to_datetime(frame['Month'], format=CSV_DATE_FORMAT)
+    return frame
+
+
+# Categorical columns are parsed as categories, with every code read; numeric columns are parsed as
+# pandas infers them and downcast once their missing values are known
+def read_csv(path, known_categories=True, **kwargs):
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {column: 'category' for column in header if isinstance(SCHEMA.get(column), pd.CategoricalDtype)}
+    with profiling.stage('read csv', path=str(path)):
+        frame = pd.read_csv(path, dtype=dtypes, low_memory=False, **kwargs)
+    with profiling.stage('parse dates'):
+        frame['Month'] = pd.to_datetime(frame['Month'], format=CSV_DATE_FORMAT)
+    with profiling.stage('apply schema'):
+        return apply_schema(frame, known_categories)
+
+
+# Partitioned output from Dataset_Generation.py (a directory or a glob of Parquet files)
+def read_parquet(path, known_categories=True):
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '*.parquet')))
+    else:
+        files = sorted(glob.glob(path))
+    return apply_schema(pd.concat([pd.read_parquet(f) for f in files], ignore_index=True), known_categories)
+
+
+def _read_cache(cache_path):
+    import pyarrow as pa
+
+    with profiling.stage('read cache', path=cache_path):
+        with pa.memory_map(cache_path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas(split_blocks=True)
+
+
+def _write_cache(frame, cache_path):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    tmp_path = cache_path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, cache_path)
+
+
+# Load the SaaS dataset with the explicit schema. CSV sources are parsed once and cached as an
+# Arrow file keyed by the source's path and content hash; later runs memory-map the cache. Codes of
+# categorical columns outside the schema are read as missing unless known_categories is false.
+def load_saas_data(path='saas_dataset.csv', cache_dir=DEFAULT_CACHE_DIR, use_cache=True, known_categories=True):
+    if os.path.isdir(path) or path.endswith('.parquet'):
+        return read_parquet(path, known_categories)
+    if not use_cache:
+        return read_csv(path, known_categories)
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return read_csv(path, known_categories)
+
+    # Files of the same name in other directories have caches of their own
+    stem = os.path.splitext(os.path.basename(path))[0]
+    stem += '-' + hashlib.blake2b(os.path.abspath(path).encode(), digest_size=4).hexdigest()
+    os.makedirs(cache_dir, exist_ok=True)
+    fingerprint = file_fingerprint(path, os.path.join(cache_dir, f'{stem}.json'))
+    cache_path = os.path.join(cache_dir, f'{stem}-{fingerprint}.arrow')
+    if os.path.exists(cache_path):
+        saas_data = _read_cache(cache_path)
+    else:
+        # The cache keeps every code read, so it serves both kinds of load
+        saas_data = read_csv(path, known_categories=False)
+        for stale in glob.glob(os.path.join(cache_dir, f'{stem}-*.arrow')):
+            os.remove(stale)
+        _write_cache(saas_data, cache_path)
+    return apply_schema(saas_data, known_categories)
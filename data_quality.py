@@ -0,0 +1,416 @@
+import argparse
+import glob
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import profiling
+from Dataset_Generation import CATEGORICAL_COLUMNS, COLUMNS, CSV_DATE_FORMAT
+from data_loader import FLOAT_COLUMNS, INT_COLUMNS, apply_schema, load_saas_data
+
+# Checks and what failing them means: an 'error' quarantines the partition, a 'warning' is only reported.
+# Partitions are the tenants, or the whole dataset ('*') when it has no Tenant_ID column; the whole
+# dataset is one series, so only its failing rows are quarantined.
+CHECKS = {
+    'missing_column': 'error',
+    'unexpected_column': 'warning',
+    'missing_month': 'error',
+    'missing': 'error',
+    'malformed': 'error',
+    'not_integer': 'error',
+    'unknown_category': 'error',
+    'bad_month': 'error',
+    'out_of_range': 'error',
+    'duplicate_month': 'error',
+    'month_gap': 'error',
+    'not_month_end': 'warning',
+    'zero_denominator': 'warning',
+    'robust_z': 'warning',
+    'rolling_mad': 'warning',
+    'extreme_z': 'error',
+}
+WHOLE_DATASET = '*'
+# Errors that keep rows from being loaded at all, as opposed to errors in their values. Analysis that
+# reports bad values quarantines only these (see quarantine()).
+STRUCTURAL_CHECKS = ['missing_column', 'missing_month', 'bad_month', 'duplicate_month', 'month_gap']
+# Errors in single values; analysis that keeps their rows reads these values as missing
+VALUE_CHECKS = ['malformed', 'not_integer', 'unknown_category', 'out_of_range', 'extreme_z']
+QUARANTINE_LEVELS = ['errors', 'structure']
+
+NUMERIC_COLUMNS = INT_COLUMNS + FLOAT_COLUMNS
+# Allowed (low, high) values; counts, amounts and costs cannot be negative and rates are shares
+RANGES = {column: (0, np.inf) for column in INT_COLUMNS}
+RANGES.update({column: (0, 1) for column in FLOAT_COLUMNS})
+RANGES['NPS_Score'] = (0, 10)
+# Denominators of derived metrics: CLV divides by the Basic churn rate, the cost per customer and the
+# upsell success rate by the new customers
+DENOMINATORS = ['Churn_Rate_Basic', 'New_Customers']
+
+# Robust z-scores above this are outliers, against the partition's median and median absolute deviation
+# (MAD) and against the median and MAD of the preceding `window` months
+DEFAULT_THRESHOLD = 5.0
+DEFAULT_WINDOW = 12
+# Robust z-scores above this, against the whole partition, are errors: far beyond any value of the
+# generated data (below 8), so a value that cannot be right and is kept out of the fits
+ERROR_THRESHOLD = 10.0
+# Partitions with a larger share of outlying values are quarantined as well
+MAX_OUTLIER_SHARE = 0.02
+# Rows per chunk; whole partitions are kept in one chunk
+DEFAULT_CHUNK_ROWS = 50_000
+
+# The MAD scaled to the standard deviation of normal data, and the mean absolute deviation likewise for
+# columns whose MAD is zero
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+
+# Partitions hold one row per month: the rows of a tenant, or all rows without tenants
+def partition_columns(frame):
+    return ['Tenant_ID'] if 'Tenant_ID' in frame.columns else []
+
+
+# Partition code of every row and the label of every partition
+def partition_codes(frame, by):
+    if not by:
+        return np.zeros(len(frame), dtype=np.int64), np.array([WHOLE_DATASET], dtype=object)
+    codes = frame.groupby(by, sort=True, observed=True, dropna=False).ngroup().to_numpy()
+    first = np.unique(codes, return_index=True)[1]
+    labels = frame[by[0]].iloc[first].astype(str).to_numpy(dtype=object)
+    for column in by[1:]:
+        labels = labels + '/' + frame[column].iloc[first].astype(str).to_numpy(dtype=object)
+    return codes, labels
+
+
+def _numeric(values):
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        numbers = values.to_numpy(dtype=float, na_value=np.nan)
+        return numbers, np.zeros(len(values), dtype=bool)
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return numbers, np.isnan(numbers) & values.notna().to_numpy()
+
+
+def _months(values):
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return pd.DatetimeIndex(values), np.zeros(len(values), dtype=bool)
+    months = pd.DatetimeIndex(pd.to_datetime(values, format=CSV_DATE_FORMAT, errors='coerce'))
+    return months, months.isna() & values.notna().to_numpy()
+
+
+# Median and scale of the values along `axis`. NaN (padding or missing values) is skipped, and only
+# arrays that hold any pay for the slower NaN-aware medians.
+def _robust_center(values, axis):
+    median = np.nanmedian if np.isnan(values).any() else np.median
+    center = median(values, axis=axis, keepdims=True)
+    deviation = np.abs(values - center)
+    scale = MAD_SCALE * median(deviation, axis=axis, keepdims=True)
+    zero = scale == 0
+    if zero.any():
+        with np.errstate(invalid='ignore'):
+            scale = np.where(zero, MEAN_AD_SCALE * np.nanmean(deviation, axis=axis, keepdims=True), scale)
+    # Constant values have no outliers
+    scale[scale == 0] = np.nan
+    return center, scale
+
+
+# Outlying values of every partition and column, shape (partitions, months, columns), against the
+# whole partition and against the trailing window, and the values beyond error_threshold of the partition
+def _outliers(panel, window, threshold, error_threshold):
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        # Windows of padding only have no median
+        warnings.simplefilter('ignore', RuntimeWarning)
+        center, scale = _robust_center(panel, axis=1)
+        z = np.abs(panel - center) / scale
+        robust, extreme = z > threshold, z > error_threshold
+
+        rolling = np.zeros_like(robust)
+        if panel.shape[1] > window:
+            # Window i holds months i .. i + window - 1 and is compared with month i + window. The few
+            # months of a window give a noisy MAD, so its scale is at least the whole partition's: a value
+            # is flagged when it is far from the recent level in terms of the column's usual spread.
+            windows = sliding_window_view(panel, window, axis=1)[:, :-1]
+            rolling_center, rolling_scale = _robust_center(windows, axis=-1)
+            rolling_scale = np.fmax(rolling_scale[..., 0], scale)
+            rolling[:, window:] = np.abs(panel[:, window:] - rolling_center[..., 0]) / rolling_scale > threshold
+    return robust, rolling, extreme
+
+
+# Every check on the rows of some whole partitions. Returns the issues (one row per partition, check and
+# column with the number of rows flagged and the first of them), the partition summary, the errors of
+# every row and the rows of every column with errors in their values.
+def scan_chunk(task):
+    frame, codes, labels, window, threshold, error_threshold = task
+    start = time.perf_counter()
+    n_partitions = len(labels)
+    flagged = []
+
+    def flag(check, column, rows):
+        if len(rows):
+            flagged.append((check, column, rows))
+
+    # Schema: missing and malformed values, fractional counts and unknown categories
+    numeric = [column for column in NUMERIC_COLUMNS if column in frame.columns]
+    values = np.empty((len(frame), len(numeric)))
+    for j, column in enumerate(numeric):
+        values[:, j], malformed = _numeric(frame[column])
+        flag('missing', column, np.flatnonzero(frame[column].isna().to_numpy()))
+        flag('malformed', column, np.flatnonzero(malformed))
+    months, bad_months = _months(frame['Month'])
+    flag('missing_month', 'Month', np.flatnonzero(frame['Month'].isna().to_numpy()))
+    flag('bad_month', 'Month', np.flatnonzero(bad_months))
+    for column, categories in CATEGORICAL_COLUMNS.items():
+        if column in frame.columns:
+            present = frame[column].notna().to_numpy()
+            flag('missing', column, np.flatnonzero(~present))
+            flag('unknown_category', column, np.flatnonzero(present & ~frame[column].isin(categories).to_numpy()))
+
+    # Ranges and zero denominators, all numeric columns at once
+    with np.errstate(invalid='ignore'):
+        low = np.array([RANGES[column][0] for column in numeric])
+        high = np.array([RANGES[column][1] for column in numeric])
+        is_int = np.isin(numeric, INT_COLUMNS)
+        checks = [('out_of_range', (values < low) | (values > high)),
+                  ('not_integer', is_int & (values != np.round(values)) & ~np.isnan(values)),
+                  ('zero_denominator', np.isin(numeric, DENOMINATORS) & (values == 0))]
+    for check, cells in checks:
+        rows, columns = np.nonzero(cells)
+        for j in np.unique(columns):
+            flag(check, numeric[j], rows[columns == j])
+
+    # Date continuity: rows in partition and month order, each month following the previous one
+    ordinal = (months.year * 12 + months.month).to_numpy(dtype=float, na_value=np.nan)
+    order = np.lexsort((np.nan_to_num(ordinal, nan=np.inf), codes))
+    sorted_codes, sorted_ordinal = codes[order], ordinal[order]
+    same = sorted_codes[1:] == sorted_codes[:-1]
+    step = sorted_ordinal[1:] - sorted_ordinal[:-1]
+    flag('duplicate_month', 'Month', order[1:][same & (step == 0)])
+    flag('month_gap', 'Month', order[1:][same & (step > 1)])
+    flag('not_month_end', 'Month', np.flatnonzero(~months.is_month_end & ~months.isna()))
+
+    # Outliers of every column within its partition, on a (partitions, months, columns) panel; shorter
+    # partitions are padded with NaN
+    sizes = np.bincount(codes, minlength=n_partitions)
+    first = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    position = np.arange(len(order)) - first[sorted_codes]
+    panel = np.full((n_partitions, sizes.max(initial=0), len(numeric)), np.nan, dtype=np.float32)
+    panel[sorted_codes, position] = values[order]
+    robust, rolling, extreme = _outliers(panel, window, threshold, error_threshold)
+    for check, cells in [('robust_z', robust), ('rolling_mad', rolling), ('extreme_z', extreme)]:
+        partitions, positions, columns = np.nonzero(cells)
+        rows = order[first[partitions] + positions]
+        for j in np.unique(columns):
+            flag(check, numeric[j], rows[columns == j])
+    outlying = np.bincount(np.nonzero(robust | rolling)[0], minlength=n_partitions)
+
+    # Per row: 0 fine, 1 an error in its values, 2 a row that cannot be loaded. A month gap is an error of
+    # the partition; the month after it is fine.
+    row_errors = np.zeros(len(frame), dtype=np.int8)
+    bad_values = {}
+    broken = np.zeros(n_partitions, dtype=bool)
+    issues = []
+    flag_counts = {'error': np.zeros(n_partitions, dtype=np.int64), 'warning': np.zeros(n_partitions, dtype=np.int64)}
+    for check, column, rows in flagged:
+        if check in STRUCTURAL_CHECKS:
+            broken[codes[rows]] = True
+            if check != 'month_gap':
+                row_errors[rows] = 2
+        elif CHECKS[check] == 'error':
+            row_errors[rows] = np.maximum(row_errors[rows], 1)
+        if check in VALUE_CHECKS:
+            bad_values.setdefault(column, []).append(rows)
+        counts = pd.DataFrame({'partition': codes[rows], 'row': rows}).groupby('partition')['row'].agg(['size', 'min'])
+        issues.append(pd.DataFrame({
+            'partition': labels[counts.index], 'check': check, 'severity': CHECKS[check], 'column': column,
+            'count': counts['size'].to_numpy(), 'first_month': months[counts['min']],
+            'example': frame[column].iloc[counts['min']].to_numpy(dtype=object),
+        }))
+        flag_counts[CHECKS[check]][counts.index] += counts['size'].to_numpy()
+    summary = pd.DataFrame({'partition': labels, 'rows': sizes, 'errors': flag_counts['error'],
+                            'warnings': flag_counts['warning'],
+                            'outlier_share': outlying / np.maximum(sizes * len(numeric), 1), 'broken': broken})
+    profiling.record('scan chunk', start, time.perf_counter(), rows=len(frame), partitions=n_partitions)
+    bad_values = {column: np.unique(np.concatenate(rows)) for column, rows in bad_values.items()}
+    return issues, summary, row_errors, bad_values
+
+
+# Row indices of groups of whole partitions with about `chunk_rows` rows each
+def _chunks(codes, chunk_rows):
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes)
+    chunk_of_partition = (np.cumsum(sizes) - sizes) // chunk_rows
+    bounds = np.searchsorted(chunk_of_partition[codes[order]], np.unique(chunk_of_partition), side='left')
+    return np.split(order, bounds[1:])
+
+
+# Run every check on the dataset, chunks of whole partitions in parallel. Returns the issues found
+# (compact: one row per partition, check and column), one row per partition saying whether it is broken
+# (a structural error) or quarantined (any error, or a share of outlying values above max_outlier_share),
+# the errors of every row as scan_chunk() grades them and a mask of the values with errors.
+def scan(saas_data, by=None, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD,
+         max_outlier_share=MAX_OUTLIER_SHARE, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None,
+         error_threshold=ERROR_THRESHOLD):
+    by = partition_columns(saas_data) if by is None else list(by)
+    codes, labels = partition_codes(saas_data, by)
+
+    frame_issues = []
+    expected = set(COLUMNS) | set(by) | {'Tenant_ID'}
+    for check, columns in [('missing_column', [c for c in COLUMNS if c not in saas_data.columns]),
+                           ('unexpected_column', [c for c in saas_data.columns if c not in expected])]:
+        for column in columns:
+            frame_issues.append({'partition': WHOLE_DATASET, 'check': check, 'severity': CHECKS[check],
+                                 'column': column, 'count': len(saas_data)})
+    if 'Month' not in saas_data.columns:
+        raise ValueError("the dataset has no 'Month' column")
+
+    tasks, chunks = [], _chunks(codes, chunk_rows)
+    for rows in chunks:
+        chunk_codes, local = np.unique(codes[rows], return_inverse=True)
+        tasks.append((saas_data.iloc[rows].reset_index(drop=True), local, labels[chunk_codes], window, threshold,
+                      error_threshold))
+    with profiling.stage('data quality scan', rows=len(saas_data), chunks=len(tasks)):
+        if workers == 1 or len(tasks) == 1:
+            results = list(map(scan_chunk, tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(scan_chunk, tasks))
+
+    issues = [frame for chunk_issues, _, _, _ in results for frame in chunk_issues]
+    if frame_issues:
+        issues.append(pd.DataFrame(frame_issues))
+    columns = ['partition', 'check', 'severity', 'column', 'count', 'first_month', 'example']
+    issues = pd.concat(issues, ignore_index=True).reindex(columns=columns) if issues else pd.DataFrame(columns=columns)
+    partitions = pd.concat([summary for _, summary, _, _ in results], ignore_index=True)
+    partitions['quarantined'] = (partitions['errors'] > 0) | (partitions['outlier_share'] > max_outlier_share)
+    row_errors = np.zeros(len(saas_data), dtype=np.int8)
+    bad_values = {}
+    for rows, (_, _, chunk_errors, chunk_values) in zip(chunks, results):
+        row_errors[rows] = chunk_errors
+        for column, value_rows in chunk_values.items():
+            bad_values.setdefault(column, np.zeros(len(saas_data), dtype=bool))[rows[value_rows]] = True
+    bad_values = pd.DataFrame(bad_values, index=saas_data.index)
+    if any(issue['check'] == 'missing_column' for issue in frame_issues):
+        partitions[['broken', 'quarantined']] = True
+        row_errors[:] = 2
+    return issues, partitions, row_errors, bad_values
+
+
+# The rows that passed and the rows that are quarantined: the partitions with errors (level 'errors') or
+# only those that cannot be loaded (level 'structure'). Without tenants, the failing rows. At level
+# 'structure' the values with errors in the rows that passed are set to missing.
+def quarantine(saas_data, partitions, row_errors, bad_values, level='errors'):
+    by = partition_columns(saas_data)
+    if by:
+        codes, labels = partition_codes(saas_data, by)
+        failing = partitions.loc[partitions['quarantined' if level == 'errors' else 'broken'], 'partition']
+        bad = np.isin(labels, failing.to_numpy())[codes]
+    else:
+        bad = row_errors >= (1 if level == 'errors' else 2)
+    passed = saas_data[~bad]
+    if level == 'structure' and not bad_values.empty:
+        passed = passed.copy()
+        for column in bad_values.columns:
+            passed[column] = passed[column].mask(bad_values[column].to_numpy()[~bad])
+    return passed.reset_index(drop=True), saas_data[bad].reset_index(drop=True)
+
+
+# Rows as stored, without the schema's types when the source cannot hold them (months that fail to
+# parse fail the typed read). Codes outside the categories of the schema are kept for the checks.
+def read_for_scan(path):
+    try:
+        return load_saas_data(path, known_categories=False)
+    except (ValueError, TypeError):
+        if os.path.isdir(path):
+            path = os.path.join(path, '*.parquet')
+        if path.endswith('.parquet'):
+            return pd.concat([pd.read_parquet(f) for f in sorted(glob.glob(path))], ignore_index=True)
+        return pd.read_csv(path, low_memory=False)
+
+
+def print_summary(issues, partitions, quarantined):
+    print(f"Data quality: {partitions['rows'].sum()} rows in {len(partitions)} partitions, "
+          f"{partitions['errors'].sum()} errors, {partitions['warnings'].sum()} warnings, "
+          f"{len(quarantined)} rows quarantined.")
+    if len(issues):
+        by_check = issues.groupby(['check', 'severity'], sort=False).agg(
+            values=('count', 'sum'), partitions=('partition', 'nunique'), columns=('column', 'nunique'))
+        print(by_check.to_string())
+    by = partition_columns(quarantined)
+    if by and len(quarantined):
+        names = partition_codes(quarantined, by)[1].tolist()
+        print("Quarantined:", ', '.join(names[:10]) + (f" and {len(names) - 10} more" if len(names) > 10 else ''))
+
+
+# Without tenants the data is one monthly series and the models need every month of it: the months
+# quarantined or missing are filled in between their neighbours, counts rounded, categories left missing
+def fill_months(saas_data):
+    periods = saas_data['Month'].dt.to_period('M')
+    filled = saas_data.set_index(periods).reindex(pd.period_range(periods.min(), periods.max(), freq='M'))
+    month_ends = filled.index.to_timestamp(how='end').normalize()
+    filled['Month'] = filled['Month'].fillna(pd.Series(month_ends, index=filled.index))
+    numeric = [column for column in NUMERIC_COLUMNS if column in filled.columns]
+    integers = [column for column in INT_COLUMNS if column in filled.columns]
+    filled[numeric] = filled[numeric].astype(float).interpolate(limit_direction='both')
+    filled[integers] = filled[integers].round()
+    return apply_schema(filled.reset_index(drop=True))
+
+
+# Load the dataset for analysis and forecasting: scan it and leave out the quarantined rows. At level
+# 'structure' rows with bad values are kept, the bad values as missing values, for analysis that reports
+# them. At level 'errors' the months quarantined from data without tenants are filled in (see fill_months()).
+def load_validated(path='saas_dataset.csv', level='errors', workers=None):
+    saas_data = read_for_scan(path)
+    issues, partitions, row_errors, bad_values = scan(saas_data, workers=workers)
+    clean, quarantined = quarantine(saas_data, partitions, row_errors, bad_values, level)
+    print_summary(issues, partitions, quarantined)
+    if clean.empty:
+        raise SystemExit(f"No rows of '{path}' passed the data quality checks.")
+    for column in NUMERIC_COLUMNS:
+        if column in clean.columns and not pd.api.types.is_numeric_dtype(clean[column].dtype):
+            clean[column] = pd.to_numeric(clean[column], errors='coerce')
+    clean = apply_schema(clean)
+    if level == 'errors' and not partition_columns(clean):
+        clean = fill_months(clean)
+    return clean
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Check the dataset and quarantine partitions with bad data.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='months of the rolling MAD')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='robust z-score of an outlier')
+    parser.add_argument('--error-threshold', type=float, default=ERROR_THRESHOLD,
+                        help='robust z-score of a value treated as an error')
+    parser.add_argument('--max-outlier-share', type=float, default=MAX_OUTLIER_SHARE)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='data_quality_report.csv')
+    parser.add_argument('--level', choices=QUARANTINE_LEVELS, default='errors',
+                        help="quarantine rows with any error, or only those that cannot be loaded")
+    parser.add_argument('--quarantine', help='also save the quarantined rows as CSV')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    saas_data = read_for_scan(args.data)
+    start = time.perf_counter()
+    issues, partitions, row_errors, bad_values = scan(saas_data, None, args.window, args.threshold,
+                                                      args.max_outlier_share, args.chunk_rows, args.workers,
+                                                      args.error_threshold)
+    elapsed = time.perf_counter() - start
+    _, quarantined = quarantine(saas_data, partitions, row_errors, bad_values, args.level)
+    print_summary(issues, partitions, quarantined)
+    print(f"Scanned {len(saas_data)} rows in {elapsed:.2f}s.")
+    issues.to_csv(args.output, index=False)
+    print(f"Data quality report saved as '{args.output}'.")
+    if args.quarantine:
+        quarantined.to_csv(args.quarantine, index=False)
+        print(f"{len(quarantined)} quarantined rows saved as '{args.quarantine}'.")
+
+
+if __name__ == '__main__':
+    main()
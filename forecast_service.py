@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import signal
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from Dataset_Generation import CUSTOMER_TYPES, REGIONS
+from batch_forecasting import ALL, panel_series, parse_series_key, segment_panel, select_segments
+from data_loader import load_saas_data
+from data_quality import load_validated
+from metrics import TIERS
+from model_store import fit_cached
+from models import MODELS, fit_model, forecast_model
+from sensitivity import profit_paths
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+# Fitted models kept in memory; the least recently used one is dropped first
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_HORIZON = 12
+MAX_HORIZON = 120
+# Scenarios of a sensitivity query when none are given, as in Forecasting.py
+DEFAULT_CHURN_RATES = [0.02, 0.03, 0.05]
+DEFAULT_MARKETING_MULTIPLIERS = [0.9, 1.0, 1.1]
+MAX_SCENARIOS = 10_000
+COST_COLUMNS = ['Marketing_Spend', 'Fixed_Costs', 'Variable_Costs']
+
+
+# Runs in the worker processes: imports the model libraries up front so the first fit is not slowed down
+def _warm_worker():
+    warnings.simplefilter('ignore')
+    import arch  # noqa: F401
+    from statsmodels.tsa.arima.model import ARIMA  # noqa: F401
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing  # noqa: F401
+
+
+def fit_task(task):
+    key, name, values, store_dir = task
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if store_dir:
+            return fit_cached(key, name, values, store_dir=store_dir)
+        return fit_model(name, values), 'cold'
+
+
+# The monthly MRR series and latest costs behind every series key, built once per key
+class SeriesData:
+    def __init__(self, saas_data):
+        self.mrr = segment_panel(saas_data)
+        self.costs = segment_panel(saas_data, COST_COLUMNS)
+        months = pd.date_range(self.mrr.index[-1], periods=MAX_HORIZON + 1, freq=pd.offsets.MonthEnd())[1:]
+        self.months = [month.strftime('%Y-%m-%d') for month in months]
+        self._series = {}
+
+    def get(self, key):
+        series = self._series.get(key)
+        if series is None:
+            tier, region, customer_type = parse_series_key(key)
+            if (tier not in TIERS + [ALL] or region not in REGIONS + [ALL]
+                    or customer_type not in CUSTOMER_TYPES + [ALL]):
+                raise ValueError(f"unknown series '{key}'")
+            # Costs are not split by tier, so a tier's series carries the costs of its whole segment
+            latest = {column: float(select_segments(self.costs, column, region, customer_type)[-1])
+                      for column in COST_COLUMNS}
+            values = panel_series(self.mrr, key).to_numpy()
+            series = self._series[key] = {
+                'values': values,
+                'baseline': {'current_mrr': float(values[-1]), 'marketing_spend': latest['Marketing_Spend'],
+                             'fixed_costs': latest['Fixed_Costs'], 'variable_costs': latest['Variable_Costs']},
+            }
+        return series
+
+
+class ForecastService:
+    def __init__(self, saas_data, executor, cache_size=DEFAULT_CACHE_SIZE, store_dir=None):
+        self.data = SeriesData(saas_data)
+        self.executor = executor
+        self.cache_size = cache_size
+        self.store_dir = store_dir
+        # (series, model) -> {'result', 'fit', 'forecast'}; the forecast is kept at the longest horizon asked for
+        self.models = OrderedDict()
+        # Computations in progress; concurrent requests for the same one wait on the same future
+        self.pending = {}
+        self.stats = {'requests': 0, 'errors': 0, 'cache_hits': 0, 'fits': 0, 'forecasts': 0, 'batched': 0,
+                      'evictions': 0}
+        self.routes = {
+            '/forecast': self.forecast_query,
+            '/profit': self.profit_query,
+            '/cash_flow': self.cash_flow_query,
+            '/sensitivity': self.sensitivity_query,
+            '/health': self.health_query,
+            '/stats': self.stats_query,
+        }
+
+    async def _once(self, token, compute):
+        future = self.pending.get(token)
+        if future is None:
+            future = self.pending[token] = asyncio.ensure_future(compute())
+            future.add_done_callback(lambda _: self.pending.pop(token, None))
+        else:
+            self.stats['batched'] += 1
+        # A client hanging up does not cancel the computation other requests are waiting for
+        return await asyncio.shield(future)
+
+    async def model(self, key, name):
+        entry = self.models.get((key, name))
+        if entry is not None:
+            self.models.move_to_end((key, name))
+            self.stats['cache_hits'] += 1
+            return entry
+        return await self._once(('fit', key, name), lambda: self._fit(key, name))
+
+    async def _fit(self, key, name):
+        values = self.data.get(key)['values']
+        loop = asyncio.get_running_loop()
+        result, how = await loop.run_in_executor(self.executor, fit_task, (key, name, values, self.store_dir))
+        self.stats['fits'] += 1
+        entry = self.models[(key, name)] = {'result': result, 'fit': how, 'forecast': None}
+        while len(self.models) > self.cache_size:
+            self.models.popitem(last=False)
+            self.stats['evictions'] += 1
+        return entry
+
+    # Forecast frame with at least `horizon` steps. The first steps of a longer forecast are the same as
+    # a shorter one, so requests with different horizons share one computation.
+    async def forecast(self, key, name, horizon):
+        entry = await self.model(key, name)
+        while entry['forecast'] is None or len(entry['forecast']) < horizon:
+            await self._once(('forecast', key, name), lambda: self._forecast(entry, name, horizon))
+        return entry, entry['forecast'].iloc[:horizon]
+
+    async def _forecast(self, entry, name, horizon):
+        # Forecasting a fitted model is quick, so it runs on a thread rather than in the process pool
+        steps = max(horizon, DEFAULT_HORIZON)
+        entry['forecast'] = await asyncio.to_thread(forecast_model, name, entry['result'], steps)
+        self.stats['forecasts'] += 1
+
+    def _params(self, query):
+        key = query.get('series', f'{ALL}/{ALL}/{ALL}')
+        horizon = int(query.get('horizon', DEFAULT_HORIZON))
+        if not 1 <= horizon <= MAX_HORIZON:
+            raise ValueError(f'horizon must be between 1 and {MAX_HORIZON}')
+        name = query.get('model', 'arima')
+        if name not in MODELS:
+            raise ValueError(f"unknown model '{name}', expected one of {', '.join(MODELS)}")
+        return self.data.get(key), key, horizon, name
+
+    async def forecast_query(self, query):
+        _, key, horizon, name = self._params(query)
+        entry, forecast = await self.forecast(key, name, horizon)
+        return {'series': key, 'model': name, 'fit': entry['fit'], 'months': self.data.months[:horizon],
+                'forecast': forecast['forecast'].tolist(), 'lower': forecast['lower'].tolist(),
+                'upper': forecast['upper'].tolist()}
+
+    # Profit = forecast revenue - (fixed + variable costs); cash flow also subtracts the marketing spend
+    async def _net_query(self, query, costs, label):
+        series, key, horizon, name = self._params(query)
+        _, forecast = await self.forecast(key, name, horizon)
+        baseline = series['baseline']
+        outflow = sum(baseline[cost] for cost in costs)
+        return {'series': key, 'model': name, 'months': self.data.months[:horizon],
+                label: (forecast['forecast'] - outflow).tolist()}
+
+    async def profit_query(self, query):
+        return await self._net_query(query, ['fixed_costs', 'variable_costs'], 'profit')
+
+    async def cash_flow_query(self, query):
+        return await self._net_query(query, ['fixed_costs', 'variable_costs', 'marketing_spend'], 'cash_flow')
+
+    async def sensitivity_query(self, query):
+        series, key, horizon, _ = self._params(query)
+        churn_rates = _floats(query.get('churn'), DEFAULT_CHURN_RATES)
+        marketing = _floats(query.get('marketing'), DEFAULT_MARKETING_MULTIPLIERS)
+        if len(churn_rates) * len(marketing) > MAX_SCENARIOS:
+            raise ValueError(f'at most {MAX_SCENARIOS} scenarios per query')
+        # Monthly profit per scenario, shape (churn, marketing, month)
+        profit = await asyncio.to_thread(profit_paths, series['baseline'], churn_rates, marketing, horizon=horizon)
+        return {'series': key, 'months': self.data.months[:horizon], 'churn': churn_rates, 'marketing': marketing,
+                'profit': profit[:, :, 0, 0].tolist()}
+
+    async def health_query(self, query):
+        return {'status': 'ok'}
+
+    async def stats_query(self, query):
+        return dict(self.stats, cached_models=len(self.models), pending=len(self.pending))
+
+    async def respond(self, method, target):
+        url = urlsplit(target)
+        handler = self.routes.get(url.path)
+        if handler is None:
+            return HTTPStatus.NOT_FOUND, {'error': f'unknown path {url.path}'}
+        if method != 'GET':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'only GET is supported'}
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            return HTTPStatus.OK, await handler(query)
+        except ValueError as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': repr(error)}
+
+    # Minimal HTTP/1.1 with keep-alive; request bodies are ignored
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+
+                method, target, version = request_line.decode('latin-1').split()
+                self.stats['requests'] += 1
+                status, payload = await self.respond(method, target)
+                if status != HTTPStatus.OK:
+                    self.stats['errors'] += 1
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                body = json.dumps(payload).encode()
+                writer.write(f'{version} {status.value} {status.phrase}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def _floats(text, default):
+    if text is None:
+        return list(default)
+    return [float(value) for value in text.split(',')]
+
+
+async def serve(saas_data, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, cache_size=DEFAULT_CACHE_SIZE,
+                store_dir=None, preload=()):
+    # Worker processes are spawned rather than forked from the running event loop and its threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_warm_worker) as executor:
+        service = ForecastService(saas_data, executor, cache_size, store_dir)
+        if preload:
+            start = time.perf_counter()
+            await asyncio.gather(*(service.forecast(key, name, DEFAULT_HORIZON) for key in preload for name in MODELS))
+            print(f"Preloaded {len(service.models)} models in {time.perf_counter() - start:.2f}s.")
+        server = await asyncio.start_server(service.handle_connection, host, port, backlog=1024)
+        print(f"Serving forecasts on http://{host}:{port}/")
+        # SIGTERM stops the service cleanly, shutting the worker processes down with it
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        async with server:
+            await stop.wait()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve forecast, profit, cash-flow and sensitivity queries over HTTP.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, help='processes fitting models')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE, help='fitted models kept in memory')
+    parser.add_argument('--store', help='model store directory; fits are also reused across restarts')
+    parser.add_argument('--preload', nargs='+', default=[], help="series keys fitted before serving, such as '*/*/*'")
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    saas_data = load_validated(args.data) if args.validate else load_saas_data(args.data)
+    try:
+        asyncio.run(serve(saas_data, args.host, args.port, args.workers, args.cache_size, args.store, args.preload))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+
+import pandas as pd
+import numpy as np
+
+from metrics import CANCELLATION_COLUMNS, CHURN_RATE_COLUMNS, NEW_SUBSCRIBER_COLUMNS, TIERS, required_columns
+from rendering import ChartSpec, render_charts
+
+DEFAULT_STATE_PATH = '.insights_state.json'
+
+# Aggregate insights kept up to date from running sums
+AGGREGATES = ['Average_Churn_Rates', 'Churn_Rates_By_Segment', 'Upsell_Success_Rate']
+SUM_COLUMNS = required_columns(AGGREGATES)
+
+# Bytes just before the consumed offset that are hashed to detect a rewritten (not appended) source
+TAIL_BYTES = 4096
+
+
+def segment_churn_chart(churn_rates):
+    return (ChartSpec('churn_rates_by_segment.png', 'Churn Rates by Customer Segment',
+                      'Customer Segment', 'Churn Rate', name='Churn Rates by Segment plot',
+                      figsize=(10, 6), legend=False)
+            .add('bar', list(churn_rates.keys()), list(churn_rates.values()), color=['blue', 'green', 'red']))
+
+
+def empty_state(source=None, header=None):
+    return {
+        'source': source, 'header': header, 'offset': 0, 'tail_hash': None, 'rows': 0,
+        'missing': {column: 0 for column in header or []},
+        'sums': {column: 0.0 for column in SUM_COLUMNS},
+        'counts': {column: 0 for column in SUM_COLUMNS},
+    }
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _tail_hash(f, offset):
+    f.seek(max(0, offset - TAIL_BYTES))
+    return hashlib.blake2b(f.read(min(offset, TAIL_BYTES)), digest_size=16).hexdigest()
+
+
+# Fold a batch of new rows into the running sums, counts and missing-value counts
+def update_state(state, rows):
+    state['rows'] += len(rows)
+    missing = rows.isnull().sum()
+    for column in state['missing']:
+        state['missing'][column] += int(missing.get(column, len(rows)))
+    for column in SUM_COLUMNS:
+        values = pd.to_numeric(rows[column], errors='coerce').to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        state['sums'][column] += float(values[valid].sum())
+        state['counts'][column] += int(valid.sum())
+    return state
+
+
+def _parse_rows(header, data):
+    return pd.read_csv(io.BytesIO(data), names=header, header=None)
+
+
+# Read the rows appended to the source since the recorded offset. Only complete lines are consumed,
+# so a row that is still being written is picked up by the next run. If the bytes before the offset
+# changed, the source was rewritten and the state is rebuilt from the start.
+def read_appended(state, path):
+    with open(path, 'rb') as f:
+        header = f.readline().decode().strip().split(',')
+        data_start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        if (state is None or state['source'] != os.path.abspath(path) or state['header'] != header
+                or size < state['offset'] or _tail_hash(f, state['offset']) != state['tail_hash']):
+            state = empty_state(os.path.abspath(path), header)
+            state['offset'] = data_start
+
+        f.seek(state['offset'])
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        state['offset'] += end
+        state['tail_hash'] = _tail_hash(f, state['offset'])
+
+    rows = _parse_rows(header, data[:end]) if end else pd.DataFrame(columns=header)
+    return state, rows
+
+
+# Rows streamed on stdin, with or without a header line
+def read_stream(state, stream):
+    data = stream.read()
+    first, _, rest = data.partition(b'\n')
+    header = state['header']
+    if first.decode().strip().split(',') == header:
+        data = rest
+    if not data.strip():
+        return pd.DataFrame(columns=header)
+    return _parse_rows(header, data)
+
+
+def insights_from_state(state):
+    sums, counts = state['sums'], state['counts']
+    return {
+        'Average_Churn_Rates': {tier: sums[column] / counts[column] if counts[column] else np.nan
+                                for tier, column in zip(TIERS, CHURN_RATE_COLUMNS)},
+        'Churn_Rates_By_Segment': {tier: sums[cancelled] / sums[new] if sums[new] else np.nan
+                                   for tier, cancelled, new in zip(TIERS, CANCELLATION_COLUMNS,
+                                                                   NEW_SUBSCRIBER_COLUMNS)},
+        'Upsell_Success_Rate': (sums['Upsell_Completed'] / sums['New_Customers']
+                                if sums['New_Customers'] else np.nan),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Update the aggregate insights from newly appended months.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--state', default=DEFAULT_STATE_PATH)
+    parser.add_argument('--stdin', action='store_true', help='read the new rows from stdin instead of --data')
+    parser.add_argument('--no-charts', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    state = load_state(args.state)
+
+    if args.stdin:
+        if state is None:
+            sys.exit(f"No insights state in '{args.state}'; run once against --data first.")
+        rows = read_stream(state, sys.stdin.buffer)
+    else:
+        state, rows = read_appended(state, args.data)
+    update_state(state, rows)
+    save_state(args.state, state)
+    print(f"Folded in {len(rows)} new rows ({state['rows']} in total).")
+
+    insights = insights_from_state(state)
+    print("Missing Values in Each Column:\n", pd.Series(state['missing']))
+    for tier, avg_churn in insights['Average_Churn_Rates'].items():
+        print(f"Average Churn Rate for {tier}: {avg_churn:.2%}")
+    print("Churn Rates by Segment:", insights['Churn_Rates_By_Segment'])
+    print("Upsell Success Rate:", insights['Upsell_Success_Rate'])
+
+    if not args.no_charts:
+        render_charts([segment_churn_chart(insights['Churn_Rates_By_Segment'])])
+
+
+if __name__ == '__main__':
+    main()
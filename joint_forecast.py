@@ -0,0 +1,127 @@
+import argparse
+
+import pandas as pd
+import numpy as np
+
+import profiling
+from data_loader import load_saas_data
+from metrics import MRR_COLUMNS
+from metrics_store import MetricsStore
+from monte_carlo import PERCENTILES
+
+# Variables projected together by the VAR
+COST_COLUMNS = ['Fixed_Costs', 'Variable_Costs', 'Marketing_Spend']
+VAR_COLUMNS = MRR_COLUMNS + COST_COLUMNS + ['New_Customers']
+
+DEFAULT_MAXLAGS = 4
+DEFAULT_PATHS = 20_000
+
+
+# Company-wide monthly totals of the VAR variables, by the 'Month' column or index; the default dataset
+# already has one row per month
+def monthly_history(saas_data):
+    if isinstance(saas_data, MetricsStore):
+        return saas_data.monthly_totals().frame(VAR_COLUMNS).astype(float)
+    months = 'Month' if 'Month' in saas_data.columns else saas_data.index
+    return saas_data.groupby(months)[VAR_COLUMNS].sum().astype(float).sort_index()
+
+
+# One VAR over all variables, the lag order chosen by `ic` up to `maxlags`. The lag order is capped so
+# every equation keeps more observations than coefficients.
+def fit_var(history, maxlags=DEFAULT_MAXLAGS, ic='aic'):
+    from statsmodels.tsa.vector_ar.var_model import VAR
+
+    values = np.asarray(history, dtype=float)
+    maxlags = max(1, min(maxlags, (len(values) - 1) // (values.shape[1] + 1)))
+    with profiling.stage('fit var', n_obs=len(values), maxlags=maxlags):
+        return VAR(values).fit(maxlags=maxlags, ic=ic, trend='c')
+
+
+# Point forecast and n_paths simulated paths of every variable for the next `horizon` months, shapes
+# (horizon, k) and (n_paths, horizon, k). All paths advance together one month at a time:
+#   y_t = c + A_1 y_{t-1} + ... + A_p y_{t-p} + e_t,  e_t ~ N(0, sigma_u)
+# The point forecast is the path without shocks.
+def simulate_var(result, history, horizon=12, n_paths=DEFAULT_PATHS, seed=None):
+    values = np.asarray(history, dtype=float)
+    n_vars = values.shape[1]
+    coefs = result.coefs if result.k_ar else np.zeros((1, n_vars, n_vars))
+    n_lags = len(coefs)
+
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((n_paths + 1, horizon, n_vars)) @ np.linalg.cholesky(result.sigma_u).T
+    shocks[0] = 0
+
+    # Lagged values, most recent month first
+    window = np.repeat(values[::-1][None, :n_lags], n_paths + 1, axis=0)
+    paths = np.empty((n_paths + 1, horizon, n_vars))
+    for t in range(horizon):
+        paths[:, t] = result.intercept + np.einsum('lij,plj->pi', coefs, window) + shocks[:, t]
+        window = np.concatenate([paths[:, t, None], window[:, :-1]], axis=1)
+    return paths[0], paths[1:]
+
+
+def _revenue_and_costs(values):
+    columns = {column: values[..., i] for i, column in enumerate(VAR_COLUMNS)}
+    total_mrr = sum(columns[column] for column in MRR_COLUMNS)
+    profit = total_mrr - columns['Fixed_Costs'] - columns['Variable_Costs']
+    return total_mrr, profit, profit - columns['Marketing_Spend']
+
+
+# Percentile bands of the simulated profit and cash flow, in the same columns as monte_carlo.simulate()
+def path_summary(paths, percentiles=PERCENTILES):
+    _, profit, cash_flow = _revenue_and_costs(paths)
+    summary = pd.DataFrame({'step': np.arange(1, paths.shape[1] + 1)})
+    for name, values in [('profit', profit), ('cash_flow', cash_flow)]:
+        summary[f'{name}_mean'] = values.mean(axis=0)
+        bands = np.percentile(values, percentiles, axis=0)
+        for j, q in enumerate(percentiles):
+            summary[f'{name}_p{q}'] = bands[j]
+    summary['prob_negative_cash_flow'] = (cash_flow < 0).mean(axis=0)
+    summary['prob_negative_cumulative_cash'] = (np.cumsum(cash_flow, axis=1) < 0).mean(axis=0)
+    return summary
+
+
+# Fit the VAR and project every variable, with profit and cash flow from the projected revenue and costs.
+# Returns the fitted result, the point forecast (one column per variable plus Total_MRR, Profit and
+# Cash_Flow) and the simulated profit and cash flow bands.
+def project(history, horizon=12, n_paths=DEFAULT_PATHS, maxlags=DEFAULT_MAXLAGS, seed=None,
+            percentiles=PERCENTILES):
+    values = np.asarray(history[VAR_COLUMNS], dtype=float)
+    result = fit_var(values, maxlags)
+    with profiling.stage('var simulate', paths=n_paths, horizon=horizon):
+        point, paths = simulate_var(result, values, horizon, n_paths, seed)
+        summary = path_summary(paths, percentiles)
+
+    forecast = pd.DataFrame(point, columns=VAR_COLUMNS)
+    forecast['Total_MRR'], forecast['Profit'], forecast['Cash_Flow'] = _revenue_and_costs(point)
+    forecast.insert(0, 'step', np.arange(1, horizon + 1))
+    return result, forecast, summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Joint VAR projection of MRR, costs, marketing and new customers.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--horizon', type=int, default=12)
+    parser.add_argument('--paths', type=int, default=DEFAULT_PATHS, help='simulated paths')
+    parser.add_argument('--maxlags', type=int, default=DEFAULT_MAXLAGS)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='joint_forecast.csv')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    history = monthly_history(load_saas_data(args.data))
+    result, forecast, summary = project(history, args.horizon, args.paths, args.maxlags, args.seed)
+    print(f"VAR({result.k_ar}) fitted to {len(history)} months of {len(VAR_COLUMNS)} variables.")
+    months = pd.date_range(history.index[-1], periods=args.horizon + 1, freq=pd.offsets.MonthEnd())[1:]
+    forecast.insert(1, 'Month', months)
+    forecast = forecast.merge(summary, on='step')
+    print(forecast[['Month', 'Total_MRR', 'Profit', 'Cash_Flow', 'cash_flow_p5', 'cash_flow_p95',
+                    'prob_negative_cash_flow']])
+    forecast.to_csv(args.output, index=False)
+    print(f"Joint forecast saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
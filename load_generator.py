@@ -0,0 +1,156 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+import pandas as pd
+import numpy as np
+
+from forecast_service import DEFAULT_HOST, DEFAULT_PORT
+
+# Query mix sent to the service; {series} is replaced by every series key in turn
+DEFAULT_PATHS = [
+    '/forecast?series={series}&model=arima',
+    '/forecast?series={series}&model=exp_smoothing&horizon=24',
+    '/profit?series={series}',
+    '/cash_flow?series={series}',
+    '/sensitivity?series={series}&churn=0.01,0.02,0.03,0.05&marketing=0.8,0.9,1.0,1.1,1.2',
+]
+DEFAULT_SERIES = ['*/*/*']
+STARTUP_TIMEOUT = 60
+
+
+def expand_paths(paths, series):
+    return [path.format(series=quote(key, safe='*/')) for key in series for path in paths]
+
+
+async def _request(reader, writer, host, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+# One keep-alive connection sending requests back to back until the shared budget is used up
+async def _client(host, port, paths, counter, stop, results):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            i = next(counter)
+            if i >= stop['requests'] or time.perf_counter() >= stop['deadline']:
+                break
+            path = paths[i % len(paths)]
+            start = time.perf_counter()
+            status = await _request(reader, writer, host, path)
+            results.append((path.split('?')[0], status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+async def run_load(host=DEFAULT_HOST, port=DEFAULT_PORT, paths=None, concurrency=32, requests=None, duration=None,
+                   warmup=0):
+    paths = paths or expand_paths(DEFAULT_PATHS, DEFAULT_SERIES)
+    if warmup:
+        # Fills the service's model cache so the measurement shows steady-state latency
+        await _client(host, port, paths, itertools.count(), {'requests': warmup, 'deadline': np.inf}, [])
+    start = time.perf_counter()
+    stop = {'requests': requests or np.inf, 'deadline': np.inf if duration is None else start + duration}
+    counter = itertools.count()
+    results = []
+    await asyncio.gather(*(_client(host, port, paths, counter, stop, results) for _ in range(concurrency)))
+    return pd.DataFrame(results, columns=['path', 'status', 'seconds']), time.perf_counter() - start
+
+
+# Requests per second and latency percentiles, overall and per path
+def summarize(results, elapsed):
+    def row(frame):
+        latency_ms = frame['seconds'].to_numpy() * 1000
+        return pd.Series({'requests': len(frame), 'errors': int((frame['status'] != 200).sum()),
+                          'rps': len(frame) / elapsed, 'p50_ms': np.percentile(latency_ms, 50),
+                          'p90_ms': np.percentile(latency_ms, 90), 'p99_ms': np.percentile(latency_ms, 99),
+                          'max_ms': latency_ms.max()})
+
+    summary = pd.DataFrame({path: row(frame) for path, frame in results.groupby('path', sort=False)}).T
+    summary.loc['all'] = row(results)
+    return summary
+
+
+def wait_for_service(host, port, process=None, timeout=STARTUP_TIMEOUT):
+    async def healthy():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            return await _request(reader, writer, host, '/health') == 200
+        finally:
+            writer.close()
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'the forecast service exited with code {process.returncode}')
+        try:
+            if asyncio.run(healthy()):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f'the forecast service did not start on {host}:{port} within {timeout}s')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the forecast service and report RPS and latency.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS, help='query paths; {series} is filled in')
+    parser.add_argument('--series', nargs='+', default=DEFAULT_SERIES, help="series keys such as 'Basic/*/*'")
+    parser.add_argument('--concurrency', type=int, default=32, help='open connections')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--duration', type=float, help='stop after this many seconds instead')
+    parser.add_argument('--warmup', type=int, default=0, help='requests sent before measuring')
+    parser.add_argument('--start-service', action='store_true', help='start forecast_service.py for the test')
+    parser.add_argument('--data', default='saas_dataset.csv', help='dataset of a service started for the test')
+    parser.add_argument('--output', help='also save the summary as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = None
+    if args.start_service:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forecast_service.py')
+        service = subprocess.Popen([sys.executable, script, '--data', args.data, '--host', args.host,
+                                    '--port', str(args.port)])
+    try:
+        if service is not None:
+            wait_for_service(args.host, args.port, service)
+        paths = expand_paths(args.paths, args.series)
+        requests = None if args.duration else args.requests
+        results, elapsed = asyncio.run(run_load(args.host, args.port, paths, args.concurrency, requests,
+                                                args.duration, args.warmup))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+    summary = summarize(results, elapsed)
+    print(f"{len(results)} requests over {args.concurrency} connections in {elapsed:.2f}s:\n", summary.to_string())
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary.reset_index().to_dict(orient='records'), f, indent=1)
+        print(f"Load test summary saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import profiling
+
+TIERS = ['Basic', 'Premium', 'Enterprise']
+
+NEW_SUBSCRIBER_COLUMNS = [f'New_Subscribers_{tier}' for tier in TIERS]
+CANCELLATION_COLUMNS = [f'Cancellations_{tier}' for tier in TIERS]
+MRR_COLUMNS = [f'MRR_{tier}' for tier in TIERS]
+CHURN_RATE_COLUMNS = [f'Churn_Rate_{tier}' for tier in TIERS]
+
+# Registry of derived metrics: name -> (input names, function, stored as a column)
+# Inputs are either dataset columns or other registered metrics.
+METRICS = {}
+
+
+def metric(name, inputs, column=True):
+    def register(func):
+        METRICS[name] = (list(inputs), func, column)
+        return func
+    return register
+
+
+# Column metrics (one value per row)
+
+@metric('Total_MRR', MRR_COLUMNS)
+def total_mrr(mrr_basic, mrr_premium, mrr_enterprise):
+    return mrr_basic + mrr_premium + mrr_enterprise
+
+
+@metric('Net_New_Subscribers', NEW_SUBSCRIBER_COLUMNS + CANCELLATION_COLUMNS)
+def net_new_subscribers(new_basic, new_premium, new_enterprise,
+                        cancel_basic, cancel_premium, cancel_enterprise):
+    return (new_basic + new_premium + new_enterprise -
+            (cancel_basic + cancel_premium + cancel_enterprise))
+
+
+# Total subscribers has always been computed as the net new subscribers
+@metric('Total_Subscribers', ['Net_New_Subscribers'])
+def total_subscribers(net_new):
+    return net_new
+
+
+@metric('Total_Costs', ['Fixed_Costs', 'Variable_Costs'])
+def total_costs(fixed_costs, variable_costs):
+    return fixed_costs + variable_costs
+
+
+# Customer Lifetime Value, guarding against a zero churn rate
+@metric('CLV', ['Total_MRR', 'Churn_Rate_Basic'])
+def clv(total_mrr, churn_rate_basic):
+    return total_mrr / churn_rate_basic.replace(0, 0.001)
+
+
+@metric('Variable_Costs_Per_Customer', ['Variable_Costs', 'New_Customers'])
+def variable_costs_per_customer(variable_costs, new_customers):
+    return variable_costs / new_customers
+
+
+# Aggregate metrics (one value per dataset)
+
+@metric('Average_Churn_Rates', CHURN_RATE_COLUMNS, column=False)
+def average_churn_rates(*churn_rates):
+    return {tier: rate.mean() for tier, rate in zip(TIERS, churn_rates)}
+
+
+# Churn rates by customer segment: total cancellations over total new subscribers
+@metric('Churn_Rates_By_Segment', CANCELLATION_COLUMNS + NEW_SUBSCRIBER_COLUMNS, column=False)
+def churn_rates_by_segment(*columns):
+    cancellations, new_subscribers = columns[:len(TIERS)], columns[len(TIERS):]
+    return {tier: cancelled.sum() / new.sum()
+            for tier, cancelled, new in zip(TIERS, cancellations, new_subscribers)}
+
+
+@metric('Upsell_Success_Rate', ['Upsell_Completed', 'New_Customers'], column=False)
+def upsell_success_rate(upsell_completed, new_customers):
+    return upsell_completed.sum() / new_customers.sum()
+
+
+def _evaluate(frame, name):
+    if name not in METRICS:
+        return frame[name]
+
+    inputs, func, column = METRICS[name]
+    cache = frame.attrs.setdefault('metrics', {})
+    if column and name in frame.columns:
+        return frame[name]
+    if not column and name in cache:
+        return cache[name]
+
+    value = func(*[_evaluate(frame, dependency) for dependency in inputs])
+    if column:
+        frame[name] = value
+    else:
+        cache[name] = value
+    return value
+
+
+# Evaluate the requested metrics and whatever they depend on, each at most once. Column metrics
+# are added to the frame, aggregate metrics are memoized in frame.attrs['metrics'].
+def compute(frame, names):
+    with profiling.stage('metrics', names=list(names), rows=len(frame)):
+        return {name: _evaluate(frame, name) for name in names}
+
+
+def required_columns(names):
+    columns = []
+    for name in names:
+        if name not in METRICS:
+            if name not in columns:
+                columns.append(name)
+            continue
+        for column in required_columns(METRICS[name][0]):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
@@ -0,0 +1,224 @@
+import argparse
+
+import pandas as pd
+import numpy as np
+
+from data_loader import load_saas_data
+from data_quality import load_validated
+
+# Integer columns get the smallest type that holds this many times their largest value, so that the
+# sums the metrics take of a few columns cannot overflow
+INT_HEADROOM = 4
+
+
+def downcast_int(values):
+    largest = int(np.abs(values).max()) * INT_HEADROOM if len(values) else 0
+    for dtype in (np.int8, np.int16, np.int32):
+        if largest <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+# The (tenants x months) array of values given in row order for the valid cells, or for all of them
+def _padded(values, shape, valid=None, fill=None):
+    if valid is None:
+        return np.ascontiguousarray(values).reshape(shape)
+    if fill is None:
+        fill = np.nan if values.dtype.kind == 'f' else 0
+    array = np.full(shape, fill, dtype=values.dtype)
+    array[valid] = values
+    return array
+
+
+# Monthly metrics of every tenant in one contiguous (tenants x months) array per column, sharing one
+# time index. Numeric columns are downcast and categorical columns are stored as codes into their
+# categories. Slicing by tenant or date range returns a store viewing the same arrays.
+#
+# Tenants may cover different months (a tenant that joined late): `valid` then marks each tenant's
+# months, and the cells outside them hold padding (0, NaN or the missing code -1) that is never read.
+#
+# The store reads like a DataFrame where the metrics code and the scripts need it to: store[column]
+# wraps the column's flat row order (tenant by tenant, month by month) in a Series without copying it
+# (only a date range of several tenants, or tenants covering different months, is not contiguous and
+# gets copied), metrics.compute() adds its derived columns to the store, and a single-tenant store's
+# Series are indexed by month.
+class MetricsStore:
+    def __init__(self, tenants, months, arrays, categories=None, attrs=None, valid=None):
+        self.tenants = np.asarray(tenants)
+        self.months = pd.DatetimeIndex(months, name='Month')
+        self.arrays = arrays
+        self.categories = categories or {}
+        self.attrs = {} if attrs is None else attrs
+        self.valid = None if valid is None or valid.all() else valid
+
+    @classmethod
+    def from_frame(cls, frame):
+        if 'Tenant_ID' in frame.columns:
+            tenant_ids = frame['Tenant_ID'].to_numpy()
+        else:
+            tenant_ids = np.zeros(len(frame), dtype=np.int32)
+        tenants, tenant_codes = np.unique(tenant_ids, return_inverse=True)
+        months, month_codes = np.unique(frame['Month'].to_numpy(), return_inverse=True)
+        n_tenants, n_months = len(tenants), len(months)
+        cell = tenant_codes * n_months + month_codes
+        if np.bincount(cell, minlength=len(frame)).max(initial=0) > 1:
+            raise ValueError('the metrics store needs at most one row per tenant and month')
+        valid = None
+        if len(frame) != n_tenants * n_months:
+            valid = np.zeros(n_tenants * n_months, dtype=bool)
+            valid[cell] = True
+            valid = valid.reshape(n_tenants, n_months)
+        # Rows in tenant, month order; generated datasets are in this order already
+        order = None if np.all(cell == np.arange(len(cell))) else np.argsort(cell)
+
+        arrays, categories = {}, {}
+        for column in frame.columns:
+            if column in ('Tenant_ID', 'Month'):
+                continue
+            values = frame[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories[column] = list(values.cat.categories)
+                values = values.cat.codes.to_numpy()
+            elif pd.api.types.is_integer_dtype(values.dtype):
+                values = values.to_numpy()
+                values = values.astype(downcast_int(values))
+            elif pd.api.types.is_float_dtype(values.dtype):
+                values = values.to_numpy(dtype=np.float32)
+            else:
+                # Strings are dictionary-encoded; missing values get the code -1
+                values, uniques = pd.factorize(values)
+                categories[column] = list(uniques)
+            if values.dtype.kind in 'iu' and column in categories:
+                values = values.astype(np.int8 if len(categories[column]) < 128 else np.int32)
+            values = values if order is None else values[order]
+            arrays[column] = _padded(values, (n_tenants, n_months), valid, -1 if column in categories else None)
+        return cls(tenants, months, arrays, categories, valid=valid)
+
+    # DataFrame-like access used by metrics.compute() and the scripts
+
+    @property
+    def columns(self):
+        return ['Month'] + list(self.arrays)
+
+    @property
+    def index(self):
+        return self.months if len(self.tenants) == 1 else pd.RangeIndex(len(self))
+
+    def __len__(self):
+        return len(self.tenants) * len(self.months) if self.valid is None else int(self.valid.sum())
+
+    def __contains__(self, column):
+        return column in self.arrays or column == 'Month'
+
+    def __getitem__(self, column):
+        if column == 'Month':
+            months = self.months if len(self.tenants) == 1 else np.tile(self.months.to_numpy(), len(self.tenants))
+            if self.valid is not None:
+                months = months[self.valid.reshape(-1)]
+            return pd.Series(months, index=self.index, name='Month')
+        values = self.arrays[column].reshape(-1) if self.valid is None else self.arrays[column][self.valid]
+        if column in self.categories:
+            values = pd.Categorical.from_codes(values, categories=self.categories[column], validate=False)
+        return pd.Series(values, index=self.index, name=column, copy=False)
+
+    def __setitem__(self, column, values):
+        self.arrays[column] = _padded(np.asarray(values), (len(self.tenants), len(self.months)), self.valid)
+
+    # The (tenants x months) array of a column, as stored; see `valid` for tenants covering different months
+    def panel(self, column):
+        return self.arrays[column]
+
+    def _view(self, tenants, months):
+        arrays = {column: values[tenants, months] for column, values in self.arrays.items()}
+        valid = None if self.valid is None else self.valid[tenants, months]
+        months = self.months[months]
+        if valid is not None and valid.shape[0] == 1:
+            # A single tenant is indexed by its own months
+            keep = valid[0]
+            arrays = {column: values[:, keep] for column, values in arrays.items()}
+            months, valid = months[keep], None
+        return MetricsStore(self.tenants[tenants], months, arrays, self.categories, valid=valid)
+
+    def tenant(self, tenant_id):
+        i = int(np.searchsorted(self.tenants, tenant_id))
+        if i == len(self.tenants) or self.tenants[i] != tenant_id:
+            raise KeyError(f'no tenant {tenant_id}')
+        return self._view(slice(i, i + 1), slice(None))
+
+    # Months from start to end, both included
+    def between(self, start=None, end=None):
+        first = 0 if start is None else int(self.months.searchsorted(pd.Timestamp(start), side='left'))
+        last = len(self.months) if end is None else int(self.months.searchsorted(pd.Timestamp(end), side='right'))
+        return self._view(slice(None), slice(first, last))
+
+    # One row per month for the whole company: counts and amounts summed over the tenants, rates averaged
+    # over the tenants of the month. A single-tenant store is returned as it is.
+    def monthly_totals(self):
+        if len(self.tenants) == 1:
+            return self
+        arrays = {}
+        for column, values in self.arrays.items():
+            if column in self.categories:
+                continue
+            if values.dtype.kind != 'f':
+                total = values.sum(axis=0, dtype=np.int64)
+            elif self.valid is None:
+                total = values.mean(axis=0)
+            else:
+                total = np.where(self.valid, values, 0).sum(axis=0) / np.maximum(self.valid.sum(axis=0), 1)
+            arrays[column] = total[None, :]
+        return MetricsStore(np.zeros(1, dtype=np.int32), self.months, arrays)
+
+    # A DataFrame of the given columns indexed by month; the columns of a single-tenant store are not copied
+    def frame(self, columns):
+        return pd.DataFrame({column: self[column] for column in columns}, copy=False)
+
+    # Missing values per column, like frame.isnull().sum(); integer columns cannot hold any
+    def missing_values(self):
+        counts = {'Month': int(self.months.isna().sum()) * len(self.tenants)}
+        for column, values in self.arrays.items():
+            values = values if self.valid is None else values[self.valid]
+            if values.dtype.kind == 'f':
+                counts[column] = int(np.isnan(values).sum())
+            else:
+                counts[column] = int((values < 0).sum()) if column in self.categories else 0
+        return pd.Series(counts)
+
+    def head(self, n=5):
+        return pd.DataFrame({column: self[column].iloc[:n].to_numpy() for column in self.columns})
+
+    @property
+    def nbytes(self):
+        valid = 0 if self.valid is None else self.valid.nbytes
+        return self.months.nbytes + self.tenants.nbytes + valid + sum(values.nbytes for values in self.arrays.values())
+
+
+# With validate, the rows the data quality checks quarantine at the given level are left out
+def load_metrics_store(path='saas_dataset.csv', validate=False, level='errors'):
+    return MetricsStore.from_frame(load_validated(path, level) if validate else load_saas_data(path))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Build the array-backed metrics store and report its memory use.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    saas_data = load_saas_data(args.data)
+    store = MetricsStore.from_frame(saas_data)
+    report = pd.DataFrame({
+        'frame_mb': saas_data.memory_usage(deep=True, index=False).drop('Tenant_ID', errors='ignore') / 1024 ** 2,
+        'store_mb': pd.Series({column: values.nbytes / 1024 ** 2 for column, values in store.arrays.items()}),
+        'store_dtype': pd.Series({column: str(values.dtype) for column, values in store.arrays.items()}),
+    })
+    report.loc['Month', 'store_mb'] = store.months.nbytes / 1024 ** 2
+    print(report.reindex(store.columns).to_string())
+    print(f"{len(store.tenants)} tenants x {len(store.months)} months: "
+          f"{saas_data.memory_usage(deep=True).sum() / 1024 ** 2:.2f} MB as a DataFrame, "
+          f"{store.nbytes / 1024 ** 2:.2f} MB in the store.")
+
+
+if __name__ == '__main__':
+    main()
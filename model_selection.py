@@ -0,0 +1,218 @@
+import argparse
+import copy
+import itertools
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from backtesting import TOTAL_SERIES, load_series
+from data_loader import load_saas_data
+from data_quality import load_validated
+from model_store import data_fingerprint
+from models import MODELS, fit_model, forecast_model, model_params
+
+DEFAULT_CACHE_DIR = '.model_selection'
+CRITERIA = ['aic', 'bic', 'holdout']
+MAX_DIFFERENCES = 2
+RANKING_COLUMNS = ['series', 'model', 'spec', 'score', 'stage']
+
+# Optimizer settings for the cheap first-pass fits used to prune candidates
+PARTIAL_FIT = {
+    'arima': {'method_kwargs': {'maxiter': 5}},
+    'exp_smoothing': {'use_brute': False, 'minimize_kwargs': {'options': {'maxiter': 5}}},
+    'garch': {'options': {'maxiter': 5}},
+}
+
+
+# Differences that make the series stationary: difference while the KPSS test rejects level
+# stationarity at the 5% level
+def differencing_order(values, max_d=MAX_DIFFERENCES, alpha=0.05):
+    from statsmodels.tsa.stattools import kpss
+
+    values = np.asarray(values, dtype=float)
+    for d in range(max_d):
+        if len(values) < 4 or np.ptp(values) == 0:
+            return d
+        with warnings.catch_warnings():
+            # p-values outside the test's table are reported at its bounds
+            warnings.simplefilter('ignore')
+            p_value = kpss(values, regression='c', nlags='auto')[1]
+        if p_value >= alpha:
+            return d
+        values = np.diff(values)
+    return max_d
+
+
+# Candidate specifications of a model. The likelihoods of ARIMA models with different d are of
+# differently differenced series and not comparable, so a fixed d limits the search to p and q.
+def candidate_specs(name, d=None):
+    if name == 'arima':
+        differences = range(MAX_DIFFERENCES + 1) if d is None else [d]
+        return [{'order': order} for order in itertools.product(range(4), differences, range(4))]
+    if name == 'garch':
+        return [{'p': p, 'q': q} for p, q in itertools.product(range(1, 4), range(0, 4))]
+    specs = []
+    for trend, seasonal in itertools.product([None, 'add', 'mul'], [None, 'add', 'mul']):
+        for damped_trend in ([False, True] if trend else [False]):
+            specs.append({'trend': trend, 'seasonal': seasonal, 'seasonal_periods': 12, 'damped_trend': damped_trend})
+    return specs
+
+
+def candidate_key(name, spec):
+    return json.dumps([name, spec], sort_keys=True)
+
+
+def _score(name, result, criterion, holdout_values):
+    if criterion == 'holdout':
+        forecast = forecast_model(name, result, len(holdout_values))['forecast'].to_numpy()
+        return float(np.mean(np.abs(forecast - holdout_values)))
+    return float(getattr(result, criterion))
+
+
+# Fit one candidate and score it. Partial fits stop the optimizer early; full fits can start from
+# the parameters a partial fit reached.
+def evaluate_candidate(task):
+    key, values, name, spec, criterion, holdout, partial, start_params = task
+    train, test = (values[:-holdout], values[-holdout:]) if criterion == 'holdout' else (values, None)
+    # statsmodels updates method_kwargs in place, so every fit gets its own copy
+    fit_kwargs = copy.deepcopy(PARTIAL_FIT[name]) if partial else {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            result = fit_model(name, train, spec, start_params=start_params, **fit_kwargs)
+            score = _score(name, result, criterion, test)
+            params = model_params(name, result)
+        except Exception:
+            return key, name, spec, np.inf, None
+    if not np.isfinite(score):
+        return key, name, spec, np.inf, None
+    return key, name, spec, score, params
+
+
+def _cache_path(cache_dir, values, criterion, holdout):
+    suffix = f'{criterion}-{holdout}' if criterion == 'holdout' else criterion
+    return os.path.join(cache_dir, f'{data_fingerprint(values)}-{suffix}.json')
+
+
+def load_scores(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_scores(path, scores):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(scores, f, indent=1, sort_keys=True)
+
+
+def _run(tasks, workers):
+    if workers == 1 or len(tasks) <= 1:
+        return list(map(evaluate_candidate, tasks))
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(evaluate_candidate, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+
+# Search the candidate specifications of every model for every series in two passes:
+#   1. a partial fit of every candidate (a few optimizer iterations), ranked per series and model;
+#   2. a full fit of the best `keep` fraction, warm-started from the partial fit.
+# Scores are cached per series fingerprint and criterion, so a rerun only evaluates new candidates.
+# Ranked by AIC or BIC, the ARIMA candidates of a series share the d of differencing_order(); the holdout
+# error compares forecasts, so it ranks every d.
+def search(series, model_names=MODELS, criterion='aic', holdout=12, keep=0.25, min_keep=3, workers=None,
+           cache_dir=DEFAULT_CACHE_DIR):
+    series = {key: np.asarray(values, dtype=float) for key, values in series.items()}
+    cache_paths = {key: _cache_path(cache_dir, values, criterion, holdout) for key, values in series.items()}
+    cached = {key: load_scores(path) for key, path in cache_paths.items()}
+    arima_d = {key: differencing_order(values) if criterion != 'holdout' and 'arima' in model_names else None
+               for key, values in series.items()}
+    candidates = {key: {candidate_key(name, spec): (name, spec) for name in model_names
+                        for spec in candidate_specs(name, arima_d[key])} for key in series}
+    for key, d in arima_d.items():
+        if d is not None:
+            print(f"ARIMA candidates for {key} use d={d} (KPSS test).")
+
+    start = time.perf_counter()
+    partial_tasks = [(key, values, name, spec, criterion, holdout, True, None)
+                     for key, values in series.items() for candidate, (name, spec) in candidates[key].items()
+                     if candidate not in cached[key]]
+    partial_results = _run(partial_tasks, workers)
+
+    # Keep the best partial fits of each series and model
+    full_tasks = []
+    for (key, name), group in itertools.groupby(sorted(partial_results, key=lambda r: (r[0], r[1], r[3])),
+                                                key=lambda r: (r[0], r[1])):
+        group = list(group)
+        n_keep = max(min_keep, int(np.ceil(len(group) * keep)))
+        for rank, (_, _, spec, score, params) in enumerate(group):
+            if rank < n_keep and np.isfinite(score):
+                full_tasks.append((key, series[key], name, spec, criterion, holdout, False, params))
+            else:
+                cached[key][candidate_key(name, spec)] = {'score': score, 'stage': 'pruned'}
+
+    for key, name, spec, score, _ in _run(full_tasks, workers):
+        cached[key][candidate_key(name, spec)] = {'score': score, 'stage': 'full'}
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(partial_tasks)} new candidates ({len(full_tasks)} fully fitted) in {elapsed:.2f}s.")
+
+    rows = []
+    for key, scores in cached.items():
+        save_scores(cache_paths[key], scores)
+        # Scores cached for other candidates, such as ARIMA orders with another d, stay in the cache
+        for candidate, entry in scores.items():
+            if candidate in candidates[key]:
+                name, spec = candidates[key][candidate]
+                rows.append({'series': key, 'model': name, 'spec': json.dumps(spec, sort_keys=True),
+                             'score': entry['score'], 'stage': entry['stage']})
+    if not rows:
+        print("No candidates to rank.")
+        return pd.DataFrame(columns=RANKING_COLUMNS)
+    ranking = pd.DataFrame(rows, columns=RANKING_COLUMNS)
+    ranking['fully_fitted'] = ranking['stage'] == 'full'
+    ranking = ranking.sort_values(['series', 'model', 'fully_fitted', 'score'], ascending=[True, True, False, True])
+    return ranking.drop(columns='fully_fitted').reset_index(drop=True)
+
+
+def best_specs(ranking):
+    full = ranking[ranking['stage'] == 'full']
+    best = full.loc[full.groupby(['series', 'model'])['score'].idxmin()]
+    return {(row.series, row.model): json.loads(row.spec) for row in best.itertuples()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Search model orders and configurations.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--series', nargs='+', default=[TOTAL_SERIES])
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=MODELS)
+    parser.add_argument('--criterion', choices=CRITERIA, default='aic')
+    parser.add_argument('--holdout', type=int, default=12, help='months held out for the holdout criterion')
+    parser.add_argument('--keep', type=float, default=0.25, help='fraction of candidates fully fitted')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='model_selection.csv')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    saas_data = load_validated(args.data) if args.validate else load_saas_data(args.data)
+    series = load_series(saas_data, args.series)
+    ranking = search(series, args.models, args.criterion, args.holdout, args.keep, workers=args.workers)
+    best = best_specs(ranking)
+    for (key, name), spec in best.items():
+        print(f"Best {name} for {key}: {spec}")
+    if not best:
+        print("No candidate could be fitted.")
+    ranking.to_csv(args.output, index=False)
+    print(f"Model ranking saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
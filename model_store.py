@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+from models import DEFAULT_SPECS, fit_model, model_params
+
+DEFAULT_STORE_DIR = '.model_store'
+
+# ARIMA results are extended with new observations at the old parameters until this many months have
+# been appended since the last optimization; after that the model is re-estimated from the stored params.
+MAX_EXTEND = 6
+
+
+def data_fingerprint(values):
+    values = np.ascontiguousarray(np.asarray(values, dtype=np.float64))
+    return hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
+
+
+def _entry_path(store_dir, series_id, name, spec):
+    key = json.dumps([series_id, name, spec], sort_keys=True, default=list)
+    return os.path.join(store_dir, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '.pkl')
+
+
+def load_entry(store_dir, series_id, name, spec):
+    path = _entry_path(store_dir, series_id, name, spec)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_entry(store_dir, entry):
+    os.makedirs(store_dir, exist_ok=True)
+    path = _entry_path(store_dir, entry['series_id'], entry['model'], entry['spec'])
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+# How a stored fit relates to the current history: 'same', 'grown' (only new months were appended)
+# or 'changed'
+def history_status(entry, values):
+    n_obs = entry['n_obs']
+    if len(values) < n_obs or data_fingerprint(values[:n_obs]) != entry['fingerprint']:
+        return 'changed'
+    return 'same' if len(values) == n_obs else 'grown'
+
+
+def _extend(name, entry, y):
+    result = entry['result']
+    if name == 'arima':
+        return result.append(y[entry['n_obs']:], refit=False)
+
+    import arch
+
+    spec = entry['spec']
+    return arch.arch_model(y, vol='Garch', p=spec['p'], q=spec['q']).fix(entry['params'])
+
+
+# Return a fitted model for the series, reusing the store where possible:
+#   cached - the history is unchanged, the stored result is returned as is
+#   extended - new months were appended; ARIMA/GARCH state is updated at the stored parameters
+#   warm - new months were appended; the model is re-estimated starting from the stored parameters
+#   cold - no usable entry, the model is fitted from scratch
+def fit_cached(series_id, name, y, spec=None, store_dir=DEFAULT_STORE_DIR, max_extend=MAX_EXTEND):
+    spec = dict(DEFAULT_SPECS[name] if spec is None else spec)
+    values = np.asarray(y, dtype=np.float64)
+    entry = load_entry(store_dir, series_id, name, spec)
+    status = 'cold' if entry is None else history_status(entry, values)
+
+    if status == 'same':
+        return entry['result'], 'cached'
+
+    if status == 'grown' and name != 'exp_smoothing' and len(values) - entry['fitted_n_obs'] <= max_extend:
+        result, how, fitted_n_obs = _extend(name, entry, y), 'extended', entry['fitted_n_obs']
+    elif status == 'grown':
+        result = fit_model(name, y, spec, start_params=entry['params'])
+        how, fitted_n_obs = 'warm', len(values)
+    else:
+        result, how, fitted_n_obs = fit_model(name, y, spec), 'cold', len(values)
+
+    params = entry['params'] if how == 'extended' else model_params(name, result)
+    save_entry(store_dir, {
+        'series_id': series_id, 'model': name, 'spec': spec, 'n_obs': len(values),
+        'fingerprint': data_fingerprint(values), 'fitted_n_obs': fitted_n_obs, 'params': params,
+        'result': result,
+    })
+    return result, how
@@ -0,0 +1,104 @@
+import pandas as pd
+import numpy as np
+
+import profiling
+
+# Model specifications used by Forecasting.py
+ARIMA_ORDER = (1, 1, 1)
+GARCH_ORDER = (1, 1)
+EXP_SMOOTHING = {'trend': 'add', 'seasonal': 'add', 'seasonal_periods': 12, 'damped_trend': False}
+
+MODELS = ['arima', 'exp_smoothing', 'garch']
+
+DEFAULT_SPECS = {
+    'arima': {'order': ARIMA_ORDER},
+    'exp_smoothing': EXP_SMOOTHING,
+    'garch': {'p': GARCH_ORDER[0], 'q': GARCH_ORDER[1]},
+}
+
+# z-value for the 95% forecast intervals
+INTERVAL_Z = 1.959963984540054
+
+
+# statsmodels and arch are imported inside the fit functions so that importing this module stays cheap
+
+# Extra keyword arguments are passed on to the model's fit method
+
+def fit_arima(y, order=ARIMA_ORDER, start_params=None, **fit_kwargs):
+    from statsmodels.tsa.arima.model import ARIMA
+
+    return ARIMA(y, order=tuple(order)).fit(start_params=start_params, **fit_kwargs)
+
+
+def fit_exp_smoothing(y, trend='add', seasonal='add', seasonal_periods=12, damped_trend=False, start_params=None,
+                      **fit_kwargs):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    model = ExponentialSmoothing(y, trend=trend, seasonal=seasonal, seasonal_periods=seasonal_periods,
+                                 damped_trend=damped_trend)
+    return model.fit(start_params=start_params, **fit_kwargs)
+
+
+def fit_garch(y, p=1, q=1, start_params=None, **fit_kwargs):
+    import arch
+
+    return arch.arch_model(y, vol='Garch', p=p, q=q).fit(disp='off', starting_values=start_params, **fit_kwargs)
+
+
+FITTERS = {
+    'arima': fit_arima,
+    'exp_smoothing': fit_exp_smoothing,
+    'garch': fit_garch,
+}
+
+
+def fit_model(name, y, spec=None, start_params=None, **fit_kwargs):
+    spec = DEFAULT_SPECS[name] if spec is None else spec
+    with profiling.stage(f'fit {name}', n_obs=len(y), warm=start_params is not None):
+        result = FITTERS[name](y, start_params=start_params, **spec, **fit_kwargs)
+        if profiling.enabled():
+            profiling.count('iterations', fit_iterations(name, result))
+    return result
+
+
+# Number of optimizer iterations a fit took
+def fit_iterations(name, result):
+    if name == 'arima':
+        return int(result.mle_retvals.get('iterations', 0)) if result.mle_retvals else 0
+    if name == 'exp_smoothing':
+        return int(getattr(result.mle_retvals, 'nit', 0))
+    return int(getattr(result.optimization_result, 'nit', 0))
+
+
+# Estimated parameters in the form the fit functions accept as start_params
+def model_params(name, result):
+    if name != 'exp_smoothing':
+        return np.asarray(result.params, dtype=float)
+
+    # Holt-Winters takes the free parameters in the order alpha, beta, gamma, l0, b0, phi, seasons
+    params = result.params
+    head = np.array([params['smoothing_level'], params['smoothing_trend'], params['smoothing_seasonal'],
+                     params['initial_level'], params['initial_trend'], params['damping_trend']], dtype=float)
+    seasons = np.asarray(params['initial_seasons'], dtype=float) if result.model.has_seasonal else np.array([])
+    return np.concatenate([head[~np.isnan(head)], seasons])
+
+
+# Point forecast, variance and 95% interval for the next `steps` periods
+def forecast_model(name, result, steps):
+    if name == 'arima':
+        prediction = result.get_forecast(steps)
+        mean = np.asarray(prediction.predicted_mean, dtype=float)
+        variance = np.asarray(prediction.var_pred_mean, dtype=float)
+    elif name == 'exp_smoothing':
+        mean = np.asarray(result.forecast(steps), dtype=float)
+        # Normal approximation, widening with the horizon
+        variance = np.var(result.resid) * np.arange(1, steps + 1)
+    else:
+        forecast = result.forecast(horizon=steps, reindex=False)
+        mean = forecast.mean.iloc[-1].to_numpy(dtype=float)
+        variance = forecast.variance.iloc[-1].to_numpy(dtype=float)
+
+    spread = INTERVAL_Z * np.sqrt(variance)
+    return pd.DataFrame({'step': np.arange(1, steps + 1), 'forecast': mean, 'variance': variance,
+                         'lower': mean - spread, 'upper': mean + spread})
+
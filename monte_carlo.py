@@ -0,0 +1,168 @@
+import argparse
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+import profiling
+from metrics import compute
+from metrics_store import load_metrics_store
+from model_store import fit_cached
+from models import forecast_model
+
+COST_COLUMNS = ['Fixed_Costs', 'Variable_Costs', 'Marketing_Spend']
+PERCENTILES = [5, 25, 50, 75, 95]
+DEFAULT_CHUNK_PATHS = 50_000
+
+# Histogram resolution used for the streaming percentiles
+DEFAULT_BINS = 4000
+
+
+# Histogram range for profit and cash flow wide enough for any plausible path; values outside it land
+# in the under/overflow bins.
+def histogram_edges(mean, variance, cost_history, n_bins=DEFAULT_BINS, spread=8.0):
+    sd = np.sqrt(variance)
+    operating = cost_history['Fixed_Costs'] + cost_history['Variable_Costs']
+    total = operating + cost_history['Marketing_Spend']
+    return {
+        'profit': np.linspace((mean - spread * sd).min() - operating.max(),
+                              (mean + spread * sd).max() - operating.min(), n_bins + 1),
+        'cash_flow': np.linspace((mean - spread * sd).min() - total.max(),
+                                 (mean + spread * sd).max() - total.min(), n_bins + 1),
+    }
+
+
+def _histogram(values, edges):
+    horizon = values.shape[1]
+    n_bins = len(edges) - 1
+    width = edges[1] - edges[0]
+    # Bin 0 is the underflow bin and bin n_bins + 1 the overflow bin
+    bins = np.clip(np.floor((values - edges[0]) / width), -1, n_bins).astype(np.int64) + 1
+    flat = bins + np.arange(horizon)[None, :] * (n_bins + 2)
+    return np.bincount(flat.ravel(), minlength=horizon * (n_bins + 2)).reshape(horizon, n_bins + 2)
+
+
+# Simulate one chunk of paths and reduce it to mergeable partial aggregates
+def simulate_chunk(task):
+    n_paths, seed_sequence, mean, variance, cost_history, edges = task
+    rng = np.random.default_rng(seed_sequence)
+    horizon = len(mean)
+
+    # MRR from the ARIMA mean and the GARCH conditional variance
+    mrr = mean + np.sqrt(variance) * rng.standard_normal((n_paths, horizon))
+
+    # Costs resampled jointly from historical months
+    months = rng.integers(0, len(cost_history['Fixed_Costs']), size=(n_paths, horizon))
+    profit = mrr - cost_history['Fixed_Costs'][months] - cost_history['Variable_Costs'][months]
+    cash_flow = profit - cost_history['Marketing_Spend'][months]
+    cumulative_cash = np.cumsum(cash_flow, axis=1)
+
+    partial = {'paths': n_paths, 'negative_cash_flow': (cash_flow < 0).sum(axis=0),
+               'negative_cumulative_cash': (cumulative_cash < 0).sum(axis=0)}
+    for name, values in [('profit', profit), ('cash_flow', cash_flow)]:
+        partial[f'{name}_sum'] = values.sum(axis=0)
+        partial[f'{name}_histogram'] = _histogram(values, edges[name])
+    return partial
+
+
+def merge_partials(total, partial):
+    if total is None:
+        return partial
+    return {key: total[key] + value for key, value in partial.items()}
+
+
+def histogram_percentiles(histogram, edges, percentiles):
+    counts = histogram[:, 1:-1]
+    cdf = np.cumsum(histogram, axis=1)[:, :-1]
+    total = histogram.sum(axis=1, keepdims=True)
+    width = edges[1] - edges[0]
+    result = np.empty((histogram.shape[0], len(percentiles)))
+    for j, q in enumerate(percentiles):
+        target = total[:, 0] * q / 100
+        # First bin whose cumulative count reaches the target, interpolated inside the bin
+        idx = np.clip((cdf < target[:, None]).sum(axis=1), 1, counts.shape[1])
+        below = cdf[np.arange(len(idx)), idx - 1]
+        in_bin = np.maximum(counts[np.arange(len(idx)), idx - 1], 1)
+        result[:, j] = edges[idx - 1] + width * np.clip((target - below) / in_bin, 0, 1)
+    return result
+
+
+# Sample n_paths MRR and cost paths and return per-month percentile bands and the probability of a
+# negative cash flow. Paths are simulated in chunks, each with its own seeded stream, across worker
+# processes; only histograms and running sums are kept, so memory does not grow with n_paths.
+def simulate(mean, variance, cost_history, n_paths=200_000, chunk_paths=DEFAULT_CHUNK_PATHS, workers=None,
+             seed=None, n_bins=DEFAULT_BINS, percentiles=PERCENTILES):
+    mean = np.asarray(mean, dtype=float)
+    variance = np.asarray(variance, dtype=float)
+    cost_history = {column: np.asarray(cost_history[column], dtype=float) for column in COST_COLUMNS}
+    edges = histogram_edges(mean, variance, cost_history, n_bins)
+
+    n_chunks = math.ceil(n_paths / chunk_paths)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    tasks = ((min(chunk_paths, n_paths - i * chunk_paths), seeds[i], mean, variance, cost_history, edges)
+             for i in range(n_chunks))
+
+    total = None
+    with profiling.stage('monte carlo', paths=n_paths, chunks=n_chunks):
+        if workers == 1 or n_chunks == 1:
+            for task in tasks:
+                total = merge_partials(total, simulate_chunk(task))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for partial in executor.map(simulate_chunk, tasks):
+                    total = merge_partials(total, partial)
+
+    summary = pd.DataFrame({'step': np.arange(1, len(mean) + 1)})
+    for name in ['profit', 'cash_flow']:
+        summary[f'{name}_mean'] = total[f'{name}_sum'] / total['paths']
+        bands = histogram_percentiles(total[f'{name}_histogram'], edges[name], percentiles)
+        for j, q in enumerate(percentiles):
+            summary[f'{name}_p{q}'] = bands[:, j]
+    summary['prob_negative_cash_flow'] = total['negative_cash_flow'] / total['paths']
+    summary['prob_negative_cumulative_cash'] = total['negative_cumulative_cash'] / total['paths']
+    return summary
+
+
+def cost_history_from_data(saas_data):
+    return {column: saas_data[column].to_numpy(dtype=float) for column in COST_COLUMNS}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Monte Carlo simulation of profit and cash flow.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    parser.add_argument('--paths', type=int, default=200_000)
+    parser.add_argument('--horizon', type=int, default=12)
+    parser.add_argument('--chunk-paths', type=int, default=DEFAULT_CHUNK_PATHS)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', default='monte_carlo_summary.csv')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Company-wide monthly totals, as in Forecasting.py
+    saas_data = load_metrics_store(args.data, args.validate).monthly_totals()
+    compute(saas_data, ['Total_MRR'])
+
+    arima_result, _ = fit_cached('Total_MRR', 'arima', saas_data['Total_MRR'])
+    garch_result, _ = fit_cached('Total_MRR', 'garch', saas_data['Total_MRR'])
+    mean = forecast_model('arima', arima_result, args.horizon)['forecast']
+    variance = forecast_model('garch', garch_result, args.horizon)['variance']
+
+    start = time.perf_counter()
+    summary = simulate(mean, variance, cost_history_from_data(saas_data), args.paths, args.chunk_paths,
+                       args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"Simulated {args.paths} paths in {elapsed:.2f}s.")
+    print(summary[['step', 'cash_flow_p5', 'cash_flow_p50', 'cash_flow_p95', 'prob_negative_cash_flow']])
+
+    summary.to_csv(args.output, index=False)
+    print(f"Monte Carlo summary saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+import pandas as pd
+
+# Setting SAAS_PROFILE to a file name turns profiling on for the scripts; the Chrome trace is written there
+PROFILE_ENV = 'SAAS_PROFILE'
+# 'rss' (default) samples the resident set size, 'tracemalloc' measures Python allocations per stage
+MEMORY_ENV = 'SAAS_PROFILE_MEMORY'
+
+RSS_INTERVAL = 0.01
+
+# The active profiler, or None. While it is None, stage() hands back one shared no-op context and
+# count() returns at once, so instrumented code pays little more than a global lookup.
+_profiler = None
+_NO_STAGE = nullcontext()
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        # Peak rather than current RSS where /proc is not available
+        scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class _Stage:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.counters = {}
+        self.peak = 0
+
+    def __enter__(self):
+        profiler = self.profiler
+        if profiler.memory == 'tracemalloc':
+            import tracemalloc
+
+            # Keep the enclosing stage's peak before the peak is reset for this one
+            if profiler.stack:
+                profiler.stack[-1].peak = max(profiler.stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.start_memory = tracemalloc.get_traced_memory()[0]
+        profiler.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        profiler = self.profiler
+        profiler.stack.pop()
+        event = {'name': self.name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                 'ts': (self.start - profiler.origin) * 1e6, 'dur': (end - self.start) * 1e6,
+                 'args': dict(self.args, **self.counters)}
+        if profiler.memory == 'tracemalloc':
+            import tracemalloc
+
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            event['args']['peak_alloc_mb'] = (self.peak - self.start_memory) / 1024 ** 2
+            if profiler.stack:
+                profiler.stack[-1].peak = max(profiler.stack[-1].peak, self.peak)
+        profiler.events.append(event)
+        return False
+
+
+class Profiler:
+    def __init__(self, memory='rss'):
+        self.memory = memory
+        self.events = []
+        self.stack = []
+        self.origin = time.perf_counter()
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.memory == 'tracemalloc':
+            import tracemalloc
+
+            tracemalloc.start()
+        elif self.memory == 'rss':
+            self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        if self.memory == 'tracemalloc':
+            import tracemalloc
+
+            tracemalloc.stop()
+        elif self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+
+    def _sample_rss(self):
+        while not self._stop.wait(RSS_INTERVAL):
+            self.events.append({'name': 'memory', 'ph': 'C', 'pid': os.getpid(),
+                                'ts': (time.perf_counter() - self.origin) * 1e6, 'args': {'rss_mb': _rss_mb()}})
+
+    # Chrome trace format, readable by chrome://tracing and Perfetto
+    def trace(self):
+        return {'traceEvents': sorted(self.events, key=lambda event: event['ts']), 'displayTimeUnit': 'ms'}
+
+    # Calls, time and counters per stage name
+    def summary(self):
+        stages = [event for event in self.events if event['ph'] == 'X']
+        if not stages:
+            return pd.DataFrame()
+        frame = pd.DataFrame([dict(event['args'], stage=event['name'], seconds=event['dur'] / 1e6)
+                              for event in stages])
+        aggregations = {'calls': ('seconds', 'size'), 'total_s': ('seconds', 'sum'), 'mean_s': ('seconds', 'mean'),
+                        'max_s': ('seconds', 'max')}
+        if 'peak_alloc_mb' in frame:
+            aggregations['peak_alloc_mb'] = ('peak_alloc_mb', 'max')
+        rss = [(event['ts'], event['args']['rss_mb']) for event in self.events if event['ph'] == 'C']
+        summary = frame.groupby('stage', sort=False).agg(**aggregations)
+        if 'iterations' in frame:
+            summary['iterations'] = frame.groupby('stage', sort=False)['iterations'].sum(min_count=1)
+        if rss:
+            # Highest sampled RSS while each stage was running; only this process is sampled
+            peaks = {}
+            for event in stages:
+                if event['pid'] != os.getpid():
+                    continue
+                inside = [value for ts, value in rss if event['ts'] <= ts <= event['ts'] + event['dur']]
+                if inside:
+                    peaks[event['name']] = max(peaks.get(event['name'], 0), max(inside))
+            summary['peak_rss_mb'] = pd.Series(peaks)
+        return summary.sort_values('total_s', ascending=False)
+
+
+def enable(memory='rss'):
+    global _profiler
+    _profiler = Profiler(memory)
+    _profiler.start()
+    return _profiler
+
+
+def disable():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+# Time a block of a pipeline as a named stage when profiling is on
+def stage(name, **args):
+    if _profiler is None:
+        return _NO_STAGE
+    return _Stage(_profiler, name, args)
+
+
+# Add a stage timed elsewhere, such as in a worker process; start and end are time.perf_counter() values,
+# which share one clock across the processes of a machine
+def record(name, start, end, pid=None, **args):
+    if _profiler is None:
+        return
+    _profiler.events.append({'name': name, 'ph': 'X', 'pid': pid or os.getpid(), 'tid': 0,
+                             'ts': (start - _profiler.origin) * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+
+
+# Add to a counter (such as optimizer iterations) of the innermost running stage
+def count(name, value):
+    if _profiler is None or not _profiler.stack:
+        return
+    counters = _profiler.stack[-1].counters
+    counters[name] = counters.get(name, 0) + value
+
+
+# Turn profiling on when SAAS_PROFILE is set and no profiler is running yet (saas.py may have started one).
+# Returns whether a profiler was started, in which case the caller should finish() it.
+def enable_from_env():
+    if os.environ.get(PROFILE_ENV) and _profiler is None:
+        enable(os.environ.get(MEMORY_ENV, 'rss'))
+        return True
+    return False
+
+
+# Stop profiling, write the Chrome trace and print the summary table
+def finish(path=None):
+    path = path or os.environ.get(PROFILE_ENV)
+    profiler = disable()
+    if profiler is None:
+        return None
+    with open(path, 'w') as f:
+        json.dump(profiler.trace(), f)
+    print("Profile by stage:\n", profiler.summary().to_string())
+    print(f"Profile trace saved as '{path}'.")
+    return profiler
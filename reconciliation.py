@@ -0,0 +1,222 @@
+import argparse
+import itertools
+
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from Dataset_Generation import CUSTOMER_TYPES, REGIONS
+from batch_forecasting import ALL, forecast_series
+from data_loader import load_saas_data
+from data_quality import load_validated
+from metrics import TIERS
+from models import MODELS
+
+# Dimensions of the hierarchy. A node fixes some dimensions and aggregates ('*') the others, so the
+# nodes are the total, every tier, region and customer type, and all their crossings; the bottom nodes
+# fix every dimension. Without tenants the node keys are the series keys of batch_forecasting.py.
+DIMENSIONS = [('Tier', TIERS), ('Region', REGIONS), ('Customer_Type', CUSTOMER_TYPES)]
+METHODS = ['bottom_up', 'top_down', 'ols', 'structural', 'mint']
+
+
+# Nodes and the sparse summing matrix S (nodes x bottom series), aggregate nodes first and the bottom
+# nodes last in the order of the bottom series. `tenants` adds a leading tenant dimension.
+def build_hierarchy(tenants=None):
+    dimensions = ([('Tenant_ID', list(tenants))] if tenants is not None else []) + DIMENSIONS
+    names = [name for name, _ in dimensions]
+    sizes = np.array([len(labels) for _, labels in dimensions])
+    n_bottom = int(sizes.prod())
+    bottom_codes = np.unravel_index(np.arange(n_bottom), sizes)
+
+    node_labels, rows, cols = [], [], []
+    n_nodes = 0
+    # Levels from the total (nothing fixed) to the bottom (everything fixed)
+    for keep in sorted(itertools.product([False, True], repeat=len(dimensions)), key=sum):
+        keep = np.array(keep)
+        level_sizes = sizes[keep]
+        n_level = int(level_sizes.prod())
+        level_codes = np.unravel_index(np.arange(n_level), level_sizes) if keep.any() else ()
+        labels = {}
+        for i, (name, values) in enumerate(dimensions):
+            if keep[i]:
+                labels[name] = np.asarray(values, dtype=object)[level_codes[int(keep[:i].sum())]]
+            else:
+                labels[name] = np.full(n_level, ALL, dtype=object)
+        node_labels.append(pd.DataFrame(labels))
+        # Every bottom series adds to exactly one node of each level
+        node = np.zeros(n_bottom, dtype=np.int64)
+        if keep.any():
+            node = np.ravel_multi_index([bottom_codes[i] for i in np.flatnonzero(keep)], level_sizes)
+        rows.append(n_nodes + node)
+        cols.append(np.arange(n_bottom))
+        n_nodes += n_level
+
+    nodes = pd.concat(node_labels, ignore_index=True)
+    key = nodes[names[0]].astype(str)
+    for name in names[1:]:
+        key = key + '/' + nodes[name].astype(str)
+    nodes.insert(0, 'key', key)
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    summing = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_nodes, n_bottom))
+    return {'dimensions': dimensions, 'nodes': nodes, 'S': summing, 'n_bottom': n_bottom,
+            'n_aggregate': n_nodes - n_bottom}
+
+
+# Monthly MRR of every bottom series, shape (bottom series, months), summed from the rows in one pass
+def bottom_history(saas_data, hierarchy):
+    months, month_codes = np.unique(saas_data['Month'].to_numpy(), return_inverse=True)
+    codes = []
+    for name, labels in hierarchy['dimensions']:
+        if name != 'Tier':
+            codes.append(pd.Categorical(saas_data[name], categories=labels).codes.astype(np.int64))
+    valid = np.all([code >= 0 for code in codes], axis=0)
+    sizes = [len(labels) for _, labels in hierarchy['dimensions']]
+    tier_axis = [name for name, _ in hierarchy['dimensions']].index('Tier')
+
+    flat_index, weights = [], []
+    for t, tier in enumerate(TIERS):
+        index_codes = codes[:tier_axis] + [np.full(len(month_codes), t)] + codes[tier_axis:]
+        bottom = np.ravel_multi_index([code[valid] for code in index_codes], sizes)
+        flat_index.append(bottom * len(months) + month_codes[valid])
+        weights.append(saas_data[f'MRR_{tier}'].to_numpy(dtype=float)[valid])
+    history = np.bincount(np.concatenate(flat_index), weights=np.concatenate(weights),
+                          minlength=hierarchy['n_bottom'] * len(months))
+    return history.reshape(hierarchy['n_bottom'], len(months)), pd.DatetimeIndex(months)
+
+
+# History of every node: all the aggregates from one sparse product
+def node_history(hierarchy, bottom):
+    return np.asarray(hierarchy['S'] @ bottom)
+
+
+def _weights(hierarchy, method, variance):
+    if method == 'ols':
+        return np.ones(hierarchy['S'].shape[0])
+    if method == 'structural':
+        # Number of bottom series under each node
+        return np.asarray(hierarchy['S'].sum(axis=1)).ravel()
+    if variance is None:
+        raise ValueError('mint reconciliation needs the one-step forecast variances')
+    # Nodes with zero variance (such as series that are always zero) keep a small positive weight
+    variance = np.asarray(variance, dtype=float)
+    return np.maximum(variance, max(variance.max(), 1.0) * 1e-9)
+
+
+# Reconcile base forecasts of every node, shape (nodes, horizon), so that every aggregate equals the sum
+# of its bottom series:
+#   bottom_up - aggregates are the sums of the bottom forecasts
+#   top_down - the total forecast is split by the bottom series' shares of the historical total
+#   ols, structural, mint - minimum trace (MinT) reconciliation with a diagonal covariance: equal
+#       weights, weights by the number of bottom series, or the nodes' one-step forecast variances
+# The MinT solution is computed in its constraint form
+#   y~ = y^ - W C' (C W C')^-1 C y^,  C = [I  -S_aggregate]
+# one sparse factorization over the aggregate nodes for all horizons, which stays sparse when the
+# hierarchy is crossed with many tenants.
+def reconcile(hierarchy, base, method='mint', variance=None, history=None):
+    base = np.asarray(base, dtype=float)
+    summing = hierarchy['S']
+    n_aggregate = hierarchy['n_aggregate']
+
+    if method == 'bottom_up':
+        return np.asarray(summing @ base[n_aggregate:])
+    if method == 'top_down':
+        if history is None:
+            raise ValueError('top-down reconciliation needs the bottom series history')
+        history = np.asarray(history, dtype=float)
+        shares = history.mean(axis=1) / max(history.mean(axis=1).sum(), np.finfo(float).tiny)
+        return np.asarray(summing @ (shares[:, None] * base[0]))
+    if method not in METHODS:
+        raise ValueError(f"unknown reconciliation method '{method}'")
+
+    weights = _weights(hierarchy, method, variance)
+    aggregate_summing = summing[:n_aggregate]
+    weights_aggregate, weights_bottom = weights[:n_aggregate], weights[n_aggregate:]
+    gap = base[:n_aggregate] - aggregate_summing @ base[n_aggregate:]
+    system = (sparse.diags(weights_aggregate)
+              + aggregate_summing @ sparse.diags(weights_bottom) @ aggregate_summing.T)
+    multipliers = splu(sparse.csc_matrix(system)).solve(np.ascontiguousarray(gap))
+    return np.vstack([base[:n_aggregate] - weights_aggregate[:, None] * multipliers,
+                      base[n_aggregate:] + weights_bottom[:, None] * (aggregate_summing.T @ multipliers)])
+
+
+# Largest gap between any aggregate and the sum of its bottom series
+def incoherence(hierarchy, forecasts):
+    n_aggregate = hierarchy['n_aggregate']
+    return float(np.abs(forecasts[:n_aggregate] - hierarchy['S'][:n_aggregate] @ forecasts[n_aggregate:]).max())
+
+
+# Base forecasts and one-step variances of every node from one model, fitted across a process pool.
+# Nodes whose fit fails get a zero forecast with a very large variance, so MinT overrides them.
+def base_forecasts(hierarchy, history, horizon=12, model='arima', workers=None):
+    keys = hierarchy['nodes']['key']
+    frame = forecast_series(dict(zip(keys, history)), horizon, [model], workers)
+    forecasts = frame.pivot(index='series', columns='step', values='forecast').reindex(keys)
+    variance = frame[frame['step'] == 1].set_index('series')['variance'].reindex(keys)
+    missing = forecasts.isna().any(axis=1).to_numpy()
+    if missing.any():
+        print(f"No base forecast for {missing.sum()} nodes; they are reconciled from the other nodes.")
+    variance = np.array(variance, dtype=float)
+    variance[missing] = np.nanmax(np.append(variance[~missing], 1.0)) * 1e6
+    return np.nan_to_num(forecasts.to_numpy(dtype=float)), variance
+
+
+def reconcile_all(hierarchy, base, variance, bottom, methods=METHODS):
+    return {method: reconcile(hierarchy, base, method, variance, bottom) for method in methods}
+
+
+def tidy_forecasts(hierarchy, base, reconciled, months):
+    frames = []
+    for method, values in [('base', base)] + list(reconciled.items()):
+        frame = pd.DataFrame(values, index=hierarchy['nodes']['key'], columns=months)
+        frame = frame.rename_axis(index='series', columns='Month').stack().rename('forecast').reset_index()
+        frame.insert(0, 'method', method)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Reconcile MRR forecasts over the tier/region/customer type hierarchy.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--model', choices=MODELS, default='arima', help='model of the base forecasts')
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=METHODS)
+    parser.add_argument('--horizon', type=int, default=12)
+    parser.add_argument('--tenants', action='store_true', help='cross the hierarchy with the tenants')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='reconciled_forecasts.csv')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    saas_data = load_validated(args.data) if args.validate else load_saas_data(args.data)
+    if args.tenants and 'Tenant_ID' not in saas_data.columns:
+        raise SystemExit('--tenants needs a dataset with a Tenant_ID column')
+    hierarchy = build_hierarchy(np.unique(saas_data['Tenant_ID']) if args.tenants else None)
+    bottom, months = bottom_history(saas_data, hierarchy)
+    print(f"Hierarchy of {len(hierarchy['nodes'])} nodes over {hierarchy['n_bottom']} bottom series.")
+
+    base, variance = base_forecasts(hierarchy, node_history(hierarchy, bottom), args.horizon, args.model,
+                                    args.workers)
+    reconciled = reconcile_all(hierarchy, base, variance, bottom, args.methods)
+
+    # The total against the sum of the tiers, before and after reconciliation
+    nodes = hierarchy['nodes']
+    fixed = nodes.drop(columns=['key', 'Tier']).eq(ALL).all(axis=1)
+    total, tiers = np.flatnonzero(fixed & (nodes['Tier'] == ALL))[0], np.flatnonzero(fixed & (nodes['Tier'] != ALL))
+    rows = []
+    for method, values in [('base', base)] + list(reconciled.items()):
+        rows.append({'method': method, 'incoherence': incoherence(hierarchy, values),
+                     'total_step_1': values[total, 0], 'sum_of_tiers_step_1': values[tiers, 0].sum(),
+                     f'total_step_{args.horizon}': values[total, -1],
+                     f'sum_of_tiers_step_{args.horizon}': values[tiers, -1].sum()})
+    print(pd.DataFrame(rows).set_index('method').to_string())
+
+    forecast_months = pd.date_range(months[-1], periods=args.horizon + 1, freq=pd.offsets.MonthEnd())[1:]
+    tidy_forecasts(hierarchy, base, reconciled, forecast_months).to_csv(args.output, index=False)
+    print(f"Reconciled forecasts saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import profiling
+
+MANIFEST_NAME = '.chart_manifest.json'
+
+
+# A chart described as data: what to draw and where to save it. `series` holds
+# (kind, x, y, options) tuples where kind is 'plot', 'scatter', 'bar' or 'band' (y holds the lower
+# and upper bound); options are passed through to matplotlib. A 'stacked' layout draws each series in its own row.
+@dataclass
+class ChartSpec:
+    path: str
+    title: str = ''
+    xlabel: str = ''
+    ylabel: str = ''
+    series: list = field(default_factory=list)
+    name: str = 'Plot'
+    figsize: tuple = (14, 7)
+    layout: str = 'single'
+    hlines: list = field(default_factory=list)
+    rotate_xticks: bool = False
+    legend: bool = True
+    grid: bool = False
+
+    def add(self, kind, x, y, **options):
+        self.series.append((kind, np.asarray(x), np.asarray(y), options))
+        return self
+
+    def plot(self, x, y, **options):
+        return self.add('plot', x, y, **options)
+
+
+def _update_hash(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(str(value.dtype).encode())
+        if value.dtype == object:
+            digest.update(repr(value.tolist()).encode())
+        else:
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _update_hash(digest, item)
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            digest.update(str(key).encode())
+            _update_hash(digest, value[key])
+    else:
+        digest.update(repr(value).encode())
+
+
+# Hash of everything that affects the rendered image
+def spec_hash(spec):
+    digest = hashlib.blake2b(digest_size=16)
+    for name in ('title', 'xlabel', 'ylabel', 'figsize', 'layout', 'hlines', 'rotate_xticks',
+                 'legend', 'grid', 'series'):
+        _update_hash(digest, getattr(spec, name))
+    return digest.hexdigest()
+
+
+def _init_worker():
+    import matplotlib
+    # Use the Agg backend for non-GUI plotting
+    matplotlib.use('Agg')
+
+
+def _draw(ax, kind, x, y, options):
+    if kind == 'scatter':
+        ax.scatter(x, y, **options)
+    elif kind == 'bar':
+        ax.bar(x, y, **options)
+    elif kind == 'band':
+        ax.fill_between(x, y[0], y[1], **options)
+    else:
+        ax.plot(x, y, **options)
+
+
+def render_chart(spec):
+    with profiling.stage(f'render {os.path.basename(spec.path)}'):
+        return _render(spec)
+
+
+def _render(spec):
+    _init_worker()
+    import matplotlib.pyplot as plt
+
+    if spec.layout == 'stacked':
+        fig, axes = plt.subplots(len(spec.series), 1, figsize=spec.figsize, sharex=True)
+        axes = np.atleast_1d(axes)
+        for ax, (kind, x, y, options) in zip(axes, spec.series):
+            _draw(ax, kind, x, y, options)
+            ax.set_ylabel(options.get('label', ''))
+        axes[0].set_title(spec.title)
+        axes[-1].set_xlabel(spec.xlabel)
+    else:
+        fig, ax = plt.subplots(figsize=spec.figsize)
+        for kind, x, y, options in spec.series:
+            _draw(ax, kind, x, y, options)
+        for y, options in spec.hlines:
+            ax.axhline(y, **options)
+        ax.set_title(spec.title)
+        ax.set_xlabel(spec.xlabel)
+        ax.set_ylabel(spec.ylabel)
+        if spec.rotate_xticks:
+            ax.tick_params(axis='x', labelrotation=45)
+        if spec.legend:
+            ax.legend()
+        if spec.grid:
+            ax.grid()
+
+    fig.tight_layout()
+    fig.savefig(spec.path)
+    plt.close(fig)
+    return spec.path
+
+
+def _render_timed(spec):
+    start = time.perf_counter()
+    path = render_chart(spec)
+    return path, os.getpid(), start, time.perf_counter()
+
+
+def _load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# Render the charts whose data changed since their PNG was written. Charts are rendered in a
+# process pool when there is more than one to draw, and every figure is closed after saving.
+def render_charts(specs, workers=None, force=False):
+    manifests = {}
+    pending = []
+    for spec in specs:
+        directory = os.path.dirname(os.path.abspath(spec.path))
+        manifest = manifests.setdefault(directory, _load_manifest(os.path.join(directory, MANIFEST_NAME)))
+        key = os.path.basename(spec.path)
+        digest = spec_hash(spec)
+        if not force and manifest.get(key) == digest and os.path.exists(spec.path):
+            print(f"{spec.name} unchanged, keeping '{spec.path}'.")
+            continue
+        pending.append((spec, manifest, key, digest))
+
+    if workers == 1 or len(pending) <= 1:
+        rendered = [render_chart(spec) for spec, *_ in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            timed = list(executor.map(_render_timed, [spec for spec, *_ in pending]))
+        rendered = [path for path, *_ in timed]
+        # Workers do not profile; their render times are added to the parent's profile
+        for path, pid, start, end in timed:
+            profiling.record(f'render {os.path.basename(path)}', start, end, pid=pid)
+
+    for (spec, manifest, key, digest), path in zip(pending, rendered):
+        manifest[key] = digest
+        print(f"{spec.name} saved as '{path}'.")
+
+    for directory, manifest in manifests.items():
+        with open(os.path.join(directory, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    return rendered
@@ -0,0 +1,85 @@
+import argparse
+import importlib
+import importlib.util
+import os
+import sys
+
+import profiling
+
+# Subcommands and the scripts they run. A script is only imported when its command is run, so a quick
+# command does not pay for statsmodels, arch or matplotlib.
+COMMANDS = {
+    'generate': ('Dataset_Generation', 'Generate a synthetic SaaS dataset.'),
+    'validate': ('data_quality', 'Check the data and quarantine partitions with bad values.'),
+    'insights': ('Data Cleaning and Analysis & Insights', 'Print insights and plot charts.'),
+    'forecast': ('Forecasting', 'Forecast MRR, profit and cash flow.'),
+    'sensitivity': ('sensitivity', 'Profit sensitivity over churn and cost scenarios.'),
+    'batch': ('batch_forecasting', 'Forecast MRR per tier, region and customer type.'),
+    'backtest': ('backtesting', 'Rolling-origin backtest of the forecasting models.'),
+    'simulate': ('monte_carlo', 'Monte Carlo simulation of profit and cash flow.'),
+    'joint': ('joint_forecast', 'Joint VAR projection of revenue, costs and marketing.'),
+    'reconcile': ('reconciliation', 'Reconcile forecasts over the tier/region/customer type hierarchy.'),
+    'select': ('model_selection', 'Search model orders and configurations.'),
+    'segments': ('segment_analytics', 'Segment breakdowns computed out of core.'),
+    'cohorts': ('cohort_analysis', 'Cohort retention and per-tier CLV.'),
+    'incremental': ('incremental_insights', 'Update the insights from newly appended months.'),
+    'store': ('metrics_store', 'Memory use of the array-backed metrics store.'),
+    'benchmark': ('benchmark', 'Benchmark every pipeline stage.'),
+    'serve': ('forecast_service', 'Serve forecast queries over HTTP.'),
+    'loadtest': ('load_generator', 'Load test the forecast service.'),
+}
+REPORT_HELP = 'Insights followed by the forecasts.'
+
+
+def load_command(command):
+    name = COMMANDS[command][0]
+    if name.isidentifier():
+        return importlib.import_module(name)
+    # The insights script's file name is not a valid module name, so it is loaded from its path
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{name}.py')
+    spec = importlib.util.spec_from_file_location('saas_insights', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_report(argv):
+    parser = argparse.ArgumentParser(prog='saas.py report', description=REPORT_HELP)
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--no-charts', action='store_true')
+    args = parser.parse_args(argv)
+    shared = ['--data', args.data] + (['--no-charts'] if args.no_charts else [])
+    load_command('insights').main(shared)
+    load_command('forecast').main(shared)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SaaS analytics: one entry point for every script.',
+                                     epilog="Run 'saas.py COMMAND --help' for the options of a command.")
+    parser.add_argument('--profile', metavar='TRACE', help='profile the command and save a Chrome trace here')
+    parser.add_argument('--profile-memory', choices=['rss', 'tracemalloc', 'none'], default='rss')
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+    for command, (_, help_text) in COMMANDS.items():
+        commands.add_parser(command, help=help_text, add_help=False)
+    commands.add_parser('report', help=REPORT_HELP, add_help=False)
+    # Everything after the command is parsed by the command itself
+    return parser.parse_known_args(argv)
+
+
+def main(argv=None):
+    args, command_argv = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.profile:
+        profiling.enable(args.profile_memory)
+
+    if args.command == 'report':
+        run_report(command_argv)
+    else:
+        load_command(args.command).main(command_argv)
+
+    if args.profile:
+        profiling.finish(args.profile)
+
+
+if __name__ == '__main__':
+    main()
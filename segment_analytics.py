@@ -0,0 +1,180 @@
+import argparse
+import glob
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from Dataset_Generation import CATEGORICAL_COLUMNS
+from metrics import CANCELLATION_COLUMNS, NEW_SUBSCRIBER_COLUMNS, compute, required_columns
+
+# Segment dimensions; every partition is reduced to one cell per combination of their categories
+DIMENSIONS = ['Region', 'Customer_Type', 'Churn_Reason']
+
+# Row-level values summed per segment cell
+MEASURES = (['Total_MRR', 'CLV'] + CANCELLATION_COLUMNS + NEW_SUBSCRIBER_COLUMNS +
+            ['One_Time_Fees', 'Discounts_Given', 'Upsell_Completed', 'New_Customers',
+             'Additional_Features_Purchased'])
+
+# Bytes of CSV parsed by one task; bounds the memory each worker needs
+DEFAULT_PARTITION_BYTES = 64 * 1024 ** 2
+
+
+def cube_shape():
+    # One extra category per dimension collects rows with a missing or unknown value
+    return tuple(len(CATEGORICAL_COLUMNS[dimension]) + 1 for dimension in DIMENSIONS)
+
+
+def category_labels(dimension):
+    return CATEGORICAL_COLUMNS[dimension] + ['Unknown']
+
+
+# Reduce a frame to mergeable partial aggregates: the row count and the sum of every measure in each
+# segment cell, shape cube_shape(). Cells are addressed by the flattened categorical codes.
+def aggregate_frame(frame):
+    shape = cube_shape()
+    compute(frame, ['Total_MRR', 'CLV'])
+    cell = np.zeros(len(frame), dtype=np.int64)
+    for dimension, size in zip(DIMENSIONS, shape):
+        codes = pd.Categorical(frame[dimension], categories=CATEGORICAL_COLUMNS[dimension]).codes
+        cell = cell * size + np.where(codes < 0, size - 1, codes)
+
+    n_cells = int(np.prod(shape))
+    partial = {'rows': np.bincount(cell, minlength=n_cells).reshape(shape)}
+    for measure in MEASURES:
+        weights = np.nan_to_num(frame[measure].to_numpy(dtype=np.float64))
+        partial[measure] = np.bincount(cell, weights=weights, minlength=n_cells).reshape(shape)
+    return partial
+
+
+def merge_partials(total, partial):
+    if total is None:
+        return partial
+    return {key: total[key] + value for key, value in partial.items()}
+
+
+# Split a CSV file into byte ranges of about partition_bytes, each starting at a line boundary
+def csv_partitions(path, partition_bytes=DEFAULT_PARTITION_BYTES):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline()
+        offsets = [f.tell()]
+        while offsets[-1] + partition_bytes < size:
+            f.seek(offsets[-1] + partition_bytes)
+            f.readline()
+            if f.tell() >= size:
+                break
+            offsets.append(f.tell())
+    offsets.append(size)
+    return [('csv', path, start, end) for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def list_partitions(path, partition_bytes=DEFAULT_PARTITION_BYTES):
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '*.parquet'))) or sorted(glob.glob(os.path.join(path, '*.csv')))
+    else:
+        files = sorted(glob.glob(path))
+    partitions = []
+    for f in files:
+        if f.endswith('.parquet'):
+            partitions.append(('parquet', f, None, None))
+        else:
+            partitions.extend(csv_partitions(f, partition_bytes))
+    return partitions
+
+
+def _read_partition(partition):
+    kind, path, start, end = partition
+    columns = DIMENSIONS + required_columns(MEASURES)
+    if kind == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+
+    with open(path, 'rb') as f:
+        header = f.readline().decode().strip().split(',')
+        f.seek(start)
+        data = f.read(end - start)
+    dtypes = {column: 'category' if column in DIMENSIONS else np.float64 for column in columns}
+    return pd.read_csv(io.BytesIO(data), names=header, header=None, usecols=columns, dtype=dtypes)
+
+
+def aggregate_partition(partition):
+    return aggregate_frame(_read_partition(partition))
+
+
+# Aggregate a dataset partition by partition across worker processes. Only the small per-partition
+# cubes are kept, so the dataset never has to fit in memory.
+def aggregate_dataset(path, partition_bytes=DEFAULT_PARTITION_BYTES, workers=None):
+    partitions = list_partitions(path, partition_bytes)
+    total = None
+    if workers == 1 or len(partitions) <= 1:
+        for partition in partitions:
+            total = merge_partials(total, aggregate_partition(partition))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(aggregate_partition, partitions):
+                total = merge_partials(total, partial)
+    return total
+
+
+# Segment metrics for the requested dimensions, summing the cube over the others
+#   Churn_Rate - cancellations over new subscribers, as in the insights script
+#   CLV - average row-level customer lifetime value
+#   Discount_Leakage - discounts given as a share of gross revenue (MRR plus one-time fees)
+#   Upsell_Rate - completed upsells per new customer
+def segment_report(cube, by=('Region',)):
+    by = list(by)
+    axes = tuple(i for i, dimension in enumerate(DIMENSIONS) if dimension not in by)
+    sums = {key: values.sum(axis=axes).ravel() for key, values in cube.items()}
+    index = pd.MultiIndex.from_product([category_labels(dimension) for dimension in DIMENSIONS if dimension in by],
+                                       names=[dimension for dimension in DIMENSIONS if dimension in by])
+
+    rows = sums['rows']
+    cancellations = sum(sums[column] for column in CANCELLATION_COLUMNS)
+    new_subscribers = sum(sums[column] for column in NEW_SUBSCRIBER_COLUMNS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        report = pd.DataFrame({
+            'Rows': rows,
+            'Total_MRR': sums['Total_MRR'],
+            'Average_MRR': sums['Total_MRR'] / rows,
+            'Churn_Rate': cancellations / new_subscribers,
+            'CLV': sums['CLV'] / rows,
+            'Discount_Leakage': sums['Discounts_Given'] / (sums['Total_MRR'] + sums['One_Time_Fees']),
+            'Upsell_Rate': sums['Upsell_Completed'] / sums['New_Customers'],
+            'Features_Per_Row': sums['Additional_Features_Purchased'] / rows,
+        }, index=index)
+    report = report[report['Rows'] > 0]
+    return report.reorder_levels(by) if len(by) > 1 else report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Segment breakdowns computed out of core.')
+    parser.add_argument('--data', default='saas_dataset.csv', help='CSV file, glob or partition directory')
+    parser.add_argument('--by', nargs='+', choices=DIMENSIONS, action='append',
+                        help='dimensions of one breakdown; repeat for several (default: each dimension)')
+    parser.add_argument('--partition-mb', type=int, default=DEFAULT_PARTITION_BYTES // 1024 ** 2)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='segment_analytics.csv')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    cube = aggregate_dataset(args.data, args.partition_mb * 1024 ** 2, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Aggregated {int(cube['rows'].sum())} rows in {elapsed:.2f}s.")
+
+    reports = []
+    for by in args.by or [[dimension] for dimension in DIMENSIONS]:
+        report = segment_report(cube, by)
+        print(f"\nSegments by {', '.join(by)}:\n{report.to_string()}")
+        reports.append(report.reset_index().assign(Breakdown='/'.join(by)))
+    pd.concat(reports, ignore_index=True).to_csv(args.output, index=False)
+    print(f"Segment analytics saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
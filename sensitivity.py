@@ -0,0 +1,136 @@
+import argparse
+import time
+
+import numpy as np
+
+import profiling
+from metrics import compute
+from metrics_store import load_metrics_store
+
+# Memory budget for one chunk of the scenario tensor
+DEFAULT_CHUNK_BYTES = 256 * 1024 ** 2
+
+
+# Latest month's MRR and costs, the starting point of every scenario. The data is one row per month,
+# such as the metrics store's monthly_totals() of a dataset with tenants.
+def baseline_from_data(saas_data):
+    compute(saas_data, ['Total_MRR'])
+    return {
+        'current_mrr': float(saas_data['Total_MRR'].iloc[-1]),
+        'marketing_spend': float(saas_data['Marketing_Spend'].iloc[-1]),
+        'fixed_costs': float(saas_data['Fixed_Costs'].iloc[-1]),
+        'variable_costs': float(saas_data['Variable_Costs'].iloc[-1]),
+    }
+
+
+# Monthly cost of every (marketing, fixed, variable) multiplier combination, shape (M, F, V)
+def scenario_costs(baseline, marketing_multipliers, fixed_multipliers, variable_multipliers):
+    marketing = np.asarray(marketing_multipliers, dtype=float)[:, None, None] * baseline['marketing_spend']
+    fixed = np.asarray(fixed_multipliers, dtype=float)[None, :, None] * baseline['fixed_costs']
+    variable = np.asarray(variable_multipliers, dtype=float)[None, None, :] * baseline['variable_costs']
+    return marketing + fixed + variable
+
+
+def _churn_chunks(n_churn, per_churn_bytes, chunk_bytes):
+    step = n_churn if chunk_bytes is None else max(1, int(chunk_bytes // max(per_churn_bytes, 1)))
+    for start in range(0, n_churn, step):
+        yield slice(start, min(start + step, n_churn))
+
+
+# Monthly profit for every scenario, yielded in chunks along the churn axis. Each chunk has shape
+# (churn, marketing, fixed, variable, month); MRR decays geometrically: MRR_t = MRR_0 * (1 - churn)^t.
+def iter_profit_paths(baseline, churn_rates, marketing_multipliers, fixed_multipliers=(1.0,),
+                      variable_multipliers=(1.0,), horizon=12, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    churn_rates = np.asarray(churn_rates, dtype=float)
+    costs = scenario_costs(baseline, marketing_multipliers, fixed_multipliers, variable_multipliers)
+    months = np.arange(1, horizon + 1)
+    for churn in _churn_chunks(len(churn_rates), costs.size * horizon * 8, chunk_bytes):
+        mrr = baseline['current_mrr'] * (1 - churn_rates[churn, None]) ** months
+        yield churn, mrr[:, None, None, None, :] - costs[None, ..., None]
+
+
+def profit_paths(baseline, churn_rates, marketing_multipliers, fixed_multipliers=(1.0,),
+                 variable_multipliers=(1.0,), horizon=12):
+    with profiling.stage('sensitivity'):
+        return np.concatenate([paths for _, paths in iter_profit_paths(
+            baseline, churn_rates, marketing_multipliers, fixed_multipliers, variable_multipliers, horizon,
+            chunk_bytes=None)])
+
+
+# Cumulative profit and break-even month for every scenario, shape (churn, marketing, fixed, variable),
+# computed in closed form without materialising the monthly paths.
+#   cumulative_profit - total profit over the horizon
+#   break_even_month - last month whose profit is still non-negative; 0 if the first month already
+#                      makes a loss, `horizon` if the scenario stays profitable throughout
+def scenario_grid(baseline, churn_rates, marketing_multipliers, fixed_multipliers=(1.0,),
+                  variable_multipliers=(1.0,), horizon=12, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    churn_rates = np.asarray(churn_rates, dtype=float)
+    costs = scenario_costs(baseline, marketing_multipliers, fixed_multipliers, variable_multipliers)
+    current_mrr = baseline['current_mrr']
+    shape = (len(churn_rates),) + costs.shape
+    cumulative_profit = np.empty(shape)
+    break_even_month = np.empty(shape, dtype=np.int16)
+
+    # Several temporaries of the chunk's size are alive at once
+    for churn in _churn_chunks(len(churn_rates), costs.size * 8 * 4, chunk_bytes):
+        retention = (1 - churn_rates[churn])[:, None, None, None]
+
+        # Sum of MRR_0 * r^t for t = 1..horizon
+        with np.errstate(divide='ignore', invalid='ignore'):
+            revenue = np.where(retention == 1, horizon,
+                               retention * (1 - retention ** horizon) / (1 - retention)) * current_mrr
+        cumulative_profit[churn] = revenue - horizon * costs
+
+        # Profit in month t is non-negative while r^t >= costs / MRR_0
+        cost_ratio = np.broadcast_to(costs / current_mrr, (len(retention),) + costs.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            months = np.floor(np.log(cost_ratio) / np.log(retention))
+        months = np.where(retention == 1, np.where(cost_ratio <= 1, horizon, 0), months)
+        months = np.where(cost_ratio <= 0, horizon, np.where(cost_ratio > 1, 0, months))
+        break_even_month[churn] = np.clip(np.nan_to_num(months), 0, horizon)
+
+    return {'cumulative_profit': cumulative_profit, 'break_even_month': break_even_month}
+
+
+def linspace_arg(values):
+    start, stop, num = values
+    return np.linspace(float(start), float(stop), int(num))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Profit sensitivity over a grid of churn and cost scenarios.')
+    parser.add_argument('--data', default='saas_dataset.csv')
+    parser.add_argument('--churn', nargs=3, default=['0.01', '0.10', '1000'], metavar=('START', 'STOP', 'NUM'))
+    parser.add_argument('--marketing', nargs=3, default=['0.5', '1.5', '1000'], metavar=('START', 'STOP', 'NUM'))
+    parser.add_argument('--fixed', nargs=3, default=['1.0', '1.0', '1'], metavar=('START', 'STOP', 'NUM'))
+    parser.add_argument('--variable', nargs=3, default=['1.0', '1.0', '1'], metavar=('START', 'STOP', 'NUM'))
+    parser.add_argument('--horizon', type=int, default=36)
+    parser.add_argument('--output', default='sensitivity_grid.npz')
+    parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip the data quality checks')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The company's latest month: summed over the tenants, if there are any
+    baseline = baseline_from_data(load_metrics_store(args.data, args.validate).monthly_totals())
+    axes = {
+        'churn_rates': linspace_arg(args.churn),
+        'marketing_multipliers': linspace_arg(args.marketing),
+        'fixed_multipliers': linspace_arg(args.fixed),
+        'variable_multipliers': linspace_arg(args.variable),
+    }
+
+    start = time.perf_counter()
+    grid = scenario_grid(baseline, horizon=args.horizon, **axes)
+    elapsed = time.perf_counter() - start
+    n_scenarios = grid['cumulative_profit'].size
+    print(f"Evaluated {n_scenarios} scenarios over {args.horizon} months in {elapsed:.2f}s.")
+    print(f"Scenarios profitable over the whole horizon: {(grid['break_even_month'] == args.horizon).mean():.1%}")
+
+    np.savez(args.output, **axes, **grid)
+    print(f"Sensitivity grid saved as '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import glob
+import hashlib
+import os
+
+import pandas as pd
+import numpy as np
+
+from data_loader import file_fingerprint, load_saas_data
+
+SAMPLE = '''Month,MRR_Basic,MRR_Premium,Churn_Rate_Basic,Region
+31-01-2019,16816,21437,0.035585391,Europe
+28-02-2019,,31004,0.036902514,Asia
+31-03-2019,9046,28850,0.041172101,North America
+'''
+
+
+def test_blank_integer_cell_loads_as_missing(tmp_path):
+    path = tmp_path / 'saas_dataset.csv'
+    path.write_text(SAMPLE)
+    for use_cache in (False, True, True):
+        saas_data = load_saas_data(str(path), cache_dir=str(tmp_path / '.cache'), use_cache=use_cache)
+        assert saas_data['MRR_Basic'].isna().tolist() == [False, True, False]
+        assert saas_data['MRR_Premium'].dtype == np.int32
+        assert saas_data['Churn_Rate_Basic'].dtype == np.float32
+        assert isinstance(saas_data['Region'].dtype, pd.CategoricalDtype)
+        assert saas_data['Month'].iloc[1] == pd.Timestamp('2019-02-28')
+
+
+def test_same_named_files_keep_their_caches(tmp_path):
+    cache_dir = str(tmp_path / '.cache')
+    paths = []
+    for name, region in [('a', 'Europe'), ('b', 'Asia')]:
+        (tmp_path / name).mkdir()
+        paths.append(tmp_path / name / 'saas_dataset.csv')
+        paths[-1].write_text(SAMPLE.replace('Europe', region))
+        load_saas_data(str(paths[-1]), cache_dir=cache_dir)
+    assert len(glob.glob(os.path.join(cache_dir, '*.arrow'))) == 2
+    assert load_saas_data(str(paths[0]), cache_dir=cache_dir)['Region'].iloc[0] == 'Europe'
+    assert load_saas_data(str(paths[1]), cache_dir=cache_dir)['Region'].iloc[0] == 'Asia'
+
+
+def test_fingerprint_hashes_only_changed_files(tmp_path, monkeypatch):
+    path = tmp_path / 'saas_dataset.csv'
+    path.write_text(SAMPLE)
+    index_path = str(tmp_path / 'index.json')
+    fingerprint = file_fingerprint(str(path), index_path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('the file was hashed again')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(hashlib, 'blake2b', fail)
+        assert file_fingerprint(str(path), index_path) == fingerprint
+    path.write_text(SAMPLE.replace('Europe', 'Asia'))
+    assert file_fingerprint(str(path), index_path) != fingerprint
+
+
+def test_unknown_categories_are_kept_on_request(tmp_path):
+    path = tmp_path / 'saas_dataset.csv'
+    path.write_text(SAMPLE.replace('Asia', 'Mars'))
+    for use_cache in (False, True, True):
+        kwargs = dict(cache_dir=str(tmp_path / '.cache'), use_cache=use_cache)
+        assert load_saas_data(str(path), **kwargs)['Region'].isna().tolist() == [False, True, False]
+        assert load_saas_data(str(path), known_categories=False, **kwargs)['Region'].iloc[1] == 'Mars'
@@ -0,0 +1,131 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from Dataset_Generation import CSV_DATE_FORMAT, generate_chunk
+from data_quality import CHECKS, fill_months, quarantine, scan
+
+
+def clean_data(n_tenants=1, seed=0):
+    return generate_chunk(1, n_tenants, 60, np.random.SeedSequence(seed), include_tenant=n_tenants > 1)
+
+
+def with_strings(frame, column):
+    frame[column] = frame[column].astype(object)
+    return frame
+
+
+def set_value(column, row, value):
+    def inject(frame):
+        if isinstance(value, str) or isinstance(frame[column].dtype, pd.CategoricalDtype):
+            with_strings(frame, column)
+        elif isinstance(value, float) and not pd.api.types.is_float_dtype(frame[column].dtype):
+            frame[column] = frame[column].astype(float)
+        frame.loc[row, column] = value
+        return frame
+    return inject
+
+
+def month_strings(frame):
+    frame['Month'] = frame['Month'].dt.strftime(CSV_DATE_FORMAT)
+    return frame
+
+
+def spike(column, row, factor):
+    def inject(frame):
+        frame[column] = frame[column].astype(float)
+        frame.loc[row, column] *= factor
+        return frame
+    return inject
+
+
+def moderate_outlier(frame):
+    # About seven robust standard deviations above the median: an outlier, but not an error
+    values = frame['Marketing_Spend'].astype(float)
+    median = values.median()
+    frame['Marketing_Spend'] = values
+    frame.loc[30, 'Marketing_Spend'] = np.round(median + 7 * 1.4826 * (values - median).abs().median())
+    return frame
+
+
+# Check -> (column it flags, function planting the defect in a clean single-series frame)
+DEFECTS = {
+    'missing_column': ('Upsell_Rate', lambda frame: frame.drop(columns='Upsell_Rate')),
+    'unexpected_column': ('Extra', lambda frame: frame.assign(Extra=1)),
+    'missing_month': ('Month', lambda frame: month_strings(frame).assign(
+        Month=frame['Month'].mask(frame.index == 10))),
+    'missing': ('MRR_Basic', set_value('MRR_Basic', 5, np.nan)),
+    'malformed': ('Fixed_Costs', set_value('Fixed_Costs', 5, '12,000')),
+    'not_integer': ('New_Customers', set_value('New_Customers', 5, 10.5)),
+    'unknown_category': ('Region', set_value('Region', 5, 'Mars')),
+    'bad_month': ('Month', lambda frame: month_strings(frame).assign(
+        Month=frame['Month'].mask(frame.index == 10, '31-02-2020'))),
+    'out_of_range': ('Churn_Rate_Basic', set_value('Churn_Rate_Basic', 5, 1.5)),
+    'duplicate_month': ('Month', lambda frame: frame.assign(
+        Month=frame['Month'].mask(frame.index == 11, frame['Month'].iloc[10]))),
+    'month_gap': ('Month', lambda frame: frame.drop(index=20).reset_index(drop=True)),
+    'not_month_end': ('Month', lambda frame: frame.assign(
+        Month=frame['Month'].mask(frame.index == 10, frame['Month'].iloc[10] - pd.Timedelta(days=3)))),
+    'zero_denominator': ('New_Customers', set_value('New_Customers', 5, 0)),
+    'robust_z': ('Marketing_Spend', moderate_outlier),
+    'rolling_mad': ('MRR_Enterprise', spike('MRR_Enterprise', 40, 100)),
+    'extreme_z': ('MRR_Enterprise', spike('MRR_Enterprise', 40, 100)),
+}
+
+
+def flagged(issues):
+    return set(zip(issues['check'], issues['column']))
+
+
+def test_clean_data_has_no_errors():
+    issues, partitions, row_errors, bad_values = scan(clean_data(), workers=1)
+    assert (issues['severity'] != 'error').all()
+    assert not partitions['quarantined'].any()
+    assert not row_errors.any() and bad_values.empty
+
+
+def test_every_check_is_tested():
+    assert set(DEFECTS) == set(CHECKS)
+
+
+@pytest.mark.parametrize('check', list(DEFECTS))
+def test_check_flags_its_defect(check):
+    column, inject = DEFECTS[check]
+    issues, partitions, row_errors, _ = scan(inject(clean_data()), workers=1)
+    assert (check, column) in flagged(issues)
+    if CHECKS[check] == 'error':
+        assert partitions['quarantined'].all()
+
+
+def test_moderate_outlier_is_not_an_error():
+    issues, partitions, _, _ = scan(moderate_outlier(clean_data()), workers=1)
+    assert ('extreme_z', 'Marketing_Spend') not in flagged(issues)
+    assert not partitions['quarantined'].any()
+
+
+def test_bad_values_are_missing_at_the_structure_level():
+    saas_data = set_value('Churn_Rate_Basic', 5, 1.5)(clean_data())
+    saas_data = set_value('Fixed_Costs', 7, -100)(saas_data)
+    issues, partitions, row_errors, bad_values = scan(saas_data, workers=1)
+
+    kept, quarantined = quarantine(saas_data, partitions, row_errors, bad_values, level='structure')
+    assert len(kept) == len(saas_data) and quarantined.empty
+    assert kept['Churn_Rate_Basic'].isna().tolist() == (kept.index == 5).tolist()
+    assert kept['Fixed_Costs'].isna().tolist() == (kept.index == 7).tolist()
+
+    passed, quarantined = quarantine(saas_data, partitions, row_errors, bad_values, level='errors')
+    assert len(passed) == len(saas_data) - 2 and len(quarantined) == 2
+    filled = fill_months(passed)
+    assert len(filled) == len(saas_data) and not filled[['Churn_Rate_Basic', 'Fixed_Costs']].isna().any().any()
+
+
+def test_only_the_tenants_with_errors_are_quarantined():
+    saas_data = clean_data(n_tenants=5)
+    saas_data = set_value('MRR_Basic', saas_data.index[saas_data['Tenant_ID'] == 2][3], -1)(saas_data)
+    saas_data = spike('MRR_Premium', saas_data.index[saas_data['Tenant_ID'] == 4][30], 100)(saas_data)
+    issues, partitions, row_errors, bad_values = scan(saas_data, workers=1)
+
+    assert partitions.loc[partitions['quarantined'], 'partition'].tolist() == ['2', '4']
+    passed, quarantined = quarantine(saas_data, partitions, row_errors, bad_values)
+    assert sorted(passed['Tenant_ID'].unique()) == [1, 3, 5]
+    assert sorted(quarantined['Tenant_ID'].unique()) == [2, 4]
@@ -0,0 +1,73 @@
+import pandas as pd
+import numpy as np
+
+from metrics_store import MetricsStore
+
+MONTHS = pd.date_range('2020-01-31', periods=4, freq='ME')
+
+
+def tenant_frame(tenant_ids, months=MONTHS):
+    rows = [(tenant, month) for tenant in tenant_ids for month in months]
+    frame = pd.DataFrame(rows, columns=['Tenant_ID', 'Month'])
+    frame['MRR_Basic'] = np.arange(len(frame), dtype=np.int32) * 100
+    frame['Churn_Rate_Basic'] = np.linspace(0.01, 0.05, len(frame)).astype(np.float32)
+    frame['Region'] = pd.Categorical(['Europe', 'Asia'] * (len(frame) // 2), categories=['Asia', 'Europe'])
+    return frame
+
+
+def test_columns_read_back_in_row_order():
+    frame = tenant_frame([7, 3])
+    store = MetricsStore.from_frame(frame)
+    expected = frame.sort_values(['Tenant_ID', 'Month'], kind='stable')
+    assert len(store) == len(frame)
+    assert store['MRR_Basic'].tolist() == expected['MRR_Basic'].tolist()
+    assert store['Region'].tolist() == expected['Region'].tolist()
+    assert store['Month'].tolist() == expected['Month'].tolist()
+
+
+def test_tenant_and_date_slices_view_the_arrays():
+    frame = tenant_frame([1, 2, 3])
+    store = MetricsStore.from_frame(frame)
+
+    tenant = store.tenant(2)
+    assert np.shares_memory(tenant.panel('MRR_Basic'), store.panel('MRR_Basic'))
+    assert tenant['MRR_Basic'].tolist() == frame.loc[frame['Tenant_ID'] == 2, 'MRR_Basic'].tolist()
+    assert tenant.index.equals(pd.DatetimeIndex(MONTHS, name='Month'))
+
+    window = store.between('2020-02-01', '2020-03-31')
+    assert list(window.months) == list(MONTHS[1:3])
+    assert np.shares_memory(window.panel('MRR_Basic'), store.panel('MRR_Basic'))
+    in_window = frame[frame['Month'].between('2020-02-01', '2020-03-31')]
+    assert window['MRR_Basic'].tolist() == in_window['MRR_Basic'].tolist()
+
+
+def test_monthly_totals_sum_amounts_and_average_rates():
+    frame = tenant_frame([1, 2, 3])
+    totals = MetricsStore.from_frame(frame).monthly_totals()
+    by_month = frame.groupby('Month')
+    assert totals['MRR_Basic'].tolist() == by_month['MRR_Basic'].sum().tolist()
+    np.testing.assert_allclose(totals['Churn_Rate_Basic'], by_month['Churn_Rate_Basic'].mean(), rtol=1e-6)
+    assert 'Region' not in totals
+
+
+def test_tenants_covering_different_months():
+    frame = tenant_frame([1, 2])
+    # Tenant 2 joined in the third month
+    frame = frame[(frame['Tenant_ID'] == 1) | (frame['Month'] >= MONTHS[2])].reset_index(drop=True)
+    store = MetricsStore.from_frame(frame)
+    assert len(store) == len(frame)
+    assert store['MRR_Basic'].tolist() == frame['MRR_Basic'].tolist()
+    assert store['Month'].tolist() == frame['Month'].tolist()
+    assert store.missing_values().sum() == 0
+
+    late = store.tenant(2)
+    assert list(late.months) == list(MONTHS[2:])
+    assert late['MRR_Basic'].tolist() == frame.loc[frame['Tenant_ID'] == 2, 'MRR_Basic'].tolist()
+
+    totals = store.monthly_totals()
+    by_month = frame.groupby('Month')
+    assert totals['MRR_Basic'].tolist() == by_month['MRR_Basic'].sum().tolist()
+    np.testing.assert_allclose(totals['Churn_Rate_Basic'], by_month['Churn_Rate_Basic'].mean(), rtol=1e-6)
+
+    store['Double_MRR'] = store['MRR_Basic'] * 2
+    assert store['Double_MRR'].tolist() == (frame['MRR_Basic'] * 2).tolist()
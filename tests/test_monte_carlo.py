@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from monte_carlo import PERCENTILES, _histogram, histogram_percentiles, merge_partials, simulate
+
+
+@pytest.mark.parametrize('n_bins', [50, 1000])
+def test_histogram_percentiles_match_numpy_within_a_bin(n_bins):
+    rng = np.random.default_rng(0)
+    # Three months of differently shaped values: normal, skewed and bimodal
+    values = np.column_stack([rng.normal(100, 15, 20_000), rng.lognormal(3, 0.8, 20_000),
+                              np.concatenate([rng.normal(-50, 5, 10_000), rng.normal(50, 5, 10_000)])])
+    edges = np.linspace(values.min(), values.max(), n_bins + 1)
+    width = edges[1] - edges[0]
+
+    bands = histogram_percentiles(_histogram(values, edges), edges, PERCENTILES)
+    # The histogram inverts the empirical distribution function; interpolating between the samples
+    # instead would put the median of the bimodal month in the middle of its gap
+    expected = np.percentile(values, PERCENTILES, axis=0, method='inverted_cdf').T
+    assert bands.shape == expected.shape
+    assert np.abs(bands - expected).max() <= width
+
+
+def test_histograms_of_chunks_merge_to_the_whole():
+    rng = np.random.default_rng(1)
+    values = rng.normal(0, 1, size=(1000, 4))
+    edges = np.linspace(-2, 2, 41)
+    # Values outside the edges land in the under/overflow bins
+    whole = _histogram(values, edges)
+    assert whole.sum() == values.size
+    assert (whole[:, 0] == (values < -2).sum(axis=0)).all()
+    merged = merge_partials(merge_partials(None, {'h': _histogram(values[:300], edges)}),
+                            {'h': _histogram(values[300:], edges)})
+    np.testing.assert_array_equal(merged['h'], whole)
+
+
+def test_simulation_is_seeded_and_independent_of_chunking():
+    mean, variance = np.full(6, 1000.0), np.full(6, 100.0 ** 2)
+    costs = {'Fixed_Costs': [300.0, 320.0], 'Variable_Costs': [200.0, 180.0], 'Marketing_Spend': [100.0, 150.0]}
+    first = simulate(mean, variance, costs, n_paths=20_000, chunk_paths=5_000, workers=1, seed=7, n_bins=400)
+    again = simulate(mean, variance, costs, n_paths=20_000, chunk_paths=5_000, workers=1, seed=7, n_bins=400)
+    assert first.equals(again)
+
+    # Profit is the MRR less fixed and variable costs: a mean of 500 and a median near it
+    np.testing.assert_allclose(first['profit_mean'], 500, atol=5)
+    np.testing.assert_allclose(first['profit_p50'], 500, atol=5)
+    assert (first['profit_p5'] < first['profit_p50']).all() and (first['profit_p50'] < first['profit_p95']).all()
+    assert first['prob_negative_cash_flow'].between(0, 0.01).all()
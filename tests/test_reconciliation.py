@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from reconciliation import METHODS, build_hierarchy, incoherence, node_history, reconcile
+
+
+@pytest.fixture(params=[None, [11, 12]], ids=['segments', 'tenants'])
+def hierarchy(request):
+    return build_hierarchy(request.param)
+
+
+def incoherent_forecasts(hierarchy, horizon=6, seed=0):
+    rng = np.random.default_rng(seed)
+    bottom = rng.uniform(100, 1000, size=(hierarchy['n_bottom'], 24))
+    base = node_history(hierarchy, bottom[:, -horizon:]) * rng.uniform(0.8, 1.2, size=(len(hierarchy['nodes']), 1))
+    variance = rng.uniform(1, 100, size=len(hierarchy['nodes']))
+    return base, variance, bottom
+
+
+def test_summing_matrix_adds_every_bottom_series_once_per_level(hierarchy):
+    nodes = hierarchy['nodes']
+    assert hierarchy['S'].shape == (len(nodes), hierarchy['n_bottom'])
+    assert hierarchy['n_aggregate'] + hierarchy['n_bottom'] == len(nodes)
+    # The first node is the total
+    assert (nodes.iloc[0, 1:] == '*').all()
+    assert hierarchy['S'][0].sum() == hierarchy['n_bottom']
+    n_levels = 2 ** (len(nodes.columns) - 1)
+    np.testing.assert_array_equal(np.asarray(hierarchy['S'].sum(axis=0)).ravel(), n_levels)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_reconciled_forecasts_are_coherent(hierarchy, method):
+    base, variance, bottom = incoherent_forecasts(hierarchy)
+    assert incoherence(hierarchy, base) > 1
+    reconciled = reconcile(hierarchy, base, method, variance, bottom)
+
+    assert reconciled.shape == base.shape
+    assert incoherence(hierarchy, reconciled) < 1e-6 * np.abs(reconciled).max()
+    n_aggregate = hierarchy['n_aggregate']
+    np.testing.assert_allclose(reconciled[0], reconciled[n_aggregate:].sum(axis=0), rtol=1e-9)
+
+
+def test_bottom_up_keeps_the_bottom_forecasts(hierarchy):
+    base, variance, bottom = incoherent_forecasts(hierarchy)
+    reconciled = reconcile(hierarchy, base, 'bottom_up')
+    n_aggregate = hierarchy['n_aggregate']
+    np.testing.assert_allclose(reconciled[n_aggregate:], base[n_aggregate:])
+
+
+def test_top_down_keeps_the_total_forecast(hierarchy):
+    base, variance, bottom = incoherent_forecasts(hierarchy)
+    reconciled = reconcile(hierarchy, base, 'top_down', history=bottom)
+    np.testing.assert_allclose(reconciled[0], base[0])
+
+
+@pytest.mark.parametrize('method', ['ols', 'structural', 'mint'])
+def test_coherent_forecasts_are_left_unchanged(hierarchy, method):
+    rng = np.random.default_rng(1)
+    coherent = node_history(hierarchy, rng.uniform(100, 1000, size=(hierarchy['n_bottom'], 6)))
+    variance = rng.uniform(1, 100, size=len(hierarchy['nodes']))
+    np.testing.assert_allclose(reconcile(hierarchy, coherent, method, variance), coherent, rtol=1e-9)
@@ -0,0 +1,42 @@
+import pandas as pd
+import numpy as np
+import pytest
+
+from sensitivity import baseline_from_data, profit_paths, scenario_grid
+
+BASELINE = {'current_mrr': 150_000.0, 'marketing_spend': 13_000.0, 'fixed_costs': 16_000.0,
+            'variable_costs': 20_000.0}
+AXES = {
+    # Zero churn keeps the MRR flat, the closed form's special case
+    'churn_rates': np.array([0.0, 0.01, 0.035, 0.07, 0.1, 0.25]),
+    'marketing_multipliers': np.linspace(0.5, 10.0, 7),
+    'fixed_multipliers': np.array([0.9, 1.0, 1.5]),
+    'variable_multipliers': np.array([0.8, 1.0, 2.0]),
+}
+
+
+@pytest.mark.parametrize('chunk_bytes', [None, 4096])
+@pytest.mark.parametrize('horizon', [1, 12, 36])
+def test_grid_matches_the_monthly_paths(horizon, chunk_bytes):
+    grid = scenario_grid(BASELINE, horizon=horizon, chunk_bytes=chunk_bytes, **AXES)
+    paths = profit_paths(BASELINE, horizon=horizon, **AXES)
+    assert paths.shape == tuple(len(axis) for axis in AXES.values()) + (horizon,)
+
+    np.testing.assert_allclose(grid['cumulative_profit'], paths.sum(axis=-1), rtol=1e-9)
+    # Profit only falls over time, so the break-even month counts the months with a non-negative profit
+    np.testing.assert_array_equal(grid['break_even_month'], (paths >= 0).sum(axis=-1))
+
+
+def test_grid_covers_profitable_losing_and_breaking_even_scenarios():
+    grid = scenario_grid(BASELINE, horizon=36, **AXES)
+    months = grid['break_even_month']
+    assert (months == 36).any() and (months == 0).any() and ((months > 0) & (months < 36)).any()
+
+
+def test_baseline_is_the_latest_month():
+    months = pd.date_range('2020-01-31', periods=3, freq='ME')
+    saas_data = pd.DataFrame({'Month': months, 'MRR_Basic': [1, 2, 3], 'MRR_Premium': [10, 20, 30],
+                              'MRR_Enterprise': [100, 200, 300], 'Marketing_Spend': [4, 5, 6],
+                              'Fixed_Costs': [7, 8, 9], 'Variable_Costs': [1, 1, 2]})
+    assert baseline_from_data(saas_data) == {'current_mrr': 333.0, 'marketing_spend': 6.0, 'fixed_costs': 9.0,
+                                             'variable_costs': 2.0}